@@ -0,0 +1,106 @@
+"""
+Benchmark of the event calendar queries.
+
+Fills a scratch SQLite database with synthetic events spread over three
+years (a small share of them long-running) and measures the latency of
+range queries: events of a day, events of a week, upcoming events, and
+events overlapping a moment, in full and as pages of 50. Queries fetch
+event IDs, so that the timings reflect the database rather than
+building model instances. Full results run to thousands of rows at
+a million events, and their timings are dominated by fetching them.
+
+Usage:
+    python -m benchmarks.calendar_bench --events 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+
+def report(name, durations, rows):
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print("{:<28} n={:<5} rows={:<6.0f} mean={:8.2f} ms  p95={:8.2f} ms  max={:8.2f} ms".format(
+        name, len(durations), statistics.mean(rows), statistics.mean(durations), p95, durations[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "calendar_bench.sqlite3"))
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    if os.path.exists(options.database):
+        os.remove(options.database)
+    settings.DATABASES["default"]["NAME"] = options.database
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from firstfloor.models import Event, Profile, EVENT_MAX_SPAN
+
+    call_command("migrate", verbosity=0)
+    host = Profile.objects.create(user=User.objects.create_user("host"), location="Tampere")
+
+    rng = random.Random(options.seed)
+    origin = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    span_minutes = 3 * 365 * 24 * 60
+
+    start = time.perf_counter()
+    batch_size = 10000
+    for offset in range(0, options.events, batch_size):
+        batch = []
+        for _ in range(min(batch_size, options.events - offset)):
+            start_date = origin + timedelta(minutes=rng.randrange(span_minutes))
+            if rng.random() < 0.001:
+                duration = timedelta(days=rng.randrange(8, 120))
+            else:
+                duration = timedelta(minutes=rng.randrange(30, 48 * 60))
+            batch.append(Event(title="Event", description="", host=host, location="Tampere",
+                               start_date=start_date, end_date=start_date + duration,
+                               cancelled=rng.random() < 0.05, private=rng.random() < 0.2,
+                               long_running=duration > EVENT_MAX_SPAN))
+        with transaction.atomic():
+            Event.objects.bulk_create(batch)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    print("Inserted {} events in {:.1f} s".format(options.events, time.perf_counter() - start))
+
+    def measure(name, query):
+        durations = []
+        rows = []
+        for _ in range(options.queries):
+            moment = origin + timedelta(minutes=rng.randrange(span_minutes))
+            start = time.perf_counter()
+            rows.append(len(list(query(moment))))
+            durations.append((time.perf_counter() - start) * 1000)
+        report(name, durations, rows)
+
+    events = Event.objects.all()
+    measure("events of a day", lambda moment: events.between(moment, moment + timedelta(days=1)).values_list("id", flat=True))
+    measure("events of a week", lambda moment: events.between(moment, moment + timedelta(days=7)).values_list("id", flat=True))
+    measure("overlapping a moment", lambda moment: events.between(moment, moment + timedelta(seconds=1)).values_list("id", flat=True))
+    measure("events of a day, first 50",
+            lambda moment: events.between(moment, moment + timedelta(days=1)).values_list("id", flat=True)[:50])
+    measure("upcoming, first 50", lambda moment: events.upcoming(moment).values_list("id", flat=True)[:50])
+    measure("public of a day, first 50",
+            lambda moment: events.public().between(moment, moment + timedelta(days=1)).values_list("id", flat=True)[:50])
+
+
+if __name__ == "__main__":
+    main()
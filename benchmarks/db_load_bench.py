@@ -0,0 +1,206 @@
+"""
+Load benchmark of the database configurations.
+
+Runs worker processes against one database, each making "requests"
+in a loop for a fixed time: reading a friend list or a page of a
+discussion, or writing through the friendship transitions (friend
+request and acceptance, or removal) or by posting a comment. Database
+connections are handled between requests as Django does, so they are
+reopened on every request unless they are persistent. Reports the
+throughput, latencies and failures ('database is locked') of each kind
+of request, under each configuration:
+
+- development: groundfloor.settings, SQLite with its defaults.
+- production: groundfloor.settings_production, tuned SQLite with
+  persistent connections.
+- postgres: groundfloor.settings_production with POSTGRES_DB set.
+  Only run when asked for; the database is flushed, so POSTGRES_DB
+  should name a scratch database. Pointing POSTGRES_HOST and
+  POSTGRES_PORT at PgBouncer, with POSTGRES_POOLER=pgbouncer, measures
+  pooled connections.
+
+Only the SQLite configurations have been measured so far: 8 workers
+for 10 s on one CPU, with 25% writes, gave 127 reads/s and 30 writes/s
+with 132 friendship failures under development, and 229 reads/s and
+77 writes/s without failures under production. PostgreSQL has not
+been measured, with or without PgBouncer; run the postgres
+configuration before relying on it.
+
+Usage:
+    python -m benchmarks.db_load_bench --workers 8 --duration 10
+    POSTGRES_DB=scratch python -m benchmarks.db_load_bench --configurations production postgres
+    POSTGRES_DB=scratch POSTGRES_PORT=6432 POSTGRES_POOLER=pgbouncer python -m benchmarks.db_load_bench --configurations postgres
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+CONFIGURATIONS = {
+    "development": "groundfloor.settings",
+    "production": "groundfloor.settings_production",
+    "postgres": "groundfloor.settings_production",
+}
+
+READS = ("friend_list", "thread_page")
+WRITES = ("friendship", "comment")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configurations", nargs="+", choices=sorted(CONFIGURATIONS),
+                        default=["development", "production"])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per configuration.")
+    parser.add_argument("--writes", type=float, default=0.25, help="Share of requests that write.")
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--discussions", type=int, default=200)
+    parser.add_argument("--comments", type=int, default=50000)
+    options = parser.parse_args()
+
+    # Every configuration is set up in a process of its own, since
+    # Django can only be set up once.
+    context = multiprocessing.get_context("fork")
+    print("{:<12} {:<12} {:>7} {:>8} {:>8} {:>8} {:>7}".format(
+        "", "request", "count", "per s", "p50 ms", "p95 ms", "failed"))
+    for name in options.configurations:
+        process = context.Process(target=run_configuration, args=(name, options))
+        process.start()
+        process.join()
+
+
+def run_configuration(name, options):
+    os.environ["DJANGO_SETTINGS_MODULE"] = CONFIGURATIONS[name]
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark")
+    if name == "postgres":
+        if not os.environ.get("POSTGRES_DB"):
+            print("{:<12} skipped, POSTGRES_DB is not set".format(name))
+            return
+    else:
+        os.environ.pop("POSTGRES_DB", None)
+        database = os.path.join(tempfile.gettempdir(), "db_load_bench_{}.sqlite3".format(name))
+        for path in (database, database + "-wal", database + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        settings.DATABASES["default"]["NAME"] = database
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connections
+
+    call_command("migrate", verbosity=0)
+    if name == "postgres":
+        call_command("flush", interactive=False, verbosity=0)
+    profile_ids, discussion_ids = seed(options)
+
+    # Workers are forked without open connections, so that each opens
+    # its own.
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    start = time.time() + 1.0
+    workers = [context.Process(target=work, args=(index, start, options, profile_ids, discussion_ids, queue))
+               for index in range(options.workers)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    for kind in READS + WRITES:
+        latencies = sorted(latency for result in results for latency in result[kind]["latencies"])
+        failed = sum(result[kind]["failed"] for result in results)
+        if not latencies:
+            print("{:<12} {:<12} {:>7} {:>8} {:>8} {:>8} {:>7}".format(name, kind, 0, "-", "-", "-", failed))
+            continue
+        print("{:<12} {:<12} {:>7} {:>8.1f} {:>8.2f} {:>8.2f} {:>7}".format(
+            name, kind, len(latencies), len(latencies) / options.duration,
+            latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, failed))
+    for label, kinds in (("reads", READS), ("writes", WRITES)):
+        count = sum(len(result[kind]["latencies"]) for result in results for kind in kinds)
+        print("{:<12} {:<12} {:>7} {:>8.1f}".format(name, label, count, count / options.duration))
+
+
+def seed(options):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from firstfloor.counters import reconcile
+    from firstfloor.models import Profile, Discussion, Comment
+
+    with transaction.atomic():
+        User.objects.bulk_create([User(username="load{}".format(index)) for index in range(options.profiles)])
+        users = User.objects.filter(username__startswith="load")
+        Profile.objects.bulk_create([Profile(user=user, location="Tampere") for user in users])
+        profile_ids = list(Profile.objects.values_list("pk", flat=True))
+        Discussion.objects.bulk_create([Discussion(title="Discussion {}".format(index), creator_id=profile_ids[index])
+                                        for index in range(options.discussions)])
+        discussion_ids = list(Discussion.objects.values_list("pk", flat=True))
+        Comment.objects.bulk_create([Comment(commenter_id=profile_ids[index % len(profile_ids)],
+                                             related_discussion_id=discussion_ids[index % len(discussion_ids)],
+                                             contents="Comment {}".format(index))
+                                     for index in range(options.comments)])
+    reconcile()
+    return profile_ids, discussion_ids
+
+
+def work(index, start, options, profile_ids, discussion_ids, queue):
+    from django.db import close_old_connections, OperationalError
+    from firstfloor import friendships
+    from firstfloor.models import Profile, Discussion
+
+    Friendship = Profile.friend_list.through
+    choice = random.Random(index).choice
+    chance = random.Random(-index).random
+
+    def friend_list():
+        profile = Profile.objects.get(pk=choice(profile_ids))
+        list(profile.friend_list.values_list("user__username", flat=True))
+
+    def thread_page():
+        discussion = Discussion.objects.get(pk=choice(discussion_ids))
+        discussion.thread(order="newest", limit=20)
+
+    def friendship():
+        profile = Profile.objects.get(pk=choice(profile_ids))
+        other = Profile.objects.get(pk=choice(profile_ids))
+        if Friendship.objects.filter(from_profile=profile, to_profile=other).exists():
+            friendships.remove_friend(profile, other)
+        else:
+            friendships.send_friend_request(profile, other)
+            friendships.accept_friend_request(other, profile)
+
+    def comment():
+        discussion = Discussion.objects.get(pk=choice(discussion_ids))
+        discussion.post_comment(Profile.objects.get(pk=choice(profile_ids)), "Comment under load")
+
+    requests = {"friend_list": friend_list, "thread_page": thread_page, "friendship": friendship, "comment": comment}
+    results = {kind: {"latencies": [], "failed": 0} for kind in requests}
+
+    time.sleep(max(0.0, start - time.time()))
+    end = start + options.duration
+    while time.time() < end:
+        kind = choice(WRITES if chance() < options.writes else READS)
+        # As around every request (request_started, request_finished).
+        close_old_connections()
+        began = time.perf_counter()
+        try:
+            requests[kind]()
+            results[kind]["latencies"].append(time.perf_counter() - began)
+        except OperationalError:
+            results[kind]["failed"] += 1
+        close_old_connections()
+    queue.put(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark of account deletion.
+
+Fills a scratch SQLite database with two equally heavy Profiles
+(comments, votes, discussions commented on by others, friendships,
+events) and deletes one with User.delete(), in one transaction, and
+the other with a deletion job. Reports the total time, and how long
+the writer lock was held at a time: the whole deletion for the former,
+the longest and 95th percentile transaction for the latter.
+
+Usage:
+    python -m benchmarks.deletion_bench --comments 100000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=100000)
+    parser.add_argument("--friends", type=int, default=2000)
+    parser.add_argument("--budget", type=float, default=0.05, help="ACCOUNT_DELETION_LOCK_BUDGET, in seconds.")
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "deletion_bench.sqlite3"))
+    options = parser.parse_args()
+
+    if os.path.exists(options.database):
+        os.remove(options.database)
+    settings.DATABASES["default"]["NAME"] = options.database
+    settings.ACCOUNT_DELETION_LOCK_BUDGET = options.budget
+    settings.ACCOUNT_DELETION_PAUSE = 0
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import transaction
+    from firstfloor import deletion
+    from firstfloor.counters import reconcile
+    from firstfloor.models import Profile, Discussion, Comment, CommentVote, Event
+
+    call_command("migrate", verbosity=0)
+    Friendship = Profile.friend_list.through
+    others = [Profile.objects.create(user=User.objects.create_user("other{}".format(index)), location="Tampere")
+              for index in range(10)]
+    friends = []
+    for index in range(options.friends):
+        friends.append(Profile(user=User.objects.create_user("friend{}".format(index)), location="Tampere"))
+    Profile.objects.bulk_create(friends)
+    friend_ids = list(Profile.objects.filter(user__username__startswith="friend").values_list("pk", flat=True))
+
+    def heavy_profile(name):
+        profile = Profile.objects.create(user=User.objects.create_user(name), location="Tampere")
+        with transaction.atomic():
+            Friendship.objects.bulk_create([Friendship(from_profile_id=profile.pk, to_profile_id=pk) for pk in friend_ids]
+                                           + [Friendship(from_profile_id=pk, to_profile_id=profile.pk) for pk in friend_ids])
+            Discussion.objects.bulk_create([Discussion(title="Discussion", creator=profile)
+                                            for _ in range(options.comments // 100)])
+            discussion_ids = list(Discussion.objects.filter(creator=profile).values_list("pk", flat=True))
+            Comment.objects.bulk_create([Comment(commenter=profile if index % 2 else others[index % 10],
+                                                 related_discussion_id=discussion_ids[index % len(discussion_ids)],
+                                                 contents="Comment {}".format(index))
+                                         for index in range(options.comments)])
+            comment_ids = list(Comment.objects.filter(commenter=profile).values_list("pk", flat=True))
+            CommentVote.objects.bulk_create([CommentVote(comment_id=pk, voter=others[pk % 10], approval=True)
+                                             for pk in comment_ids])
+            Event.objects.bulk_create([Event(title="Event", description="", host=profile, location="Tampere")
+                                       for _ in range(options.comments // 100)])
+        reconcile()
+        return Profile.objects.select_related("user").get(pk=profile.pk)
+
+    profile = heavy_profile("collected")
+    start = time.perf_counter()
+    profile.user.delete()
+    duration = time.perf_counter() - start
+    print("{:<24} total {:7.2f} s  lock held {:7.3f} s at once".format("User.delete()", duration, duration))
+
+    profile = heavy_profile("batched")
+    durations = []
+    next_chunk_size = deletion._next_chunk_size
+
+    def recording_next_chunk_size(size, seconds, budget):
+        durations.append(seconds)
+        return next_chunk_size(size, seconds, budget)
+
+    deletion._next_chunk_size = recording_next_chunk_size
+    job = deletion.request_deletion(profile)
+    start = time.perf_counter()
+    deletion.run_deletion(job)
+    duration = time.perf_counter() - start
+    durations.sort()
+    print("{:<24} total {:7.2f} s  lock held {:7.3f} s at most, p95 {:.3f} s, mean {:.3f} s over {} transactions".format(
+        "deletion job", duration, durations[-1], durations[int(len(durations) * 0.95) - 1],
+        statistics.mean(durations), len(durations)))
+
+
+if __name__ == "__main__":
+    main()
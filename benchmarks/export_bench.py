@@ -0,0 +1,77 @@
+"""
+Benchmark of the personal data export.
+
+Fills a scratch SQLite database with one very active Profile (comments,
+votes, discussions, events) and streams its export as NDJSON and as
+a ZIP archive, measuring throughput and the peak of memory allocated
+while streaming (tracemalloc), which should not grow with the history.
+
+Usage:
+    python -m benchmarks.export_bench --comments 500000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=500000)
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "export_bench.sqlite3"))
+    options = parser.parse_args()
+
+    if os.path.exists(options.database):
+        os.remove(options.database)
+    settings.DATABASES["default"]["NAME"] = options.database
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import transaction
+    from firstfloor.export import stream_ndjson, stream_zip
+    from firstfloor.models import Profile, Discussion, Comment, CommentVote, Event
+
+    call_command("migrate", verbosity=0)
+    profile = Profile.objects.create(user=User.objects.create_user("active"), location="Tampere")
+    other = Profile.objects.create(user=User.objects.create_user("other"), location="Tampere")
+
+    with transaction.atomic():
+        Discussion.objects.bulk_create([Discussion(title="Discussion {}".format(index), creator=profile)
+                                        for index in range(options.comments // 100)])
+        discussion = Discussion.objects.earliest("pk")
+        Comment.objects.bulk_create([Comment(commenter=profile, related_discussion=discussion,
+                                             contents="Comment number {} of a very active Profile".format(index))
+                                     for index in range(options.comments)])
+        comment_ids = list(Comment.objects.values_list("pk", flat=True)[:options.comments // 10])
+        CommentVote.objects.bulk_create([CommentVote(comment_id=pk, voter=profile, approval=True) for pk in comment_ids])
+        Event.objects.bulk_create([Event(title="Event", description="", host=profile, location="Tampere")
+                                   for _ in range(options.comments // 100)])
+    profile.friend_list.add(other)
+    profile = Profile.objects.select_related("user").get(pk=profile.pk)
+
+    for name, stream in (("NDJSON", stream_ndjson), ("ZIP", stream_zip)):
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in stream(profile))
+        duration = time.perf_counter() - start
+        # Tracing slows streaming down, so memory is measured separately.
+        tracemalloc.start()
+        for _ in stream(profile):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{:<8} {:8.1f} MB in {:5.1f} s  {:8.1f} MB/s  peak {:6.1f} MB".format(
+            name, size / 2 ** 20, duration, size / 2 ** 20 / duration, peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the friend graph queries.
+
+Generates a random friend graph in memory and measures mutual friend
+counts, friend suggestions and degrees of separation against it, using
+the same algorithms that firstfloor.friendgraph runs on cached arrays.
+
+Usage:
+    python -m benchmarks.friendgraph_bench --profiles 100000 --edges 5000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+
+django.setup()
+
+from firstfloor.friendgraph import degrees_of_separation, intersection_size, suggest_friends
+
+
+def build_graph(profiles, edges, seed):
+    """
+    Generates a random undirected graph with the given number of
+    Profiles and (at most) the given number of friendships.
+    """
+
+    rng = random.Random(seed)
+    neighbours = [array("i") for _ in range(profiles)]
+    for _ in range(edges):
+        first = rng.randrange(profiles)
+        second = rng.randrange(profiles)
+        if first != second:
+            neighbours[first].append(second)
+            neighbours[second].append(first)
+    return {profile_id: array("i", sorted(set(friends))) for profile_id, friends in enumerate(neighbours)}
+
+
+def measure(name, function, arguments):
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print("{:<24} n={:<5} mean={:8.3f} ms  p95={:8.3f} ms  max={:8.3f} ms".format(
+        name, len(durations), statistics.mean(durations), p95, durations[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=100000)
+    parser.add_argument("--edges", type=int, default=5000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    start = time.perf_counter()
+    adjacency = build_graph(options.profiles, options.edges, options.seed)
+    print("Built graph of {} profiles / {} friendships in {:.1f} s".format(
+        options.profiles, sum(len(friends) for friends in adjacency.values()) // 2, time.perf_counter() - start))
+
+    def friends_of_many(profile_ids):
+        return {profile_id: adjacency[profile_id] for profile_id in profile_ids}
+
+    rng = random.Random(options.seed + 1)
+    pairs = [(rng.randrange(options.profiles), rng.randrange(options.profiles)) for _ in range(options.queries)]
+
+    measure("mutual_friend_count", lambda first, second: intersection_size(adjacency[first], adjacency[second]), pairs)
+    measure("suggest_friends", lambda first, _: suggest_friends(friends_of_many, first, 10), pairs)
+    measure("degrees_of_separation", lambda first, second: degrees_of_separation(friends_of_many, first, second), pairs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of the account import.
+
+Writes a CSV file of synthetic accounts with friendships and imports it
+into a scratch SQLite database, with passwords in plain text (hashed in
+a pool of processes) and hashed already. For comparison, a sample of
+accounts is also created one by one, the way new_account does.
+
+Usage:
+    python -m benchmarks.import_bench --accounts 100000
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+
+def write_accounts(path, count, friends, prefix, password_field, password, seed):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["username", password_field, "first_name", "last_name", "location", "friends"])
+        for index in range(count):
+            writer.writerow(["{}{}".format(prefix, index), password, "Aino", "Virtanen", "Tampere",
+                             ";".join("{}{}".format(prefix, rng.randrange(count)) for _ in range(friends))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--friends", type=int, default=5)
+    parser.add_argument("--hashed-accounts", type=int, default=2000,
+                        help="Number of accounts with plain text passwords, hashed during the import.")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--one-by-one", type=int, default=50)
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "import_bench.sqlite3"))
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    if os.path.exists(options.database):
+        os.remove(options.database)
+    settings.DATABASES["default"]["NAME"] = options.database
+    django.setup()
+
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from firstfloor.models import Profile
+    from firstfloor.provisioning import import_accounts, import_friendships, read_accounts
+
+    call_command("migrate", verbosity=0)
+
+    start = time.perf_counter()
+    for index in range(options.one_by_one):
+        user = User.objects.create_user("single{}".format(index), "", "password")
+        Profile.objects.create(user=user, location="Tampere")
+    one_by_one = (time.perf_counter() - start) / options.one_by_one
+    print("{:<32} {:10.1f} accounts/s".format("create_user, one by one", 1 / one_by_one))
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = [
+            ("plain passwords, pool", options.hashed_accounts, "plain", "password", "password"),
+            ("hashed passwords", options.accounts, "hashed", "password_hash", make_password("password")),
+        ]
+        for name, count, prefix, field, password in runs:
+            path = os.path.join(directory, prefix + ".csv")
+            write_accounts(path, count, options.friends, prefix, field, password, options.seed)
+
+            start = time.perf_counter()
+            stats = import_accounts(read_accounts(path), processes=options.processes)
+            duration = time.perf_counter() - start
+            print("{:<32} {:10.1f} accounts/s  ({} accounts in {:.1f} s, {:.0f}x one by one)".format(
+                name, stats["created"] / duration, stats["created"], duration, one_by_one * stats["created"] / duration))
+
+            start = time.perf_counter()
+            stats = import_friendships(read_accounts(path))
+            duration = time.perf_counter() - start
+            print("{:<32} {:10.1f} friendships/s ({} in {:.1f} s)".format(
+                "  friendships", stats["created"] / duration, stats["created"], duration))
+
+        start = time.perf_counter()
+        stats = import_accounts(read_accounts(path))
+        print("{:<32} {:10.1f} accounts/s  (resumed, {} skipped)".format(
+            "hashed passwords, again", stats["read"] / (time.perf_counter() - start), stats["skipped"]))
+
+
+if __name__ == "__main__":
+    main()
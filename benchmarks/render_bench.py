@@ -0,0 +1,124 @@
+"""
+Benchmark of page rendering.
+
+Renders every page that extends root.html with two template setups:
+- before: templates are loaded and compiled on every render, and
+  template fragments are not cached (the development setup),
+- after: compiled templates are kept by the cached loader, and the
+  fragments of root.html are cached (the production setup).
+
+Half of the renders are made for an anonymous visitor and half for a
+logged-in user, as the fragments vary by user.
+
+Usage:
+    python -m benchmarks.render_bench --requests 1000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+PAGES = [
+    "groundfloor/common/index.html",
+    "groundfloor/common/forum.html",
+    "groundfloor/common/about.html",
+    "groundfloor/common/contact.html",
+    "groundfloor/common/help.html",
+    "groundfloor/common/rules.html",
+    "groundfloor/common/guidelines.html",
+    "groundfloor/common/report_abuse.html",
+    "groundfloor/common/privacy_policy.html",
+    "groundfloor/common/feedback.html",
+    "groundfloor/common/customer_support.html",
+    "groundfloor/common/report_bug.html",
+    "groundfloor/common/search.html",
+    "firstfloor/login.html",
+    "firstfloor/new_account.html",
+    "firstfloor/people.html",
+    "firstfloor/groups.html",
+    "firstfloor/events.html",
+    "firstfloor/profile.html",
+]
+
+FRAGMENT_CACHES = {
+    "before": "django.core.cache.backends.dummy.DummyCache",
+    "after": "django.core.cache.backends.locmem.LocMemCache",
+}
+
+
+def make_engine(setup):
+    from django.template.backends.django import DjangoTemplates
+
+    options = dict(settings.TEMPLATES[0]["OPTIONS"])
+    if setup == "before":
+        options["loaders"] = settings.TEMPLATE_LOADERS
+    else:
+        options["loaders"] = [("django.template.loaders.cached.Loader", settings.TEMPLATE_LOADERS)]
+    return DjangoTemplates({
+        "NAME": setup,
+        "DIRS": settings.TEMPLATES[0]["DIRS"],
+        "APP_DIRS": False,
+        "OPTIONS": options,
+    })
+
+
+def render_page(engine, template_name, requests, repeats):
+    durations = []
+    for index in range(repeats):
+        request = requests[index % len(requests)]
+        start = time.perf_counter()
+        engine.get_template(template_name).render({}, request)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="Renders per page and setup.")
+    options = parser.parse_args()
+
+    django.setup()
+
+    from django.contrib.auth.models import AnonymousUser, User
+    from django.test import RequestFactory
+    from django.test.utils import override_settings
+
+    factory = RequestFactory()
+    requests = []
+    for user in (AnonymousUser(), User(username="alice")):
+        request = factory.get("/")
+        request.user = user
+        requests.append(request)
+
+    results = {}
+    for setup, backend in FRAGMENT_CACHES.items():
+        caches = dict(settings.CACHES, template_fragments={"BACKEND": backend, "LOCATION": "render_bench"})
+        with override_settings(CACHES=caches):
+            engine = make_engine(setup)
+            for template_name in PAGES:
+                results[setup, template_name] = render_page(engine, template_name, requests, options.requests)
+
+    print("{:<40} {:>12} {:>12} {:>12} {:>12} {:>8}".format(
+        "page", "before mean", "before p95", "after mean", "after p95", "speedup"))
+    totals = {"before": 0.0, "after": 0.0}
+    for template_name in PAGES:
+        row = []
+        for setup in FRAGMENT_CACHES:
+            durations = sorted(results[setup, template_name])
+            totals[setup] += sum(durations)
+            row.extend([statistics.mean(durations), durations[int(len(durations) * 0.95) - 1]])
+        print("{:<40} {:9.3f} ms {:9.3f} ms {:9.3f} ms {:9.3f} ms {:7.1f}x".format(template_name, *row, row[0] / row[2]))
+    print("{:<40} {:9.1f} ms {:>12} {:9.1f} ms {:>12} {:7.1f}x".format(
+        "total", totals["before"], "", totals["after"], "", totals["before"] / totals["after"]))
+
+
+if __name__ == "__main__":
+    main()
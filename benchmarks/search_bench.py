@@ -0,0 +1,107 @@
+"""
+Benchmark of the full-text search backend.
+
+Fills a scratch SQLite database with synthetic comments (plus a share
+of other kinds of documents) and measures the latency of first pages,
+facet counts, and deeper pages fetched with cursors.
+
+Usage:
+    python -m benchmarks.search_bench --documents 1000000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+from django.conf import settings
+
+
+def make_vocabulary(rng, size):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+
+def report(name, durations):
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print("{:<28} n={:<5} mean={:8.2f} ms  p95={:8.2f} ms  max={:8.2f} ms".format(
+        name, len(durations), statistics.mean(durations), p95, durations[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "search_bench.sqlite3"))
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    settings.DATABASES["default"]["NAME"] = options.database
+    django.setup()
+
+    from django.db import connection, transaction
+    from firstfloor.search import Document, SQLiteSearchBackend
+
+    rng = random.Random(options.seed)
+    vocabulary = make_vocabulary(rng, 20000)
+    # Word frequencies follow Zipf's law, as in natural language.
+    cumulative_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(vocabulary) + 1)))
+    kinds = ["comment"] * 16 + ["discussion", "profile", "group", "event"]
+
+    backend = SQLiteSearchBackend(connection)
+    backend.drop_schema()
+    backend.create_schema()
+
+    start = time.perf_counter()
+    batch_size = 10000
+    for offset in range(0, options.documents, batch_size):
+        batch = []
+        for object_id in range(offset, min(offset + batch_size, options.documents)):
+            title = " ".join(rng.choices(vocabulary, cum_weights=cumulative_weights, k=3))
+            body = " ".join(rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.randint(5, 40)))
+            batch.append(Document(rng.choice(kinds), object_id + 1, title, body))
+        with transaction.atomic():
+            backend.index(batch)
+    print("Indexed {} documents in {:.1f} s".format(options.documents, time.perf_counter() - start))
+
+    # Queries mix frequent and rare words, and one- and two-word queries.
+    queries = []
+    for _ in range(options.queries):
+        words = [vocabulary[min(int(rng.paretovariate(0.6)) * 10, len(vocabulary) - 1)] for _ in range(rng.randint(1, 2))]
+        queries.append(" ".join(word[:rng.randint(3, len(word))] for word in words))
+
+    first_pages = []
+    facets = []
+    next_pages = []
+    for query in queries:
+        begin = time.perf_counter()
+        results, cursor = backend.search(query)
+        first_pages.append((time.perf_counter() - begin) * 1000)
+        begin = time.perf_counter()
+        backend.facets(query)
+        facets.append((time.perf_counter() - begin) * 1000)
+        if cursor:
+            begin = time.perf_counter()
+            backend.search(query, cursor=cursor)
+            next_pages.append((time.perf_counter() - begin) * 1000)
+
+    report("first page", first_pages)
+    report("facets", facets)
+    if next_pages:
+        report("next page (cursor)", next_pages)
+
+
+if __name__ == "__main__":
+    main()
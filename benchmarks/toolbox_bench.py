@@ -0,0 +1,122 @@
+"""
+Benchmark of the toolbox conversions.
+
+Measures the throughput of the conversions of secondfloor.toolbox,
+with the Caesar cipher compared against a port of the character-by-
+character indexOf loop of the browser, the throughput of the
+batch endpoints end to end, and the throughput and peak memory of the
+streaming Base64 conversions.
+
+Usage:
+    python -m benchmarks.toolbox_bench --batch 10000 --stream-mb 256
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groundfloor.settings")
+
+import django
+
+
+def caesar_index_of(text, shift):
+    # Port of caesar.encode of services.js, for comparison.
+    lower = string.ascii_lowercase
+    upper = string.ascii_uppercase
+    characters = []
+    for character in text:
+        if character in lower:
+            characters.append(lower[(lower.index(character) + shift) % 26])
+        elif character in upper:
+            characters.append(upper[(upper.index(character) + shift) % 26])
+        else:
+            characters.append(character)
+    return "".join(characters)
+
+
+def measure(name, function, inputs, unit_size):
+    start = time.perf_counter()
+    for item in inputs:
+        function(item)
+    seconds = time.perf_counter() - start
+    print("{:<36} {:>10.0f} inputs/s {:>10.1f} MB/s".format(
+        name, len(inputs) / seconds, len(inputs) * unit_size / seconds / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=10000, help="Inputs per batch.")
+    parser.add_argument("--stream-mb", type=int, default=64, help="Size of the streamed file in MB.")
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    django.setup()
+
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+    from secondfloor import toolbox
+
+    setup_test_environment()
+
+    rng = random.Random(options.seed)
+    texts = ["".join(rng.choice(string.ascii_letters + " ,.") for _ in range(1000)) for _ in range(options.batch)]
+    numbers = {length: [str(rng.randrange(1, 10)) + "".join(rng.choice(string.digits) for _ in range(length - 1))
+                        for _ in range(options.batch)]
+               for length in (16, 100, 1000)}
+    encodings = [toolbox.base64_encode(text) for text in texts]
+
+    measure("caesar, indexOf loop", lambda text: caesar_index_of(text, 3), texts, 1000)
+    measure("caesar, translation table", lambda text: toolbox.caesar(text, 3), texts, 1000)
+    for length, batch in numbers.items():
+        measure("base 10 -> 16, {} digits".format(length), lambda number: toolbox.convert_base(number, 10, 16), batch, length)
+        measure("base 10 -> 7, {} digits".format(length), lambda number: toolbox.convert_base(number, 10, 7), batch, length)
+    measure("base64 encode", toolbox.base64_encode, texts, 1000)
+    measure("base64 decode", toolbox.base64_decode, encodings, len(encodings[0]))
+
+    # Request bodies are limited by DATA_UPLOAD_MAX_MEMORY_SIZE, so the
+    # endpoints are given shorter texts.
+    short_texts = [text[:200] for text in texts]
+    client = Client()
+    for name, batch in [("secondfloor:caesar", {"inputs": short_texts, "shift": 3}),
+                        ("secondfloor:convert_base", {"inputs": numbers[100], "from_base": 10, "to_base": 36}),
+                        ("secondfloor:base64_encode", {"inputs": short_texts})]:
+        body = json.dumps(batch)
+        start = time.perf_counter()
+        response = client.post(reverse(name), body, content_type="application/json")
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        seconds = time.perf_counter() - start
+        print("{:<36} {:>10.0f} inputs/s {:>10.1f} MB/s out".format(
+            "endpoint " + name.split(":")[1], len(batch["inputs"]) / seconds, size / seconds / 1e6))
+
+    # Streams are read from and written to temporary files, as uploads
+    # of this size would be.
+    with tempfile.TemporaryFile() as source, tempfile.TemporaryFile() as encoded:
+        block = os.urandom(1024 * 1024)
+        for _ in range(options.stream_mb):
+            source.write(block)
+        for name, function, stream, target in [("base64 encode stream", toolbox.base64_encode_stream, source, encoded),
+                                               ("base64 decode stream", toolbox.base64_decode_stream, encoded, None)]:
+            stream.seek(0)
+            tracemalloc.start()
+            start = time.perf_counter()
+            for chunk in function(stream):
+                if target is not None:
+                    target.write(chunk)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("{:<36} {:>10.1f} MB/s {:>10.1f} MB peak".format(
+                name, options.stream_mb / seconds, peak / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,249 @@
 from django.contrib import admin
-from .models import Profile, FriendRequest, Comment, Discussion, DiscussionGroup, Event
-
-admin.site.register(Profile)
-admin.site.register(FriendRequest)
-admin.site.register(Comment)
-admin.site.register(Discussion)
-admin.site.register(DiscussionGroup)
-admin.site.register(Event)
+from django.db.models import Q
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+
+from .models import Profile, ProfileNameKey, FriendRequest, Comment, CommentVote, Discussion, DiscussionGroup, Event, AccountDeletion
+from .people import normalize_name, MAX_CHARACTER
+from .search import get_search_backend, CANDIDATE_LIMIT
+
+# Query string parameter holding the ID of the last row of the previous page.
+AFTER_VAR = "after"
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list that pages through rows newest first by filtering on
+    the ID of the last row of the previous page, instead of counting
+    the rows and skipping them with an offset. Any page costs one
+    indexed range scan, regardless of the size of the table.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        queryset = self.queryset
+        after = request.GET.get(AFTER_VAR)
+        if after:
+            try:
+                queryset = queryset.filter(pk__lt=int(after))
+            except ValueError:
+                raise IncorrectLookupParameters
+
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        self.next_page_url = None
+        if len(rows) > self.list_per_page:
+            self.next_page_url = self.get_query_string({AFTER_VAR: self.result_list[-1].pk})
+        self.first_page_url = self.get_query_string(remove=[AFTER_VAR]) if after else None
+
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+
+
+class KeysetPaginationMixin:
+    """
+    Pages the change list with a KeysetChangeList. Rows are always
+    ordered newest first, so ordering by columns is disabled.
+    """
+
+    ordering = ("-id",)
+    sortable_by = ()
+    show_full_result_count = False
+    change_list_template = "admin/firstfloor/keyset_change_list.html"
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class IndexedSearchMixin:
+    """
+    Answers change list searches from the full-text search index
+    instead of scanning the table with LIKE. Only the newest
+    CANDIDATE_LIMIT matches are considered.
+
+    Objects that are left out of the index (private or cancelled
+    events, discussions and comments of restricted groups) are found
+    with an indexed prefix lookup instead (see prefix_condition), as
+    are all objects when the index finds nothing, so that staff can
+    still find every row.
+    """
+
+    search_kind = None
+
+    def unindexed_condition(self):
+        """
+        Condition of the rows that are left out of the search index.
+        """
+
+        return None
+
+    def prefix_condition(self, search_term):
+        """
+        Condition of the rows whose title starts with the search term
+        (case-sensitively), as a range scan over the index of titles.
+        """
+
+        return Q(title__gte=search_term, title__lt=search_term + MAX_CHARACTER)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        results, _ = get_search_backend().search(search_term, kinds=[self.search_kind], limit=CANDIDATE_LIMIT)
+        prefix = self.prefix_condition(search_term)
+        if not results:
+            return queryset.filter(prefix), False
+        found = Q(pk__in=[result.object_id for result in results])
+        unindexed = self.unindexed_condition()
+        if unindexed is not None:
+            found |= unindexed & prefix
+        return queryset.filter(found), False
+
+
+def restricted_groups(prefix=""):
+    """
+    Condition of the rows whose group (through the given relations)
+    requires an invitation or a passphrase.
+    """
+
+    return Q(**{prefix + "invitation_required": True}) | Q(**{prefix + "passphrase__gt": ""})
+
+
+def profiles_named(search_term):
+    """
+    Getter for the IDs of Profiles whose name starts with the search
+    term, as a range scan over the index of the name keys.
+    """
+
+    prefix = normalize_name(search_term)
+    return (ProfileNameKey.objects
+            .filter(key__gte=prefix, key__lt=prefix + MAX_CHARACTER)
+            .values("profile_id"))
+
+
+@admin.register(Profile)
+class ProfileAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ("id", "username", "location", "private")
+    list_select_related = ("user",)
+    list_filter = ("private",)
+    search_fields = ("user__username",)
+    raw_id_fields = ("user", "friend_list")
+
+    def username(self, profile):
+        return profile.user.username
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=profiles_named(search_term)), False
+
+
+@admin.register(FriendRequest)
+class FriendRequestAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ("id", "sender_username", "receiver_username", "request_date", "status")
+    list_select_related = ("sender__user", "receiver__user")
+    search_fields = ("sender__user__username", "receiver__user__username")
+    raw_id_fields = ("sender", "receiver")
+
+    def sender_username(self, friend_request):
+        return friend_request.sender.user.username
+
+    def receiver_username(self, friend_request):
+        return friend_request.receiver.user.username
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        profiles = profiles_named(search_term)
+        return queryset.filter(sender__in=profiles) | queryset.filter(receiver__in=profiles), False
+
+
+@admin.register(DiscussionGroup)
+class DiscussionGroupAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "title", "creator_username", "creation_date", "invitation_required",
+                    "participant_count", "discussion_count", "comment_count", "last_activity")
+    list_select_related = ("creator__user",)
+    search_fields = ("title", "description")
+    search_kind = "group"
+    show_full_result_count = False
+    raw_id_fields = ("creator", "participants", "invitees")
+
+    def creator_username(self, group):
+        return group.creator.user.username if group.creator else None
+
+
+@admin.register(Discussion)
+class DiscussionAdmin(KeysetPaginationMixin, IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "title", "creator_username", "related_group", "creation_date", "comment_count", "last_activity")
+    list_select_related = ("creator__user", "related_group__creator__user")
+    search_fields = ("title", "description")
+    search_kind = "discussion"
+    raw_id_fields = ("creator", "related_group")
+
+    def unindexed_condition(self):
+        return restricted_groups("related_group__")
+
+    def creator_username(self, discussion):
+        return discussion.creator.user.username
+
+
+@admin.register(Comment)
+class CommentAdmin(KeysetPaginationMixin, IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "commenter_username", "related_discussion_title", "creation_date", "approval")
+    list_select_related = ("commenter__user", "related_discussion")
+    search_fields = ("contents",)
+    search_kind = "comment"
+    raw_id_fields = ("commenter", "related_discussion")
+
+    def unindexed_condition(self):
+        return restricted_groups("related_discussion__related_group__")
+
+    def prefix_condition(self, search_term):
+        # Comments have no title, so they are found by their commenter.
+        return Q(commenter__in=profiles_named(search_term))
+
+    def commenter_username(self, comment):
+        return comment.commenter.user.username if comment.commenter else None
+
+    def related_discussion_title(self, comment):
+        return comment.related_discussion.title if comment.related_discussion else None
+
+
+@admin.register(CommentVote)
+class CommentVoteAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ("id", "comment_id", "voter_id", "approval")
+    raw_id_fields = ("comment", "voter")
+
+
+@admin.register(Event)
+class EventAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "title", "host_username", "location", "start_date", "end_date", "cancelled", "private",
+                    "participant_count")
+    list_select_related = ("host__user",)
+    list_filter = ("cancelled", "private")
+    search_fields = ("title", "description", "location")
+    search_kind = "event"
+    show_full_result_count = False
+    raw_id_fields = ("host", "participants", "invitees")
+
+    def unindexed_condition(self):
+        return Q(private=True) | Q(cancelled=True)
+
+    def host_username(self, event):
+        return event.host.user.username
+
+
+@admin.register(AccountDeletion)
+class AccountDeletionAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ("id", "username", "requested_date", "completed_date", "stage", "deleted_rows", "attempts")
+    search_fields = ("username",)
+    raw_id_fields = ("profile",)
@@ -1,5 +1,14 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class FirstfloorConfig(AppConfig):
     name = 'firstfloor'
+
+    def ready(self):
+        from firstfloor import signals
+        from firstfloor.votebuffer import flush_vote_buffer
+
+        # Buffered votes are written into the database upon shutdown.
+        atexit.register(flush_vote_buffer)
@@ -0,0 +1,403 @@
+"""
+Denormalized counters of discussion groups, discussions and events.
+
+Listing groups and events by popularity would otherwise count the
+participants, discussions and comments of every listed row. Instead,
+the counts are kept in columns of the rows themselves:
+- DiscussionGroup: participant_count, discussion_count, comment_count
+  and last_activity.
+- Discussion: comment_count and last_activity.
+- Event: participant_count and last_activity.
+
+Joining and leaving go through the participant tables directly, and
+adjust the counters with F-expressions in the same transaction, so
+concurrent changes are never lost. The same updates add the weight of
+the activity to the popularity score (see firstfloor.ranking). Comments and discussions adjust
+the counters upon creation, deletion and moves into another discussion
+or group (see firstfloor.signals), and other changes to the
+participants, such as those made in the admin site, recount the
+affected rows.
+
+Comments are uncounted in bulk, never one at a time: Comment.delete and
+deletions of comment querysets uncount the deleted comments, and the
+comments deleted along with a discussion or a Profile are uncounted by
+the deletion of their parent. Comments have no deletion signals, so
+Django deletes them with a few statements instead of one by one.
+
+Bulk changes bypass all of this. Bulk deletions adjust the counters
+with subtract, and the counters can be repaired with reconcile
+(manage.py reconcile_counters). So can the long_running flags of
+events, which are set upon save (see firstfloor.signals), and left
+as they were by update and bulk_create.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Max, OuterRef, PositiveIntegerField, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from firstfloor import ranking
+from firstfloor.models import DiscussionGroup, Discussion, Comment, Event, EVENT_MAX_SPAN
+
+GroupParticipant = DiscussionGroup.participants.through
+EventParticipant = Event.participants.through
+
+# Number of drifted rows written at a time by reconcile.
+REPAIR_BATCH_SIZE = 500
+
+
+def join_group(group, profile):
+    """
+    Adds a Profile to the participants of a discussion group.
+
+    Parameters
+    ----------
+    group : DiscussionGroup
+        The group to join.
+    profile : Profile
+        The joining Profile.
+
+    Returns
+    -------
+    bool
+        True, if the Profile joined. False, if it already was
+        a participant.
+    """
+
+    with transaction.atomic():
+        _, created = GroupParticipant.objects.get_or_create(discussiongroup_id=group.pk, profile_id=profile.pk)
+        if created:
+            now = timezone.now()
+            DiscussionGroup.objects.filter(pk=group.pk).update(
+                participant_count=F("participant_count") + 1, last_activity=now,
+                popularity=F("popularity") + ranking.weight_at(ranking.JOIN_WEIGHT, now))
+    return created
+
+
+def leave_group(group, profile):
+    """
+    Removes a Profile from the participants of a discussion group.
+
+    Parameters
+    ----------
+    group : DiscussionGroup
+        The group to leave.
+    profile : Profile
+        The leaving Profile.
+
+    Returns
+    -------
+    bool
+        True, if the Profile left. False, if it was not a participant.
+    """
+
+    with transaction.atomic():
+        deleted, _ = GroupParticipant.objects.filter(discussiongroup_id=group.pk, profile_id=profile.pk).delete()
+        if deleted:
+            DiscussionGroup.objects.filter(pk=group.pk).update(participant_count=F("participant_count") - deleted)
+    return bool(deleted)
+
+
+def join_event(event, profile):
+    """
+    Adds a Profile to the participants of an event.
+
+    Parameters
+    ----------
+    event : Event
+        The event to join.
+    profile : Profile
+        The joining Profile.
+
+    Returns
+    -------
+    bool
+        True, if the Profile joined. False, if it already was
+        a participant.
+    """
+
+    with transaction.atomic():
+        _, created = EventParticipant.objects.get_or_create(event_id=event.pk, profile_id=profile.pk)
+        if created:
+            now = timezone.now()
+            Event.objects.filter(pk=event.pk).update(
+                participant_count=F("participant_count") + 1, last_activity=now,
+                popularity=F("popularity") + ranking.weight_at(ranking.JOIN_WEIGHT, now))
+    return created
+
+
+def leave_event(event, profile):
+    """
+    Removes a Profile from the participants of an event.
+
+    Parameters
+    ----------
+    event : Event
+        The event to leave.
+    profile : Profile
+        The leaving Profile.
+
+    Returns
+    -------
+    bool
+        True, if the Profile left. False, if it was not a participant.
+    """
+
+    with transaction.atomic():
+        deleted, _ = EventParticipant.objects.filter(event_id=event.pk, profile_id=profile.pk).delete()
+        if deleted:
+            Event.objects.filter(pk=event.pk).update(participant_count=F("participant_count") - deleted)
+    return bool(deleted)
+
+
+def comment_created(comment):
+    """
+    Counts a new comment in its discussion and the group of the
+    discussion, and marks both as active.
+
+    Parameters
+    ----------
+    comment : Comment
+        The comment that was created.
+    """
+
+    if comment.related_discussion_id is None:
+        return
+    with transaction.atomic():
+        Discussion.objects.filter(pk=comment.related_discussion_id).update(
+            comment_count=F("comment_count") + 1, last_activity=comment.creation_date)
+        DiscussionGroup.objects.filter(group_discussions=comment.related_discussion_id).update(
+            comment_count=F("comment_count") + 1, last_activity=comment.creation_date,
+            popularity=F("popularity") + ranking.weight_at(ranking.COMMENT_WEIGHT, comment.creation_date))
+
+
+def comments_deleted(comments):
+    """
+    Uncounts comments that are being deleted from their discussions
+    and the groups of the discussions, with a few UPDATEs regardless
+    of the number of comments.
+
+    Parameters
+    ----------
+    comments : QuerySet
+        The comments that are being deleted.
+    """
+
+    rows = (comments.exclude(related_discussion=None).order_by()
+            .values_list("related_discussion_id", "related_discussion__related_group_id")
+            .annotate(count=Count("*")))
+    discussions = defaultdict(int)
+    groups = defaultdict(int)
+    for discussion_id, group_id, count in rows:
+        discussions[discussion_id] += count
+        groups[group_id] += count
+    with transaction.atomic():
+        subtract(Discussion, "comment_count", discussions)
+        subtract(DiscussionGroup, "comment_count", groups)
+
+
+def comment_moved(comment, previous_discussion_id):
+    """
+    Moves a comment from the counters of its previous discussion and
+    group into those of its current ones.
+
+    Parameters
+    ----------
+    comment : Comment
+        The comment that was moved.
+    previous_discussion_id : int
+        ID of the discussion that the comment was in, or None.
+    """
+
+    with transaction.atomic():
+        if previous_discussion_id is not None:
+            Discussion.objects.filter(pk=previous_discussion_id).update(
+                comment_count=Greatest(F("comment_count") - 1, Value(0)))
+            DiscussionGroup.objects.filter(group_discussions=previous_discussion_id).update(
+                comment_count=Greatest(F("comment_count") - 1, Value(0)))
+        if comment.related_discussion_id is not None:
+            Discussion.objects.filter(pk=comment.related_discussion_id).update(comment_count=F("comment_count") + 1)
+            DiscussionGroup.objects.filter(group_discussions=comment.related_discussion_id).update(
+                comment_count=F("comment_count") + 1)
+
+
+def discussion_created(discussion):
+    """
+    Counts a new discussion in its group, and marks the group as active.
+
+    Parameters
+    ----------
+    discussion : Discussion
+        The discussion that was created.
+    """
+
+    if discussion.related_group_id is not None:
+        DiscussionGroup.objects.filter(pk=discussion.related_group_id).update(
+            discussion_count=F("discussion_count") + 1, last_activity=discussion.creation_date,
+            popularity=F("popularity") + ranking.weight_at(ranking.DISCUSSION_WEIGHT, discussion.creation_date))
+
+
+def discussion_deleted(discussion):
+    """
+    Uncounts a discussion that is being deleted, and the comments that
+    are deleted along with it, from its group.
+
+    Parameters
+    ----------
+    discussion : Discussion
+        The discussion that is being deleted.
+    """
+
+    if discussion.related_group_id is not None:
+        comment_count = Comment.objects.filter(related_discussion=discussion.pk).count()
+        DiscussionGroup.objects.filter(pk=discussion.related_group_id).update(
+            discussion_count=Greatest(F("discussion_count") - 1, Value(0)),
+            comment_count=Greatest(F("comment_count") - comment_count, Value(0)))
+
+
+def discussion_moved(discussion, previous_group_id):
+    """
+    Moves a discussion and its comments from the counters of its
+    previous group into those of its current one.
+
+    Parameters
+    ----------
+    discussion : Discussion
+        The discussion that was moved.
+    previous_group_id : int
+        ID of the group that the discussion was in, or None.
+    """
+
+    comment_count = Comment.objects.filter(related_discussion=discussion.pk).count()
+    with transaction.atomic():
+        if previous_group_id is not None:
+            DiscussionGroup.objects.filter(pk=previous_group_id).update(
+                discussion_count=Greatest(F("discussion_count") - 1, Value(0)),
+                comment_count=Greatest(F("comment_count") - comment_count, Value(0)))
+        if discussion.related_group_id is not None:
+            DiscussionGroup.objects.filter(pk=discussion.related_group_id).update(
+                discussion_count=F("discussion_count") + 1, comment_count=F("comment_count") + comment_count)
+
+
+def recount_participants(model, pks):
+    """
+    Recounts the participants of groups or events. Used when
+    participants have been changed without join and leave.
+
+    Parameters
+    ----------
+    model : DiscussionGroup or Event
+        Model of the rows.
+    pks : iterable of int
+        IDs of the rows to recount. If None, every row is recounted.
+    """
+
+    through = model.participants.through
+    column = "discussiongroup_id" if model is DiscussionGroup else "event_id"
+    rows = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    rows.update(participant_count=_count(through.objects.filter(**{column: OuterRef("pk")}), column))
+
+
+def subtract(model, field, amounts):
+    """
+    Subtracts amounts from a counter of several rows, with one UPDATE
+    per distinct amount. Used when rows are deleted in bulk.
+
+    Parameters
+    ----------
+    model : Model
+        Model of the rows.
+    field : string
+        Name of the counter.
+    amounts : dict
+        Amount to subtract, keyed by row ID.
+    """
+
+    # Counters that cannot be negative stop at zero, so that counters
+    # that have drifted do not make deletions fail.
+    floor = isinstance(model._meta.get_field(field), PositiveIntegerField)
+    rows = defaultdict(list)
+    for pk, amount in amounts.items():
+        if pk is not None and amount:
+            rows[amount].append(pk)
+    for amount, pks in rows.items():
+        value = Greatest(F(field) - amount, Value(0)) if floor else F(field) - amount
+        model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def reconcile():
+    """
+    Recounts every counter from the rows they count, and repairs those
+    that have drifted. Last activity is only moved forward, to the
+    newest comment of the discussion or group. The long_running flags
+    of events are repaired as well.
+
+    Returns
+    -------
+    dict
+        Number of repaired rows, keyed by model name.
+    """
+
+    group_participants = _count(GroupParticipant.objects.filter(discussiongroup_id=OuterRef("pk")), "discussiongroup_id")
+    group_discussions = _count(Discussion.objects.filter(related_group=OuterRef("pk")), "related_group")
+    group_comments = _count(Comment.objects.filter(related_discussion__related_group=OuterRef("pk")),
+                            "related_discussion__related_group")
+    discussion_comments = _count(Comment.objects.filter(related_discussion=OuterRef("pk")), "related_discussion")
+    event_participants = _count(EventParticipant.objects.filter(event_id=OuterRef("pk")), "event_id")
+
+    latest_comment = _latest(Comment.objects.filter(related_discussion=OuterRef("pk")), "related_discussion")
+    latest_group_comment = _latest(Comment.objects.filter(related_discussion__related_group=OuterRef("pk")),
+                                   "related_discussion__related_group")
+
+    repaired = {}
+    with transaction.atomic():
+        repaired["discussiongroup"] = _repair(DiscussionGroup.objects.all(), {
+            "participant_count": group_participants,
+            "discussion_count": group_discussions,
+            "comment_count": group_comments,
+        }, latest_group_comment)
+        repaired["discussion"] = _repair(Discussion.objects.all(), {
+            "comment_count": discussion_comments,
+        }, latest_comment)
+        repaired["event"] = _repair(Event.objects.all(), {
+            "participant_count": event_participants,
+        })
+        long_running = Q(end_date__gt=F("start_date") + EVENT_MAX_SPAN)
+        repaired["event"] += Event.objects.filter(long_running, long_running=False).update(long_running=True)
+        repaired["event"] += Event.objects.filter(~long_running, long_running=True).update(long_running=False)
+    return repaired
+
+
+def _count(rows, group_by):
+    # Correlated subquery counting the rows of each outer row.
+    counts = rows.order_by().values(group_by).annotate(count=Count("*")).values("count")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def _latest(rows, group_by):
+    # Correlated subquery for the creation date of the newest row.
+    return Subquery(rows.order_by().values(group_by).annotate(latest=Max("creation_date")).values("latest"))
+
+
+def _repair(queryset, counters, latest=None):
+    # Rows are compared with their recounted values in the database,
+    # and only the rows that differ are written, in batches.
+    fields = list(counters) + (["last_activity"] if latest is not None else [])
+    queryset = queryset.annotate(**{"actual_" + name: count for name, count in counters.items()})
+    if latest is not None:
+        queryset = queryset.annotate(actual_last_activity=latest)
+
+    drifted = []
+    for row in queryset.values("pk", *fields, *["actual_" + name for name in fields]).iterator():
+        values = {name: row["actual_" + name] for name in counters}
+        if latest is not None:
+            # Activity other than comments is not recorded anywhere else,
+            # so last activity is only ever moved forward.
+            current, actual = row["last_activity"], row["actual_last_activity"]
+            values["last_activity"] = actual if current is None or (actual is not None and actual > current) else current
+        if any(row[name] != values[name] for name in fields):
+            drifted.append(queryset.model(pk=row["pk"], **values))
+    queryset.model.objects.bulk_update(drifted, fields, batch_size=REPAIR_BATCH_SIZE)
+    return len(drifted)
@@ -0,0 +1,322 @@
+"""
+Deletion of accounts in the background.
+
+Deleting a Profile the usual way has Django collect every dependent
+row (friendships, friend requests, comments and their votes,
+discussions and their comments, hosted events, memberships) into
+memory, and delete them all in one transaction, which holds the writer
+lock of SQLite for as long as it takes. Instead, deletion is requested
+(request_deletion), which disables the account and hides it from
+search right away, and carried out later by a worker
+(manage.py delete_accounts).
+
+The worker goes through STAGES in order. Each stage deletes a chunk
+of rows at a time, with plain DELETE statements that bypass signals and
+the collector, and adjusts the counters, approval ratings, search index
+and friend graph cache that signals would have, in the same
+transaction. A stage is over when it finds no rows left. Chunks shrink
+when a transaction takes longer than ACCOUNT_DELETION_LOCK_BUDGET
+seconds and grow when it takes less than half of it.
+
+Every step is safe to repeat: a job that fails (or a worker that dies)
+resumes from the stage it was in, and deletes whatever is left.
+Finally, the User is deleted the usual way; by then nothing depends
+on it but the empty Profile.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from firstfloor import counters
+from firstfloor.friendgraph import get_friend_graph
+from firstfloor.models import (Profile, ProfileNameKey, FriendRequest, DiscussionGroup, Discussion, Comment,
+                               CommentVote, Event, AccountDeletion)
+from firstfloor.search import get_search_backend
+
+Friendship = Profile.friend_list.through
+GroupParticipant = DiscussionGroup.participants.through
+GroupInvitee = DiscussionGroup.invitees.through
+EventParticipant = Event.participants.through
+EventInvitee = Event.invitees.through
+
+# Bounds of the number of rows per chunk. IDs are passed as query
+# parameters, and SQLite allows at most 999 of them.
+MIN_CHUNK_SIZE = 10
+MAX_CHUNK_SIZE = 900
+
+
+def request_deletion(profile):
+    """
+    Requests the deletion of an account. The User can no longer log
+    in, and the Profile can no longer be found by name or searched
+    for. Requesting the deletion again returns the pending job.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance to delete.
+
+    Returns
+    -------
+    AccountDeletion
+        The deletion job.
+    """
+
+    with transaction.atomic():
+        job = AccountDeletion.objects.filter(profile=profile, completed_date__isnull=True).first()
+        if job is None:
+            job = AccountDeletion.objects.create(profile=profile, username=profile.user.username)
+        User.objects.filter(pk=profile.user_id).update(is_active=False)
+        ProfileNameKey.objects.filter(profile=profile).delete()
+        get_search_backend().remove([("profile", profile.pk)])
+    return job
+
+
+def run_deletion(job, progress=None):
+    """
+    Carries out a deletion job, from the stage that it was left in.
+
+    Parameters
+    ----------
+    job : AccountDeletion
+        The deletion job.
+    progress : callable
+        Called with the job, the name of each finished stage and the
+        number of rows it deleted.
+
+    Returns
+    -------
+    AccountDeletion
+        The job, completed.
+    """
+
+    budget = getattr(settings, "ACCOUNT_DELETION_LOCK_BUDGET", 0.05)
+    pause = getattr(settings, "ACCOUNT_DELETION_PAUSE", 0.0)
+    chunk_size = getattr(settings, "ACCOUNT_DELETION_CHUNK_SIZE", 200)
+
+    AccountDeletion.objects.filter(pk=job.pk).update(attempts=F("attempts") + 1)
+    names = [name for name, _ in STAGES]
+    start_index = names.index(job.stage) if job.stage in names else 0
+
+    profile_id = job.profile_id
+    if profile_id is not None:
+        for name, delete_chunk in STAGES[start_index:]:
+            stage_rows = 0
+            while True:
+                start = time.perf_counter()
+                with transaction.atomic():
+                    rows = delete_chunk(profile_id, chunk_size)
+                    AccountDeletion.objects.filter(pk=job.pk).update(stage=name, deleted_rows=F("deleted_rows") + rows)
+                chunk_size = _next_chunk_size(chunk_size, time.perf_counter() - start, budget)
+                stage_rows += rows
+                if not rows:
+                    break
+                if pause:
+                    time.sleep(pause)
+            if progress is not None:
+                progress(job, name, stage_rows)
+
+        with transaction.atomic():
+            user_id = Profile.objects.filter(pk=profile_id).values_list("user_id", flat=True).first()
+            get_search_backend().remove([("profile", profile_id)])
+            if user_id is not None:
+                User.objects.filter(pk=user_id).delete()
+
+    AccountDeletion.objects.filter(pk=job.pk).update(stage="", completed_date=timezone.now(), error="")
+    job.refresh_from_db()
+    return job
+
+
+def run_pending(progress=None, error=None):
+    """
+    Carries out every pending deletion job, oldest first. A failing job
+    is recorded with its error and left pending, to be retried later.
+
+    Parameters
+    ----------
+    progress : callable
+        Passed on to run_deletion.
+    error : callable
+        Called with the job and the exception of every failed job.
+
+    Returns
+    -------
+    dict
+        Number of jobs 'completed' and 'failed'.
+    """
+
+    results = {"completed": 0, "failed": 0}
+    jobs = AccountDeletion.objects.filter(completed_date__isnull=True).order_by("requested_date", "id")
+    for job in list(jobs):
+        try:
+            run_deletion(job, progress)
+            results["completed"] += 1
+        except Exception as failure:
+            AccountDeletion.objects.filter(pk=job.pk).update(error=repr(failure))
+            results["failed"] += 1
+            if error is not None:
+                error(job, failure)
+    return results
+
+
+def _next_chunk_size(size, seconds, budget):
+    if seconds > budget:
+        return max(MIN_CHUNK_SIZE, size // 2)
+    if seconds < budget / 2:
+        return min(MAX_CHUNK_SIZE, size * 2)
+    return size
+
+
+def _delete(model, pks):
+    # Plain DELETE of rows by ID, without signals or the collector.
+    if not pks:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} WHERE {} IN ({})".format(
+            connection.ops.quote_name(model._meta.db_table),
+            connection.ops.quote_name(model._meta.pk.column),
+            ", ".join(["%s"] * len(pks))), list(pks))
+    return len(pks)
+
+
+def _unindex(kind, pks):
+    if pks:
+        get_search_backend().remove([(kind, pk) for pk in pks])
+
+
+def _tally(keys):
+    tally = {}
+    for key in keys:
+        tally[key] = tally.get(key, 0) + 1
+    return tally
+
+
+def _invalidate_friends(profile_ids):
+    # Invalidated both right away and after the commit, as in
+    # firstfloor.friendships.
+    friend_graph = get_friend_graph()
+    friend_graph.invalidate(*profile_ids)
+    transaction.on_commit(lambda: friend_graph.invalidate(*profile_ids))
+
+
+def _friendships(profile_id, limit):
+    rows = list(Friendship.objects.filter(from_profile_id=profile_id).values_list("pk", "to_profile_id")[:limit])
+    friend_ids = [friend_id for _, friend_id in rows]
+    reverse = list(Friendship.objects.filter(from_profile_id__in=friend_ids, to_profile_id=profile_id)
+                   .values_list("pk", flat=True))
+    if rows:
+        _invalidate_friends(friend_ids + [profile_id])
+    return _delete(Friendship, [pk for pk, _ in rows]) + _delete(Friendship, reverse)
+
+
+def _reverse_friendships(profile_id, limit):
+    # Friendships recorded in one direction only.
+    rows = list(Friendship.objects.filter(to_profile_id=profile_id).values_list("pk", "from_profile_id")[:limit])
+    if rows:
+        _invalidate_friends([friend_id for _, friend_id in rows] + [profile_id])
+    return _delete(Friendship, [pk for pk, _ in rows])
+
+
+def _sent_friend_requests(profile_id, limit):
+    return _delete(FriendRequest, list(FriendRequest.objects.filter(sender_id=profile_id).values_list("pk", flat=True)[:limit]))
+
+
+def _received_friend_requests(profile_id, limit):
+    return _delete(FriendRequest, list(FriendRequest.objects.filter(receiver_id=profile_id).values_list("pk", flat=True)[:limit]))
+
+
+def _votes(profile_id, limit):
+    # Votes of the Profile no longer count in approval ratings.
+    rows = list(CommentVote.objects.filter(voter_id=profile_id).values_list("pk", "comment_id", "approval")[:limit])
+    counters.subtract(Comment, "approval", {comment_id: 1 if approval else -1 for _, comment_id, approval in rows})
+    return _delete(CommentVote, [pk for pk, _, _ in rows])
+
+
+def _votes_on(comments):
+    def delete_chunk(profile_id, limit):
+        return _delete(CommentVote, list(CommentVote.objects.filter(**{"comment__" + comments: profile_id})
+                                         .values_list("pk", flat=True)[:limit]))
+    return delete_chunk
+
+
+def _comments(comments):
+    def delete_chunk(profile_id, limit):
+        rows = list(Comment.objects.filter(**{comments: profile_id})
+                    .values_list("pk", "related_discussion_id", "related_discussion__related_group_id")[:limit])
+        counters.subtract(Discussion, "comment_count", _tally(discussion_id for _, discussion_id, _ in rows))
+        counters.subtract(DiscussionGroup, "comment_count", _tally(group_id for _, _, group_id in rows))
+        pks = [pk for pk, _, _ in rows]
+        _unindex("comment", pks)
+        return _delete(Comment, pks)
+    return delete_chunk
+
+
+def _discussions(profile_id, limit):
+    rows = list(Discussion.objects.filter(creator_id=profile_id).values_list("pk", "related_group_id")[:limit])
+    counters.subtract(DiscussionGroup, "discussion_count", _tally(group_id for _, group_id in rows))
+    pks = [pk for pk, _ in rows]
+    _unindex("discussion", pks)
+    return _delete(Discussion, pks)
+
+
+def _members_of_hosted_events(through):
+    def delete_chunk(profile_id, limit):
+        return _delete(through, list(through.objects.filter(event__host_id=profile_id).values_list("pk", flat=True)[:limit]))
+    return delete_chunk
+
+
+def _hosted_events(profile_id, limit):
+    pks = list(Event.objects.filter(host_id=profile_id).values_list("pk", flat=True)[:limit])
+    _unindex("event", pks)
+    return _delete(Event, pks)
+
+
+def _memberships(through, column, model, counter=None):
+    def delete_chunk(profile_id, limit):
+        rows = list(through.objects.filter(profile_id=profile_id).values_list("pk", column)[:limit])
+        if counter is not None:
+            counters.subtract(model, counter, _tally(pk for _, pk in rows))
+        return _delete(through, [pk for pk, _ in rows])
+    return delete_chunk
+
+
+def _created_groups(profile_id, limit):
+    # Groups outlive their creator.
+    pks = list(DiscussionGroup.objects.filter(creator_id=profile_id).values_list("pk", flat=True)[:limit])
+    return DiscussionGroup.objects.filter(pk__in=pks).update(creator=None)
+
+
+def _name_keys(profile_id, limit):
+    return _delete(ProfileNameKey, list(ProfileNameKey.objects.filter(profile_id=profile_id).values_list("pk", flat=True)[:limit]))
+
+
+# Stages of a deletion, in order: votes before their comments, comments
+# before their discussions, participants before their events. Each
+# deletes a chunk of at most the given number of rows of the Profile of
+# the given ID, and returns the number of rows it deleted.
+STAGES = [
+    ("friendships", _friendships),
+    ("reverse_friendships", _reverse_friendships),
+    ("sent_friend_requests", _sent_friend_requests),
+    ("received_friend_requests", _received_friend_requests),
+    ("votes", _votes),
+    ("comment_votes", _votes_on("commenter_id")),
+    ("comments", _comments("commenter_id")),
+    ("discussion_comment_votes", _votes_on("related_discussion__creator_id")),
+    ("discussion_comments", _comments("related_discussion__creator_id")),
+    ("discussions", _discussions),
+    ("hosted_event_participants", _members_of_hosted_events(EventParticipant)),
+    ("hosted_event_invitees", _members_of_hosted_events(EventInvitee)),
+    ("hosted_events", _hosted_events),
+    ("group_memberships", _memberships(GroupParticipant, "discussiongroup_id", DiscussionGroup, "participant_count")),
+    ("group_invitations", _memberships(GroupInvitee, "discussiongroup_id", DiscussionGroup)),
+    ("event_memberships", _memberships(EventParticipant, "event_id", Event, "participant_count")),
+    ("event_invitations", _memberships(EventInvitee, "event_id", Event)),
+    ("created_groups", _created_groups),
+    ("name_keys", _name_keys),
+]
@@ -0,0 +1,238 @@
+"""
+Exports of the personal data of a Profile (GDPR data portability).
+
+An export holds the Profile and its User, friends, friend requests,
+comments, votes, discussions, discussion groups and events. Very
+active Profiles have large histories, so exports are never built in
+memory: every section is read with a server-side iterator, a chunk
+of rows at a time, and written out as it is read.
+
+Two formats are offered:
+- NDJSON: One JSON object per line, with its section in 'type'.
+- ZIP: profile.json and one NDJSON file per section, compressed. The
+  archive is written to a stream, so its entries use data descriptors
+  instead of sizes known up front.
+"""
+
+import json
+import zipfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from firstfloor.models import Profile, FriendRequest, DiscussionGroup, Discussion, CommentVote, Event
+
+# Number of rows fetched from the database at a time.
+EXPORT_CHUNK_SIZE = 2000
+
+# Number of bytes collected before they are handed to the response.
+WRITE_BUFFER_SIZE = 64 * 1024
+
+_ENCODER = DjangoJSONEncoder(ensure_ascii=False)
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "zip": "application/zip",
+}
+
+
+def export_sections(profile):
+    """
+    Getter for the sections of the export of a Profile. Sections are
+    lazy: nothing is queried until they are iterated, one at a time.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance, with its User.
+
+    Returns
+    -------
+    list of (string, iterable of dict)
+        Name and records of each section, in order.
+    """
+
+    friendships = Profile.friend_list.through.objects.filter(from_profile=profile)
+    GroupParticipant = DiscussionGroup.participants.through
+    GroupInvitee = DiscussionGroup.invitees.through
+    EventParticipant = Event.participants.through
+    EventInvitee = Event.invitees.through
+
+    return [
+        ("friends", _records(friendships.order_by("to_profile_id"),
+                             friend="to_profile__user__username")),
+        ("friend_requests", _records(
+            FriendRequest.objects.filter(Q(sender=profile) | Q(receiver=profile)).order_by("request_date", "id"),
+            "id", "request_date", "status", sender="sender__user__username", receiver="receiver__user__username")),
+        ("comments", _records(profile.profile_comments.order_by("id"),
+                              "id", "contents", "creation_date", "edit_date", "approval",
+                              discussion="related_discussion_id")),
+        ("comment_votes", _records(CommentVote.objects.filter(voter=profile).order_by("id"),
+                                   "approval", comment="comment_id")),
+        ("discussions", _records(Discussion.objects.filter(creator=profile).order_by("id"),
+                                 "id", "title", "description", "creation_date", group="related_group_id")),
+        ("groups", _chain(
+            _records(DiscussionGroup.objects.filter(creator=profile).order_by("id"),
+                     "id", "title", "description", "creation_date", relation="creator"),
+            _records(GroupParticipant.objects.filter(profile=profile).order_by("discussiongroup_id"),
+                     id="discussiongroup_id", title="discussiongroup__title", relation="participant"),
+            _records(GroupInvitee.objects.filter(profile=profile).order_by("discussiongroup_id"),
+                     id="discussiongroup_id", title="discussiongroup__title", relation="invitee"))),
+        ("events", _chain(
+            _records(Event.objects.filter(host=profile).order_by("id"),
+                     "id", "title", "description", "location", "start_date", "end_date", "cancelled", "private",
+                     relation="host"),
+            _records(EventParticipant.objects.filter(profile=profile).order_by("event_id"),
+                     id="event_id", title="event__title", start_date="event__start_date",
+                     relation="participant"),
+            _records(EventInvitee.objects.filter(profile=profile).order_by("event_id"),
+                     id="event_id", title="event__title", start_date="event__start_date",
+                     relation="invitee"))),
+    ]
+
+
+def profile_record(profile):
+    """
+    Getter for the personal details of a Profile and its User.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance, with its User.
+
+    Returns
+    -------
+    dict
+        Details of the Profile. The password is left out.
+    """
+
+    user = profile.user
+    return {
+        "username": user.username,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "date_joined": user.date_joined,
+        "last_login": user.last_login,
+        "description": profile.description,
+        "location": profile.location,
+        "birthdate": profile.birthdate,
+        "private": profile.private,
+    }
+
+
+def stream_ndjson(profile):
+    """
+    Writes the export of a Profile as NDJSON: the Profile first,
+    followed by every record of every section.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance, with its User.
+
+    Returns
+    -------
+    generator of bytes
+        The export, in chunks of about WRITE_BUFFER_SIZE bytes.
+    """
+
+    def lines():
+        yield _line(dict(profile_record(profile), type="profile"))
+        for name, records in export_sections(profile):
+            for record in records:
+                yield _line(dict(record, type=name))
+
+    return _buffered(lines())
+
+
+def stream_zip(profile):
+    """
+    Writes the export of a Profile as a ZIP archive with profile.json
+    and one NDJSON file per section.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance, with its User.
+
+    Returns
+    -------
+    generator of bytes
+        The archive, in chunks of about WRITE_BUFFER_SIZE bytes.
+    """
+
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("profile.json", "w") as entry:
+            entry.write(json.dumps(profile_record(profile), cls=DjangoJSONEncoder, ensure_ascii=False,
+                                   indent=2).encode("utf-8"))
+        yield from pipe.drain()
+
+        for name, records in export_sections(profile):
+            with archive.open(name + ".ndjson", "w") as entry:
+                for chunk in _buffered(_line(record) for record in records):
+                    entry.write(chunk)
+                    yield from pipe.drain(WRITE_BUFFER_SIZE)
+            yield from pipe.drain()
+    yield from pipe.drain()
+
+
+class _Pipe:
+    # Write-only stream that the archive is written into, and that the
+    # written bytes are taken out of. Not seekable, so zipfile writes
+    # sizes and checksums after each entry.
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self, threshold=0):
+        if self.size > threshold:
+            data = b"".join(self.chunks)
+            self.chunks = []
+            self.size = 0
+            yield data
+
+
+def _records(queryset, *fields, relation=None, **renamed):
+    # Rows of a queryset as dicts, fetched a chunk at a time. Keyword
+    # arguments rename fields, and relation tags every record.
+    names = list(fields) + list(renamed)
+    rows = queryset.values_list(*fields, *renamed.values())
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        record = dict(zip(names, row))
+        if relation is not None:
+            record["relation"] = relation
+        yield record
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        yield from iterable
+
+
+def _line(record):
+    return _ENCODER.encode(record).encode("utf-8") + b"\n"
+
+
+def _buffered(lines):
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= WRITE_BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
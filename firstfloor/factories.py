@@ -0,0 +1,238 @@
+"""
+Fixture factory for realistic datasets.
+
+Seeds the database with Profiles, friendships, friend requests, groups,
+discussions, comments and events. Every table is filled with bulk
+inserts, so thousands of Profiles can be seeded within seconds. Since
+bulk inserts bypass signals, the name keys and the search index are
+rebuilt at the end.
+
+Used by the query budget tests, and by benchmarks.
+"""
+
+import random
+from collections import namedtuple
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from firstfloor.counters import reconcile
+from firstfloor.models import Profile, ProfileNameKey, FriendRequest, DiscussionGroup, Discussion, Comment, CommentVote, Event
+from firstfloor.people import name_keys_for
+from firstfloor.ranking import recompute_popularity
+from firstfloor.search import rebuild_index
+
+Dataset = namedtuple("Dataset", ["profile_ids", "group_ids", "discussion_ids", "comment_ids", "event_ids"])
+
+FIRST_NAMES = ["Aino", "Eero", "Helmi", "Ilmari", "Kaisa", "Lauri", "Minna", "Niilo", "Otto", "Saara", "Tuomas", "Väinö"]
+LAST_NAMES = ["Korhonen", "Virtanen", "Mäkinen", "Nieminen", "Hämäläinen", "Laine", "Heikkinen", "Koskinen"]
+LOCATIONS = ["Tampere", "Helsinki", "Turku", "Oulu", "Jyväskylä", "Kuopio"]
+WORDS = ["sauna", "lake", "forest", "coffee", "snow", "summer", "cottage", "music", "hiking", "books", "games", "cooking"]
+
+# Password of every seeded User.
+PASSWORD = "password"
+
+
+def seed(profiles=2000, friends_per_profile=10, pending_requests_per_profile=2, groups=100,
+         discussions=400, comments=4000, votes_per_comment=2, events=200, random_seed=0):
+    """
+    Seeds the database with a dataset of given size.
+
+    Parameters
+    ----------
+    profiles : int
+        Number of Profiles (and Users). Usernames are 'user0', 'user1'
+        and so on, and every password is PASSWORD.
+    friends_per_profile : int
+        Average number of friends of a Profile.
+    pending_requests_per_profile : int
+        Average number of pending friend requests sent by a Profile.
+    groups : int
+        Number of discussion groups.
+    discussions : int
+        Number of discussions.
+    comments : int
+        Number of comments.
+    votes_per_comment : int
+        Average number of votes on a comment.
+    events : int
+        Number of events.
+    random_seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    Dataset
+        IDs of the created objects.
+    """
+
+    rng = random.Random(random_seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        profile_ids = _seed_profiles(rng, profiles)
+        _seed_friendships(rng, profile_ids, friends_per_profile, pending_requests_per_profile, now)
+        group_ids = _seed_groups(rng, profile_ids, groups, now)
+        discussion_ids = _seed_discussions(rng, profile_ids, group_ids, discussions, now)
+        comment_ids = _seed_comments(rng, profile_ids, discussion_ids, comments, votes_per_comment, now)
+        event_ids = _seed_events(rng, profile_ids, events, now)
+
+        ProfileNameKey.objects.bulk_create(
+            [ProfileNameKey(profile=profile, key=key)
+             for profile in Profile.objects.select_related("user").filter(pk__in=profile_ids)
+             for key in name_keys_for(profile)])
+        reconcile()
+        recompute_popularity()
+    rebuild_index()
+
+    return Dataset(profile_ids, group_ids, discussion_ids, comment_ids, event_ids)
+
+
+def _sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize()
+
+
+def _new_ids(model, count):
+    # Bulk inserts do not return IDs on every backend; new rows are
+    # the ones with the largest IDs.
+    return sorted(model.objects.order_by("-pk").values_list("pk", flat=True)[:count])
+
+
+def _seed_profiles(rng, count):
+    first_user = User.objects.count()
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username="user{}".format(first_user + index),
+             first_name=rng.choice(FIRST_NAMES),
+             last_name=rng.choice(LAST_NAMES),
+             password=password)
+        for index in range(count)
+    ])
+
+    user_ids = _new_ids(User, count)
+    Profile.objects.bulk_create([
+        Profile(user_id=user_id,
+                location=rng.choice(LOCATIONS),
+                description=_sentence(rng, 8),
+                private=rng.random() < 0.1)
+        for user_id in user_ids
+    ])
+    return _new_ids(Profile, count)
+
+
+def _seed_friendships(rng, profile_ids, friends_per_profile, pending_requests_per_profile, now):
+    Friendship = Profile.friend_list.through
+    pairs = set()
+    for profile_id in profile_ids:
+        for _ in range(friends_per_profile // 2):
+            friend_id = rng.choice(profile_ids)
+            if friend_id != profile_id:
+                pairs.add((min(profile_id, friend_id), max(profile_id, friend_id)))
+
+    friendships = []
+    friend_requests = []
+    for first_id, second_id in pairs:
+        friendships.append(Friendship(from_profile_id=first_id, to_profile_id=second_id))
+        friendships.append(Friendship(from_profile_id=second_id, to_profile_id=first_id))
+        friend_requests.append(FriendRequest(sender_id=first_id, receiver_id=second_id, status=True,
+                                             request_date=now - timedelta(days=rng.randrange(1, 365))))
+    Friendship.objects.bulk_create(friendships)
+
+    for profile_id in profile_ids:
+        for _ in range(pending_requests_per_profile):
+            receiver_id = rng.choice(profile_ids)
+            pair = (min(profile_id, receiver_id), max(profile_id, receiver_id))
+            if receiver_id != profile_id and pair not in pairs:
+                pairs.add(pair)
+                friend_requests.append(FriendRequest(sender_id=profile_id, receiver_id=receiver_id,
+                                                     request_date=now - timedelta(minutes=rng.randrange(1, 100000))))
+    FriendRequest.objects.bulk_create(friend_requests)
+
+
+def _seed_groups(rng, profile_ids, count, now):
+    DiscussionGroup.objects.bulk_create([
+        DiscussionGroup(title=_sentence(rng, 2),
+                        description=_sentence(rng, 10),
+                        creator_id=rng.choice(profile_ids),
+                        creation_date=now - timedelta(days=rng.randrange(1, 365)),
+                        invitation_required=rng.random() < 0.2)
+        for _ in range(count)
+    ])
+    group_ids = _new_ids(DiscussionGroup, count)
+
+    Participant = DiscussionGroup.participants.through
+    Participant.objects.bulk_create([
+        Participant(discussiongroup_id=group_id, profile_id=profile_id)
+        for group_id in group_ids
+        for profile_id in rng.sample(profile_ids, min(len(profile_ids), 20))
+    ])
+    return group_ids
+
+
+def _seed_discussions(rng, profile_ids, group_ids, count, now):
+    Discussion.objects.bulk_create([
+        Discussion(title=_sentence(rng, 3),
+                   description=_sentence(rng, 12),
+                   creator_id=rng.choice(profile_ids),
+                   related_group_id=rng.choice(group_ids) if group_ids and rng.random() < 0.8 else None,
+                   creation_date=now - timedelta(days=rng.randrange(1, 365)))
+        for _ in range(count)
+    ])
+    return _new_ids(Discussion, count)
+
+
+def _seed_comments(rng, profile_ids, discussion_ids, count, votes_per_comment, now):
+    comments = []
+    for _ in range(count):
+        creation_date = now - timedelta(minutes=rng.randrange(1, 500000))
+        comments.append(Comment(commenter_id=rng.choice(profile_ids),
+                                related_discussion_id=rng.choice(discussion_ids),
+                                contents=_sentence(rng, 15),
+                                creation_date=creation_date,
+                                edit_date=creation_date))
+    Comment.objects.bulk_create(comments)
+    comment_ids = _new_ids(Comment, count)
+
+    votes = {}
+    for comment_id in comment_ids:
+        for voter_id in rng.sample(profile_ids, min(len(profile_ids), rng.randrange(votes_per_comment * 2 + 1))):
+            votes[(comment_id, voter_id)] = rng.random() < 0.7
+    CommentVote.objects.bulk_create([
+        CommentVote(comment_id=comment_id, voter_id=voter_id, approval=approval)
+        for (comment_id, voter_id), approval in votes.items()
+    ])
+
+    # Approvals are kept consistent with the votes.
+    approvals = dict.fromkeys(comment_ids, 0)
+    for (comment_id, _), approval in votes.items():
+        approvals[comment_id] += 1 if approval else -1
+    Comment.objects.bulk_update([Comment(pk=comment_id, approval=approval) for comment_id, approval in approvals.items() if approval],
+                                ["approval"])
+    return comment_ids
+
+
+def _seed_events(rng, profile_ids, count, now):
+    events = []
+    for _ in range(count):
+        start_date = now + timedelta(hours=rng.randrange(-2000, 2000))
+        events.append(Event(title=_sentence(rng, 3),
+                            description=_sentence(rng, 20),
+                            host_id=rng.choice(profile_ids),
+                            location=rng.choice(LOCATIONS),
+                            start_date=start_date,
+                            end_date=start_date + timedelta(hours=rng.randrange(1, 48)),
+                            cancelled=rng.random() < 0.05,
+                            private=rng.random() < 0.2))
+    Event.objects.bulk_create(events)
+    event_ids = _new_ids(Event, count)
+
+    Participant = Event.participants.through
+    Participant.objects.bulk_create([
+        Participant(event_id=event_id, profile_id=profile_id)
+        for event_id in event_ids
+        for profile_id in rng.sample(profile_ids, min(len(profile_ids), 10))
+    ])
+    return event_ids
@@ -0,0 +1,360 @@
+"""
+Cached friend graph.
+
+The friend lists of Profiles are kept in a cache as sorted arrays of
+Profile IDs, one array per Profile. Lookups of several Profiles are
+conducted with one cache round-trip, and Profiles missing from the
+cache are loaded with one query. The arrays of both Profiles are
+invalidated whenever a friendship is created or removed.
+Invalidations only reach the processes that share the cache, so
+arrays kept in a cache local to each process have to expire.
+
+On top of the adjacency arrays, the graph provides mutual friend
+counts, 'people you may know' -suggestions and degrees of separation.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from groundfloor.db.routers import read_from_primary
+
+
+class FriendGraph:
+    """
+    Friend graph backed by a cache.
+
+    ...
+
+    Attributes
+    ----------
+    cache : BaseCache
+        The cache that the adjacency arrays are kept in.
+    timeout : int
+        Number of seconds that adjacency arrays are cached for.
+        If None, they are cached until invalidated.
+    """
+
+    key = "friendgraph:{}"
+
+    def __init__(self, cache, timeout=None):
+        self.cache = cache
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Creates a friend graph as configured in the settings:
+        FRIEND_GRAPH_CACHE names the cache to use, and
+        FRIEND_GRAPH_TIMEOUT sets the cache timeout in seconds.
+        A cache local to each process requires a timeout, as the
+        other processes never see its invalidations.
+
+        Returns
+        -------
+        FriendGraph
+            The configured friend graph.
+        """
+
+        cache = caches[getattr(settings, "FRIEND_GRAPH_CACHE", "default")]
+        timeout = getattr(settings, "FRIEND_GRAPH_TIMEOUT", 300)
+        if timeout is None and isinstance(cache, LocMemCache):
+            raise ImproperlyConfigured("FRIEND_GRAPH_TIMEOUT must be set when FRIEND_GRAPH_CACHE is a local-memory cache.")
+        return cls(cache, timeout)
+
+    def friends(self, profile_id):
+        """
+        Getter for the friends of a Profile.
+
+        Parameters
+        ----------
+        profile_id : int
+            ID of the Profile.
+
+        Returns
+        -------
+        array
+            Sorted IDs of the friends of the Profile.
+        """
+
+        return self.friends_of_many([profile_id])[profile_id]
+
+    def friends_of_many(self, profile_ids):
+        """
+        Getter for the friends of several Profiles.
+
+        Parameters
+        ----------
+        profile_ids : iterable of int
+            IDs of the Profiles.
+
+        Returns
+        -------
+        dict
+            Sorted arrays of friend IDs, keyed by Profile ID.
+        """
+
+        profile_ids = list(profile_ids)
+        cached = self.cache.get_many([self.key.format(profile_id) for profile_id in profile_ids])
+
+        adjacency = {}
+        missing = []
+        for profile_id in profile_ids:
+            data = cached.get(self.key.format(profile_id))
+            if data is None:
+                missing.append(profile_id)
+            else:
+                adjacency[profile_id] = _from_bytes(data)
+
+        if missing:
+            loaded = load_adjacency(missing)
+            self.cache.set_many({self.key.format(profile_id): friends.tobytes() for profile_id, friends in loaded.items()}, self.timeout)
+            adjacency.update(loaded)
+        return adjacency
+
+    def invalidate(self, *profile_ids):
+        """
+        Removes the cached friends of specified Profiles.
+        Has to be called whenever their friend lists change.
+
+        Parameters
+        ----------
+        *profile_ids : int
+            IDs of the Profiles.
+        """
+
+        self.cache.delete_many([self.key.format(profile_id) for profile_id in profile_ids])
+
+    def mutual_friend_count(self, profile_id, other_id):
+        """
+        Getter for the number of mutual friends of two Profiles.
+
+        Parameters
+        ----------
+        profile_id : int
+            ID of the first Profile.
+        other_id : int
+            ID of the second Profile.
+
+        Returns
+        -------
+        int
+            Number of Profiles that both Profiles are friends with.
+        """
+
+        adjacency = self.friends_of_many([profile_id, other_id])
+        return intersection_size(adjacency[profile_id], adjacency[other_id])
+
+    def suggestions(self, profile_id, limit=10):
+        """
+        Getter for 'people you may know' -suggestions of a Profile.
+        See suggest_friends.
+        """
+
+        return suggest_friends(self.friends_of_many, profile_id, limit)
+
+    def degrees_of_separation(self, profile_id, other_id, max_depth=6, max_visited=100000):
+        """
+        Getter for the degrees of separation between two Profiles.
+        See degrees_of_separation.
+        """
+
+        return degrees_of_separation(self.friends_of_many, profile_id, other_id, max_depth, max_visited)
+
+
+def load_adjacency(profile_ids):
+    """
+    Loads the friends of specified Profiles from the database
+    with one query. The friends are read from the primary database,
+    as they are cached until they change again.
+
+    Parameters
+    ----------
+    profile_ids : list of int
+        IDs of the Profiles.
+
+    Returns
+    -------
+    dict
+        Sorted arrays of friend IDs, keyed by Profile ID.
+    """
+
+    from firstfloor.models import Profile
+
+    Friendship = Profile.friend_list.through
+    adjacency = {profile_id: array("i") for profile_id in profile_ids}
+    rows = (Friendship.objects
+            .filter(from_profile_id__in=profile_ids)
+            .order_by("from_profile_id", "to_profile_id")
+            .values_list("from_profile_id", "to_profile_id"))
+    with read_from_primary():
+        for profile_id, friend_id in rows.iterator():
+            adjacency[profile_id].append(friend_id)
+    return adjacency
+
+
+def intersection_size(first, second):
+    """
+    Counts the IDs that two sorted arrays have in common.
+
+    Parameters
+    ----------
+    first : array
+        Sorted array of IDs.
+    second : array
+        Sorted array of IDs.
+
+    Returns
+    -------
+    int
+        Number of common IDs.
+    """
+
+    if len(first) > len(second):
+        first, second = second, first
+    if not first:
+        return 0
+    if len(first) * 16 < len(second):
+        # Binary search is cheaper than hashing the larger array.
+        count = 0
+        for item in first:
+            index = bisect_left(second, item)
+            if index < len(second) and second[index] == item:
+                count += 1
+        return count
+    return len(set(first).intersection(second))
+
+
+def suggest_friends(friends_of_many, profile_id, limit=10):
+    """
+    Ranks friends of friends of a Profile by the number of mutual
+    friends. Existing friends and the Profile itself are excluded.
+
+    Parameters
+    ----------
+    friends_of_many : callable
+        Function that maps a list of Profile IDs to a dictionary of
+        their sorted friend ID arrays, such as
+        FriendGraph.friends_of_many.
+    profile_id : int
+        ID of the Profile.
+    limit : int
+        Maximum number of suggestions.
+
+    Returns
+    -------
+    list of (int, int)
+        Suggestions as (Profile ID, mutual friend count) -tuples,
+        most mutual friends first. Ties are broken by Profile ID.
+    """
+
+    friends = friends_of_many([profile_id])[profile_id]
+    if not friends:
+        return []
+
+    mutual_counts = Counter()
+    for friends_of_friend in friends_of_many(friends).values():
+        mutual_counts.update(friends_of_friend)
+
+    del mutual_counts[profile_id]
+    for friend_id in friends:
+        mutual_counts.pop(friend_id, None)
+    return heapq.nsmallest(limit, mutual_counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def degrees_of_separation(friends_of_many, profile_id, other_id, max_depth=6, max_visited=100000):
+    """
+    Finds the length of the shortest friendship chain between two
+    Profiles with a bidirectional breadth-first search. The search
+    always expands the smaller frontier, fetching the friends of the
+    whole frontier at once.
+
+    Parameters
+    ----------
+    friends_of_many : callable
+        Function that maps a list of Profile IDs to a dictionary of
+        their sorted friend ID arrays, such as
+        FriendGraph.friends_of_many.
+    profile_id : int
+        ID of the first Profile.
+    other_id : int
+        ID of the second Profile.
+    max_depth : int
+        Maximum length of the chain to look for.
+    max_visited : int
+        Maximum number of Profiles to visit before giving up.
+
+    Returns
+    -------
+    int
+        Degrees of separation: 0 for the same Profile, 1 for friends,
+        2 for friends of friends and so on. None, if no chain was found
+        within the bounds.
+    """
+
+    if profile_id == other_id:
+        return 0
+
+    # Distances from either end, for every visited Profile.
+    visited = ({profile_id: 0}, {other_id: 0})
+    frontiers = ([profile_id], [other_id])
+    depth = 0
+
+    while frontiers[0] and frontiers[1] and depth < max_depth:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        own, opposite = visited[side], visited[1 - side]
+        next_frontier = []
+        best = None
+
+        for current_id, friends in friends_of_many(frontiers[side]).items():
+            distance = own[current_id] + 1
+            for friend_id in friends:
+                if friend_id in opposite:
+                    total = distance + opposite[friend_id]
+                    if best is None or total < best:
+                        best = total
+                if friend_id not in own:
+                    own[friend_id] = distance
+                    next_frontier.append(friend_id)
+
+        if best is not None:
+            return best if best <= max_depth else None
+        if len(visited[0]) + len(visited[1]) > max_visited:
+            return None
+
+        frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        depth += 1
+
+    return None
+
+
+_friend_graph = None
+
+
+def get_friend_graph():
+    """
+    Getter for the friend graph of the process.
+    The graph is created from the settings on first use.
+
+    Returns
+    -------
+    FriendGraph
+        The friend graph of the process.
+    """
+
+    global _friend_graph
+    if _friend_graph is None:
+        _friend_graph = FriendGraph.from_settings()
+    return _friend_graph
+
+
+def _from_bytes(data):
+    friends = array("i")
+    friends.frombytes(data)
+    return friends
@@ -0,0 +1,223 @@
+"""
+Friendship transitions between Profiles.
+
+Each transition is conducted inside a single transaction, with the
+friend requests between the two Profiles resolved in both directions
+with one query. Sending a request locks both Profiles first, so that
+concurrent transitions between the same Profiles are serialized. Friend lists are modified through the friendship table
+directly, so the Profile rows themselves are never rewritten.
+
+States of a friend request:
+- None: Request is pending.
+- True: Request was accepted.
+- False: Request was declined, or the friendship was removed.
+"""
+
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from firstfloor.friendgraph import get_friend_graph
+from firstfloor.models import Profile, FriendRequest
+
+# Time that has to pass before a declined friend request can be sent again.
+RESEND_COOLDOWN = timedelta(days=7)
+
+Friendship = Profile.friend_list.through
+
+
+def send_friend_request(sender, receiver):
+    """
+    Creates a friend request from sender to receiver. If the receiver
+    has a pending friend request for the sender, that request is
+    accepted instead. A declined friend request is put back into
+    a pending state once the cooldown has passed.
+
+    Parameters
+    ----------
+    sender : Profile
+        The Profile instance sending the friend request.
+    receiver : Profile
+        The Profile instance receiving the friend request.
+
+    Returns
+    -------
+    FriendRequest
+        The friend request that was created, reopened or accepted.
+        None, if sender and receiver are the same Profile.
+    """
+
+    if sender.pk == receiver.pk:
+        # A Profile instance cannot be friends with itself.
+        return None
+
+    with transaction.atomic():
+        _lock_profiles(sender, receiver)
+        outgoing, incoming = _requests_between(sender, receiver)
+
+        if incoming is not None and incoming.status is None:
+            # Friend request with swapped recipients exists.
+            # Instead of creating a new friend request, the
+            # existing one is accepted instead.
+            _accept(incoming)
+            return incoming
+
+        if outgoing is None:
+            return FriendRequest.objects.create(sender=sender, receiver=receiver)
+
+        if outgoing.status is False and timezone.now() > outgoing.request_date + RESEND_COOLDOWN:
+            outgoing.status = None
+            outgoing.request_date = timezone.now()
+            outgoing.save(update_fields=["status", "request_date"])
+        return outgoing
+
+
+def accept_friend_request(receiver, sender):
+    """
+    Accepts a friend request sent by sender to receiver, and adds
+    the Profiles to each other's friend lists.
+    Does nothing if such a request does not exist.
+
+    Parameters
+    ----------
+    receiver : Profile
+        The Profile instance that received the friend request.
+    sender : Profile
+        The Profile instance that sent the friend request.
+
+    Returns
+    -------
+    FriendRequest
+        The accepted friend request, or None if it does not exist.
+    """
+
+    with transaction.atomic():
+        friend_request = FriendRequest.objects.select_for_update().filter(sender=sender, receiver=receiver).first()
+        if friend_request is None:
+            return None
+        if friend_request.status is not True:
+            _accept(friend_request)
+        return friend_request
+
+
+def reject_friend_request(receiver, sender):
+    """
+    Rejects a pending friend request sent by sender to receiver.
+    Does nothing if such a request does not exist.
+
+    Parameters
+    ----------
+    receiver : Profile
+        The Profile instance that received the friend request.
+    sender : Profile
+        The Profile instance that sent the friend request.
+
+    Returns
+    -------
+    bool
+        True, if a pending friend request was rejected.
+    """
+
+    rejected = FriendRequest.objects.filter(sender=sender, receiver=receiver, status__isnull=True).update(status=False)
+    return rejected > 0
+
+
+def add_friend(profile, other):
+    """
+    Adds the Profiles to each other's friend lists.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance adding a friend.
+    other : Profile
+        The Profile instance being added.
+    """
+
+    if profile.pk == other.pk:
+        # A Profile instance cannot be friends with itself.
+        return
+    _link(profile.pk, other.pk)
+
+
+def remove_friend(profile, other):
+    """
+    Removes the Profiles from each other's friend lists. The friend
+    request associated with the friendship is maintained, with its
+    status set to False.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance removing a friend.
+    other : Profile
+        The Profile instance being removed.
+    """
+
+    if profile.pk == other.pk:
+        # A Profile instance cannot be friends with itself.
+        return
+
+    with transaction.atomic():
+        FriendRequest.objects.filter(_between(profile.pk, other.pk, "sender_id", "receiver_id"), status=True).update(status=False)
+        _unlink(profile.pk, other.pk)
+
+
+def _lock_profiles(first, second):
+    # Concurrent transitions between the same pair of Profiles are
+    # serialized by locking both Profile rows in a consistent order.
+    # SQLite has no row locks, and its deferred transactions only take
+    # the database-wide writer lock at their first write: a write that
+    # changes nothing takes it before the friend requests are read, so
+    # mutual requests cannot both see none and both be created.
+    profiles = Profile.objects.filter(pk__in=[first.pk, second.pk])
+    if connection.features.has_select_for_update:
+        list(profiles.select_for_update().order_by("pk").values_list("pk", flat=True))
+    else:
+        profiles.update(user_id=F("user_id"))
+
+
+def _requests_between(profile, other):
+    outgoing = None
+    incoming = None
+    friend_requests = FriendRequest.objects.select_for_update().filter(_between(profile.pk, other.pk, "sender_id", "receiver_id"))
+    for friend_request in friend_requests:
+        if friend_request.sender_id == profile.pk:
+            outgoing = friend_request
+        else:
+            incoming = friend_request
+    return outgoing, incoming
+
+
+def _accept(friend_request):
+    FriendRequest.objects.filter(pk=friend_request.pk).update(status=True)
+    friend_request.status = True
+    _link(friend_request.sender_id, friend_request.receiver_id)
+
+
+def _between(first_id, second_id, first_field, second_field):
+    return (Q(**{first_field: first_id, second_field: second_id})
+            | Q(**{first_field: second_id, second_field: first_id}))
+
+
+def _link(first_id, second_id):
+    Friendship.objects.bulk_create([
+        Friendship(from_profile_id=first_id, to_profile_id=second_id),
+        Friendship(from_profile_id=second_id, to_profile_id=first_id),
+    ], ignore_conflicts=True)
+    _invalidate_friend_graph(first_id, second_id)
+
+
+def _unlink(first_id, second_id):
+    Friendship.objects.filter(_between(first_id, second_id, "from_profile_id", "to_profile_id")).delete()
+    _invalidate_friend_graph(first_id, second_id)
+
+
+def _invalidate_friend_graph(first_id, second_id):
+    # Invalidated both right away and after the commit, so that a read
+    # racing with the transaction cannot leave stale friends cached.
+    friend_graph = get_friend_graph()
+    friend_graph.invalidate(first_id, second_id)
+    transaction.on_commit(lambda: friend_graph.invalidate(first_id, second_id))
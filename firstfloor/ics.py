@@ -0,0 +1,179 @@
+"""
+iCalendar (RFC 5545) feeds of events.
+
+Each Profile has a calendar feed of the events that it hosts,
+participates in or has been invited to. Calendar applications
+subscribe to feeds without logging in, so feeds are addressed by
+a signed token of the Profile instead. The token holds the random
+calendar secret of the Profile, so a leaked token is revoked by
+replacing the secret (reset_calendar_token).
+
+Feeds are written one event at a time, so that they can be streamed
+without holding every event in memory.
+"""
+
+from django.core import signing
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from firstfloor.models import Profile, new_calendar_secret
+
+# Salt of the signed calendar tokens.
+TOKEN_SALT = "firstfloor.ics"
+
+# Maximum length of content lines in octets, line break excluded.
+MAX_LINE_LENGTH = 75
+
+PRODUCT_ID = "-//jros-behz//firstfloor//EN"
+
+
+def calendar_token(profile):
+    """
+    Getter for the calendar token of a Profile.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance.
+
+    Returns
+    -------
+    string
+        URL-safe token that identifies the Profile, valid until its
+        calendar secret is replaced.
+    """
+
+    return signing.dumps([profile.pk, profile.calendar_secret], salt=TOKEN_SALT)
+
+
+def reset_calendar_token(profile):
+    """
+    Revokes the calendar token of a Profile by replacing its calendar
+    secret. Subscriptions with the previous token stop working.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance.
+
+    Returns
+    -------
+    string
+        The new calendar token.
+    """
+
+    profile.calendar_secret = new_calendar_secret()
+    # Updated directly, as nothing else about the Profile changes.
+    Profile.objects.filter(pk=profile.pk).update(calendar_secret=profile.calendar_secret)
+    return calendar_token(profile)
+
+
+def profile_of(token, profiles=Profile.objects):
+    """
+    Getter for the Profile that a calendar token identifies.
+
+    Parameters
+    ----------
+    token : string
+        Token created with calendar_token.
+    profiles : QuerySet
+        Profiles to look the Profile up from.
+
+    Returns
+    -------
+    Profile
+        The Profile instance.
+
+    Raises
+    ------
+    ValueError
+        If the token is invalid or has been revoked.
+    """
+
+    try:
+        profile_id, secret = signing.loads(token, salt=TOKEN_SALT)
+        profile = profiles.get(pk=int(profile_id))
+    except (signing.BadSignature, Profile.DoesNotExist, TypeError, ValueError) as error:
+        raise ValueError("Invalid calendar token.") from error
+    if not constant_time_compare(profile.calendar_secret, str(secret)):
+        raise ValueError("Invalid calendar token.")
+    return profile
+
+
+def stream_calendar(events, name, domain):
+    """
+    Writes events as an iCalendar feed, one event at a time.
+
+    Parameters
+    ----------
+    events : iterable of Event
+        The events. Iterated once.
+    name : string
+        Name of the calendar.
+    domain : string
+        Domain of the site, for globally unique event IDs.
+
+    Returns
+    -------
+    generator of string
+        The feed, one chunk per event.
+    """
+
+    stamp = _format_time(timezone.now())
+    yield _lines([
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:" + PRODUCT_ID,
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:" + _escape(name),
+    ])
+    for event in events:
+        yield _lines([
+            "BEGIN:VEVENT",
+            "UID:event-{}@{}".format(event.pk, domain),
+            "DTSTAMP:" + stamp,
+            "DTSTART:" + _format_time(event.start_date),
+            "DTEND:" + _format_time(event.end_date),
+            "SUMMARY:" + _escape(event.title),
+            "DESCRIPTION:" + _escape(event.description),
+            "LOCATION:" + _escape(event.location),
+            "STATUS:" + ("CANCELLED" if event.cancelled else "CONFIRMED"),
+            "CLASS:" + ("PRIVATE" if event.private else "PUBLIC"),
+            "END:VEVENT",
+        ])
+    yield _lines(["END:VCALENDAR"])
+
+
+def _format_time(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _escape(text):
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n"))
+
+
+def _fold(line):
+    # Lines longer than MAX_LINE_LENGTH octets are continued on lines
+    # starting with a space, without splitting UTF-8 sequences.
+    encoded = line.encode("utf-8")
+    if len(encoded) <= MAX_LINE_LENGTH:
+        return line
+    parts = []
+    start = 0
+    limit = MAX_LINE_LENGTH
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode("utf-8"))
+        start = end
+        # Continuation lines start with a space, which counts in the limit.
+        limit = MAX_LINE_LENGTH - 1
+    return "\r\n ".join(parts)
+
+
+def _lines(lines):
+    return "".join(_fold(line) + "\r\n" for line in lines)
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from firstfloor.deletion import run_pending
+from groundfloor.db.routers import new_task
+
+
+class Command(BaseCommand):
+    """
+    Carries out pending account deletions, a chunk of rows at a time
+    (see firstfloor.deletion). Failed jobs are left pending, and are
+    retried on the next run. Meant to be run periodically, or kept
+    running with --loop.
+    """
+
+    help = "Deletes the accounts whose deletion has been requested."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep checking for new jobs, every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        def progress(job, stage, rows):
+            if rows:
+                self.stdout.write("{}: {} rows of {}.".format(job.username, rows, stage))
+
+        def error(job, failure):
+            self.stderr.write("{}: deletion failed: {!r}".format(job.username, failure))
+
+        while True:
+            start = time.perf_counter()
+            # Every round is a task of its own, reading from replicas
+            # until it writes (see groundfloor.db.routers).
+            with new_task():
+                results = run_pending(progress, error)
+            if results["completed"] or results["failed"]:
+                self.stdout.write("Deleted {} accounts ({} failed) in {:.1f} s.".format(
+                    results["completed"], results["failed"], time.perf_counter() - start))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from firstfloor.votebuffer import get_vote_buffer
+from groundfloor.db.routers import new_task
+
+
+class Command(BaseCommand):
+    """
+    Drains the comment vote buffer into the database.
+
+    Only votes of a shared (cache-backed) buffer are reachable from
+    this command, so VOTE_BUFFER_CACHE has to be set. Buffers kept in
+    process memory are drained by their own processes, by a timer once
+    their window passes and upon shutdown.
+    """
+
+    help = "Flushes buffered comment votes into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep flushing periodically, once per buffering window.")
+
+    def handle(self, *args, **options):
+        if not getattr(settings, "VOTE_BUFFER_CACHE", None):
+            raise CommandError("VOTE_BUFFER_CACHE is not set: votes are buffered in the memory of each process, "
+                               "which flushes them by itself.")
+        vote_buffer = get_vote_buffer()
+        while True:
+            # Every round is a task of its own, reading from replicas
+            # until it writes (see groundfloor.db.routers).
+            with new_task():
+                deltas = vote_buffer.flush()
+            metrics = vote_buffer.metrics()
+            self.stdout.write("Flushed votes for {} comments in {:.3f} s, {} entries pending.".format(
+                len(deltas), metrics["last_flush_seconds"] if deltas else 0.0, metrics["depth"]))
+            if not options["loop"]:
+                break
+            time.sleep(max(vote_buffer.window, 1.0))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firstfloor.provisioning import BATCH_SIZE, FORMATS, import_accounts, import_friendships, read_accounts
+
+
+class Command(BaseCommand):
+    """
+    Imports accounts from a CSV or JSON Lines file, in batches
+    (see firstfloor.provisioning for the fields). Accounts that exist
+    already are skipped, so an interrupted import is resumed by running
+    the same command again.
+    """
+
+    help = "Imports Users, Profiles and friendships from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File of accounts, one per line.")
+        parser.add_argument("--format", choices=FORMATS, help="Deduced from the file extension by default.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Number of processes hashing passwords. One per CPU by default, 0 hashes in this process.")
+        parser.add_argument(
+            "--skip-friendships",
+            action="store_true",
+            help="Only import the accounts.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if options["batch_size"] < 1:
+            raise CommandError("Batch size has to be positive.")
+
+        start = time.perf_counter()
+
+        def progress(stats):
+            self.stdout.write("Accounts: read {read}, created {created}, skipped {skipped}, invalid {invalid} "
+                              "({rate:.0f}/s)".format(rate=stats["read"] / (time.perf_counter() - start), **stats))
+
+        def error(line_number, message):
+            self.stderr.write("Line {}: {}".format(line_number, message))
+
+        try:
+            stats = import_accounts(read_accounts(path, options["format"]), options["batch_size"],
+                                    options["processes"], progress, error)
+        except (OSError, ValueError) as failure:
+            raise CommandError(failure)
+        self.stdout.write("Created {} accounts in {:.1f} s.".format(stats["created"], time.perf_counter() - start))
+
+        if options["skip_friendships"]:
+            return
+        start = time.perf_counter()
+        stats = import_friendships(read_accounts(path, options["format"]), options["batch_size"],
+                                   lambda stats: self.stdout.write(
+                                       "Friendships: read {read}, created {created}, skipped {skipped}".format(**stats)))
+        self.stdout.write("Created {} friendships in {:.1f} s.".format(stats["created"], time.perf_counter() - start))
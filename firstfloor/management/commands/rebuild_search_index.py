@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from firstfloor.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the full-text search index from the database.
+    The index is normally maintained incrementally, so this is only
+    needed after bulk changes that bypass model signals.
+    """
+
+    help = "Rebuilds the full-text search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write("Indexed {} documents in {:.1f} s.".format(count, time.perf_counter() - start))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from firstfloor.counters import reconcile
+
+
+class Command(BaseCommand):
+    """
+    Recounts the denormalized counters of discussion groups,
+    discussions and events, and repairs those that have drifted,
+    along with the long-running flags of events.
+    The counters are normally maintained incrementally, so this is
+    only needed after bulk changes that bypass model signals.
+    """
+
+    help = "Repairs the participant, discussion and comment counters, and long-running events."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        repaired = reconcile()
+        self.stdout.write("Repaired {} in {:.1f} s.".format(
+            ", ".join("{} {} rows".format(count, name) for name, count in repaired.items()),
+            time.perf_counter() - start))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from firstfloor.ranking import get_leaderboards, recompute_popularity
+from groundfloor.db.routers import new_task
+
+
+class Command(BaseCommand):
+    """
+    Refreshes the cached leaderboards of popular groups and events.
+    Meant to be run periodically, more often than the leaderboards
+    expire (LEADERBOARD_TIMEOUT), or kept running with --loop.
+    """
+
+    help = "Refreshes the leaderboards of popular groups and events."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recompute",
+            action="store_true",
+            help="Rebuild the popularity scores from the database first.")
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep refreshing periodically, every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        if options["recompute"]:
+            start = time.perf_counter()
+            count = recompute_popularity()
+            self.stdout.write("Scored {} groups and events in {:.1f} s.".format(count, time.perf_counter() - start))
+
+        leaderboards = get_leaderboards()
+        while True:
+            start = time.perf_counter()
+            # Every round is a task of its own, reading from replicas
+            # until it writes (see groundfloor.db.routers).
+            with new_task():
+                sizes = leaderboards.refresh()
+            self.stdout.write("Refreshed {} groups and {} events in {:.3f} s.".format(
+                sizes["groups"], sizes["events"], time.perf_counter() - start))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0003_auto_20200718_2001'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentVote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approval', models.BooleanField()),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_votes', to='firstfloor.Comment')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profile_comment_votes', to='firstfloor.Profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='commentvote',
+            constraint=models.UniqueConstraint(fields=('comment', 'voter'), name='unique_comment_vote'),
+        ),
+    ]
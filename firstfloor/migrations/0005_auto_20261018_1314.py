@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0004_auto_20261018_1312'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='friendrequest',
+            name='status',
+            field=models.BooleanField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:15
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_friend_requests(apps, schema_editor):
+    # Only the most recent friend request per (sender, receiver) is kept,
+    # so that the uniqueness constraint can be created.
+    FriendRequest = apps.get_model('firstfloor', 'FriendRequest')
+    duplicates = (FriendRequest.objects
+                  .values('sender', 'receiver')
+                  .annotate(count=Count('id'), latest=Max('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        (FriendRequest.objects
+         .filter(sender=duplicate['sender'], receiver=duplicate['receiver'])
+         .exclude(id=duplicate['latest'])
+         .delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0005_auto_20261018_1314'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_friend_requests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(status__isnull=True), fields=['receiver', 'request_date', 'id'], name='friendrequest_pending_in'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(status__isnull=True), fields=['sender', 'request_date', 'id'], name='friendrequest_pending_out'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendrequest',
+            constraint=models.UniqueConstraint(fields=('sender', 'receiver'), name='unique_friend_request'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:20
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from firstfloor.search import get_search_backend
+    get_search_backend(schema_editor.connection).create_schema()
+
+
+def drop_search_index(apps, schema_editor):
+    from firstfloor.search import get_search_backend
+    get_search_backend(schema_editor.connection).drop_schema()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0006_auto_20261018_1315'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
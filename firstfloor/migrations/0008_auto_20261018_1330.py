@@ -0,0 +1,45 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_name_keys(apps, schema_editor):
+    from firstfloor.people import normalize_name
+
+    Profile = apps.get_model('firstfloor', 'Profile')
+    ProfileNameKey = apps.get_model('firstfloor', 'ProfileNameKey')
+    keys = []
+    for profile in Profile.objects.select_related('user').iterator():
+        user = profile.user
+        names = [user.username, user.first_name, user.last_name, '{} {}'.format(user.first_name, user.last_name)]
+        keys.extend(ProfileNameKey(profile=profile, key=key) for key in {normalize_name(name) for name in names} if key)
+    ProfileNameKey.objects.bulk_create(keys, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='private',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ProfileNameKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=300)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_keys', to='firstfloor.Profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='profilenamekey',
+            index=models.Index(fields=['key'], name='profilenamekey_key'),
+        ),
+        migrations.RunPython(create_name_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0008_auto_20261018_1330'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['related_discussion', 'creation_date', 'id'], name='comment_thread'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['related_discussion', '-approval', '-id'], name='comment_thread_approval'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+COUNT_ROWS = """
+UPDATE firstfloor_discussiongroup SET
+    participant_count = (SELECT COUNT(*) FROM firstfloor_discussiongroup_participants p
+                         WHERE p.discussiongroup_id = firstfloor_discussiongroup.id),
+    discussion_count = (SELECT COUNT(*) FROM firstfloor_discussion d
+                        WHERE d.related_group_id = firstfloor_discussiongroup.id),
+    comment_count = (SELECT COUNT(*) FROM firstfloor_comment c
+                     JOIN firstfloor_discussion d ON c.related_discussion_id = d.id
+                     WHERE d.related_group_id = firstfloor_discussiongroup.id),
+    last_activity = (SELECT MAX(c.creation_date) FROM firstfloor_comment c
+                     JOIN firstfloor_discussion d ON c.related_discussion_id = d.id
+                     WHERE d.related_group_id = firstfloor_discussiongroup.id);
+UPDATE firstfloor_discussion SET
+    comment_count = (SELECT COUNT(*) FROM firstfloor_comment c
+                     WHERE c.related_discussion_id = firstfloor_discussion.id),
+    last_activity = (SELECT MAX(c.creation_date) FROM firstfloor_comment c
+                     WHERE c.related_discussion_id = firstfloor_discussion.id);
+UPDATE firstfloor_event SET
+    participant_count = (SELECT COUNT(*) FROM firstfloor_event_participants p
+                         WHERE p.event_id = firstfloor_event.id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0009_auto_20261018_1351'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discussion',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='discussiongroup',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='discussiongroup',
+            name='discussion_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='discussiongroup',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='discussiongroup',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['related_group', '-last_activity', '-id'], name='discussion_active'),
+        ),
+        migrations.AddIndex(
+            model_name='discussiongroup',
+            index=models.Index(condition=models.Q(invitation_required=False), fields=['-participant_count', '-id'], name='group_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='discussiongroup',
+            index=models.Index(condition=models.Q(invitation_required=False), fields=['-last_activity', '-id'], name='group_active'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('cancelled', False), ('private', False)), fields=['-participant_count', '-id'], name='event_popular'),
+        ),
+        migrations.RunSQL(COUNT_ROWS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+def score_popularity(apps, schema_editor):
+    from django.utils import timezone
+    from firstfloor.ranking import CREATION_WEIGHT, JOIN_WEIGHT, DISCUSSION_WEIGHT, COMMENT_WEIGHT, weight_at
+
+    DiscussionGroup = apps.get_model('firstfloor', 'DiscussionGroup')
+    Discussion = apps.get_model('firstfloor', 'Discussion')
+    Comment = apps.get_model('firstfloor', 'Comment')
+    Event = apps.get_model('firstfloor', 'Event')
+
+    groups = {group.pk: group for group in DiscussionGroup.objects.all()}
+    for group in groups.values():
+        group.popularity = (weight_at(CREATION_WEIGHT, group.creation_date)
+                            + weight_at(JOIN_WEIGHT, group.last_activity or group.creation_date) * group.participant_count)
+    for group_id, creation_date in Discussion.objects.filter(related_group__isnull=False).values_list('related_group', 'creation_date'):
+        groups[group_id].popularity += weight_at(DISCUSSION_WEIGHT, creation_date)
+    for group_id, creation_date in Comment.objects.filter(related_discussion__related_group__isnull=False).values_list(
+            'related_discussion__related_group', 'creation_date'):
+        groups[group_id].popularity += weight_at(COMMENT_WEIGHT, creation_date)
+    DiscussionGroup.objects.bulk_update(groups.values(), ['popularity'], batch_size=500)
+
+    now = timezone.now()
+    events = list(Event.objects.all())
+    for event in events:
+        created = min(event.start_date, now)
+        event.popularity = (weight_at(CREATION_WEIGHT, created)
+                            + weight_at(JOIN_WEIGHT, event.last_activity or created) * event.participant_count)
+    Event.objects.bulk_update(events, ['popularity'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0010_auto_20261018_1354'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='discussiongroup',
+            name='group_popular',
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_popular',
+        ),
+        migrations.AddField(
+            model_name='discussiongroup',
+            name='popularity',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='popularity',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='discussiongroup',
+            index=models.Index(condition=models.Q(invitation_required=False), fields=['-popularity', '-id'], name='group_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('cancelled', False), ('private', False)), fields=['-popularity', '-id'], name='event_popular'),
+        ),
+        migrations.RunPython(score_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+def mark_long_running(apps, schema_editor):
+    from firstfloor.models import EVENT_MAX_SPAN
+
+    Event = apps.get_model('firstfloor', 'Event')
+    long_running = [pk for pk, start_date, end_date in Event.objects.values_list('pk', 'start_date', 'end_date').iterator()
+                    if end_date - start_date > EVENT_MAX_SPAN]
+    for offset in range(0, len(long_running), 500):
+        Event.objects.filter(pk__in=long_running[offset:offset + 500]).update(long_running=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0011_auto_20261018_1357'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='long_running',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(cancelled=False), fields=['start_date', 'end_date'], name='event_calendar'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('cancelled', False), ('long_running', True)), fields=['long_running', 'end_date'], name='event_long_running'),
+        ),
+        migrations.RunPython(mark_long_running, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.8 on 2026-10-18 14:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0012_auto_20261018_1359'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('requested_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed_date', models.DateTimeField(blank=True, null=True)),
+                ('stage', models.CharField(blank=True, max_length=50)),
+                ('deleted_rows', models.IntegerField(default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('profile', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deletion_jobs', to='firstfloor.Profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accountdeletion',
+            index=models.Index(condition=models.Q(completed_date__isnull=True), fields=['requested_date', 'id'], name='accountdeletion_pending'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.8 on 2026-10-18 15:20
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def unindex_restricted(apps, schema_editor):
+    # Discussions and comments of restricted groups are no longer
+    # searchable.
+    from firstfloor.search import get_search_backend
+
+    Discussion = apps.get_model('firstfloor', 'Discussion')
+    Comment = apps.get_model('firstfloor', 'Comment')
+    restricted = Q(related_group__invitation_required=True) | ~Q(related_group__passphrase='')
+    discussion_ids = list(Discussion.objects.filter(restricted, related_group__isnull=False).values_list('pk', flat=True))
+    comment_ids = list(Comment.objects.filter(related_discussion__in=discussion_ids).values_list('pk', flat=True))
+
+    backend = get_search_backend(schema_editor.connection)
+    keys = [('discussion', pk) for pk in discussion_ids] + [('comment', pk) for pk in comment_ids]
+    for start in range(0, len(keys), 500):
+        backend.remove(keys[start:start + 500])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0013_auto_20261018_1425'),
+    ]
+
+    operations = [
+        migrations.RunPython(unindex_restricted, migrations.RunPython.noop),
+    ]
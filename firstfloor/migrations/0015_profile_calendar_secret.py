@@ -0,0 +1,30 @@
+# Generated by Django 3.0.8 on 2026-10-18 15:25
+
+from django.db import migrations, models
+import firstfloor.models
+
+
+def give_calendar_secrets(apps, schema_editor):
+    # The default of the new column is evaluated once, so existing
+    # Profiles get secrets of their own.
+    Profile = apps.get_model('firstfloor', 'Profile')
+    profiles = list(Profile.objects.only('pk'))
+    for profile in profiles:
+        profile.calendar_secret = firstfloor.models.new_calendar_secret()
+    Profile.objects.bulk_update(profiles, ['calendar_secret'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0014_search_restricted_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='calendar_secret',
+            field=models.CharField(default=firstfloor.models.new_calendar_secret, editable=False, max_length=32),
+        ),
+        migrations.RunPython(give_calendar_secrets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.8 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0015_profile_calendar_secret'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='discussiongroup',
+            name='group_popular',
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_popular',
+        ),
+        migrations.AddIndex(
+            model_name='discussiongroup',
+            index=models.Index(condition=models.Q(('invitation_required', False), ('passphrase', '')), fields=['-popularity', '-id'], name='group_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('cancelled', False), ('private', False)), fields=['-popularity', '-id', 'end_date'], name='event_popular'),
+        ),
+    ]
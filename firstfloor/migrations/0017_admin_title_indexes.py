@@ -0,0 +1,25 @@
+# Generated by Django 3.0.8 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstfloor', '0016_listed_groups_and_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['title'], name='discussion_title'),
+        ),
+        migrations.AddIndex(
+            model_name='discussiongroup',
+            index=models.Index(fields=['title'], name='group_title'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['title'], name='event_title'),
+        ),
+    ]
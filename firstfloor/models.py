@@ -1,7 +1,25 @@
-from django.db import models
+import secrets
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Case, When, Value
 from django.contrib.auth.models import User
+from django.utils import timezone
 from datetime import datetime, timedelta
 
+from firstfloor.pagination import keyset_page
+
+def new_calendar_secret():
+    """
+    Getter for a new random calendar secret of a Profile.
+
+    Returns
+    -------
+    string
+        32 URL-safe characters.
+    """
+
+    return secrets.token_urlsafe(24)
+
 class Profile(models.Model):
     """
     Primary object for logging into the site.
@@ -23,6 +41,14 @@ class Profile(models.Model):
     birthdate : datetime
         Date instance of the time of birth of the creator
         of the Profile.
+    private : bool
+        Determines the visibility of the Profile. Private Profiles
+        can still be found by their username, but most of their
+        information remains hidden from others.
+    calendar_secret : string
+        Random secret of the calendar feed of the Profile, signed into
+        its calendar token (see firstfloor.ics). Replacing it revokes
+        the token.
     """
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -31,6 +57,8 @@ class Profile(models.Model):
     description = models.TextField(max_length=500, blank=True)
     location = models.CharField(max_length=255, blank=False)
     birthdate = models.DateField(null=True, blank=True)
+    private = models.BooleanField(default=False)
+    calendar_secret = models.CharField(max_length=32, default=new_calendar_secret, editable=False)
 
     def __str__(self):
         """
@@ -60,11 +88,16 @@ class Profile(models.Model):
             the same. False otherwise.
         """
 
-        if self.pk == other.pk and self.user.pk == other.user.pk:
+        if not isinstance(other, Profile):
+            return False
+        if self.pk == other.pk and self.user_id == other.user_id:
             return True
         else:
             return False
 
+    # Defining __eq__ would otherwise make Profile instances unhashable.
+    __hash__ = models.Model.__hash__
+
     def check_friend_request(self, other):
         """
         Checks whether specified Profile has created a friend request
@@ -89,11 +122,59 @@ class Profile(models.Model):
         except FriendRequest.DoesNotExist:
             return None
 
+    def incoming_friend_requests(self, cursor=None, limit=20):
+        """
+        Getter for a page of pending friend requests that have been
+        sent to this instance, newest first.
+
+        Parameters
+        ----------
+        cursor : string
+            Cursor of the previous page. If None, the first page
+            is fetched.
+        limit : int
+            Maximum number of friend requests on the page.
+
+        Returns
+        -------
+        (list<FriendRequest>, string)
+            Friend requests on the page (with their senders), and
+            the cursor of the next page. The cursor is None if there
+            are no more friend requests.
+        """
+
+        friend_requests = FriendRequest.objects.filter(receiver=self, status__isnull=True).select_related("sender__user")
+        return keyset_page(friend_requests, ("-request_date", "-id"), cursor, limit)
+
+    def outgoing_friend_requests(self, cursor=None, limit=20):
+        """
+        Getter for a page of pending friend requests that this
+        instance has sent, newest first.
+
+        Parameters
+        ----------
+        cursor : string
+            Cursor of the previous page. If None, the first page
+            is fetched.
+        limit : int
+            Maximum number of friend requests on the page.
+
+        Returns
+        -------
+        (list<FriendRequest>, string)
+            Friend requests on the page (with their receivers), and
+            the cursor of the next page. The cursor is None if there
+            are no more friend requests.
+        """
+
+        friend_requests = FriendRequest.objects.filter(sender=self, status__isnull=True).select_related("receiver__user")
+        return keyset_page(friend_requests, ("-request_date", "-id"), cursor, limit)
+
     def send_friend_request(self, other):
         """
         Creates a friendship request to specified user, letting
-        them know of the proposal. If a friendship request with
-        sender and receiver swapped exists, then, instead of
+        them know of the proposal. If a pending friendship request
+        with sender and receiver swapped exists, then, instead of
         creating a new friendship request, existing one is
         accepted.
 
@@ -103,39 +184,15 @@ class Profile(models.Model):
         ----------
         other : Profile
             Target Profile instance of the friendship request.
+
+        Returns
+        -------
+        FriendRequest
+            The friend request that was created, reopened or accepted.
         """
 
-        if check_friend_request(other) is not None:
-            # Friend request with swapped recipients exists.
-            # Instead of creating a new friend request, the
-            # existing one is accpeted instead.
-            accept_friend_request(other)
-            return
-        if self == other:
-            # A Profile instance cannot be friends with itself.
-            return
-        try:
-            # Start by checking whether target friend request
-            # already exists.
-            existing_request = FriendRequest.objects.get(sender=self, receiver=other)
-
-            # Check the status of the request. There are 3 different states:
-            # - True: Request was accepted.
-            # - False: Request was declined.
-            # - None: Request is yet to receive a response.
-            if existing_request.status is False:
-                # With the status set to False, the friend request has
-                # been declined. It can be sent again after a week has passed.
-                existing_date = existing_request.request_date
-                threshold_date = existing_date + timedelta(days=7)
-                if datetime.now() > threshold_date:
-                    # Setting the status to "None" puts the request
-                    # back into a "pending" state.
-                    existing_request.set_status(None)
-                    existing_request.save()
-        except FriendRequest.DoesNotExist:
-            # Target friend request does not exist.
-            FriendRequest.objects.create(sender=self, receiver=other)
+        from firstfloor import friendships
+        return friendships.send_friend_request(self, other)
 
     def reject_friend_request(self, other):
         """
@@ -150,10 +207,8 @@ class Profile(models.Model):
             The Profile instance that sent the friend request.
         """
 
-        friend_request = self.check_friend_request(other)
-        if friend_request is not None:
-            friend_request.set_status(False)
-            friend_request.save()
+        from firstfloor import friendships
+        friendships.reject_friend_request(self, other)
 
     def accept_friend_request(self, other):
         """
@@ -170,11 +225,8 @@ class Profile(models.Model):
             The Profile instance that sent the friend request.
         """
 
-        friend_request = self.check_friend_request(other)
-        if friend_request is not None:
-            friend_request.set_status(True)
-            friend_request.save()
-            add_friend(other)
+        from firstfloor import friendships
+        friendships.accept_friend_request(self, other)
 
     def add_friend(self, other):
         """
@@ -190,15 +242,8 @@ class Profile(models.Model):
             friend list.
         """
 
-        if self == other:
-            # A Profile instance cannot be friends with itself.
-            return
-
-        # Add Profile instances to both friend lists.
-        self.friend_list.add(other)
-        other.friend_list.add(self)
-        self.save()
-        other.save()
+        from firstfloor import friendships
+        friendships.add_friend(self, other)
 
     def remove_friend(self, other):
         """
@@ -214,28 +259,50 @@ class Profile(models.Model):
             the friend list.
         """
 
-        if self == other:
-            # A Profile instance cannot be friends with itself.
-            return
+        from firstfloor import friendships
+        friendships.remove_friend(self, other)
+
+
+class ProfileNameKey(models.Model):
+    """
+    Normalized name of a Profile, used as a prefix index for finding
+    people by the beginning of their name. Each Profile has a key for
+    its username, and unless the Profile is private, keys for the
+    first name, last name and full name of its User.
+
+    ...
 
-        # The friend request associated with the friendship is
-        # maintained. Its status should be set to False.
-        friend_request = self.check_friend_request(other)
-        if friend_request is None:
-            friend_request = other.check_friend_request(self)
-            if friend_request is None:
-                # Friend request does not exist. Aborting procedure.
-                return
+    Attributes
+    ----------
+    profile : Profile
+        The Profile instance that the key refers to.
+    key : string
+        Normalized (case-folded, accents removed) name.
+    """
 
-        friend_request.set_status(False)
-        friend_request.save()
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="name_keys")
+    key = models.CharField(max_length=300)
 
-        # Remove Profile instances from both friend lists.
-        self.friend_list.remove(other)
-        other.friend_list.remove(self)
-        self.save()
-        other.save()
+    class Meta:
+        indexes = [
+            models.Index(fields=["key"], name="profilenamekey_key")
+        ]
 
+    def __str__(self):
+        """
+        Getter for string representation of the name key.
+
+        Returns
+        -------
+        string
+            String representation of the name key:
+            '(ID = x) Name key y of profile z', where
+            x = Name Key ID
+            y = Key
+            z = Profile ID
+        """
+
+        return "(ID = {}) Name key '{}' of profile {}".format(str(self.pk), self.key, str(self.profile_id))
 
 class FriendRequest(models.Model):
     """
@@ -261,7 +328,17 @@ class FriendRequest(models.Model):
     sender = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="sender")
     receiver = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="receiver")
     request_date = models.DateTimeField(default=datetime.now)
-    status = models.BooleanField(default=None)
+    status = models.BooleanField(default=None, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sender", "receiver"], name="unique_friend_request")
+        ]
+        indexes = [
+            # Pending requests per receiver / sender, newest first.
+            models.Index(fields=["receiver", "request_date", "id"], name="friendrequest_pending_in", condition=models.Q(status__isnull=True)),
+            models.Index(fields=["sender", "request_date", "id"], name="friendrequest_pending_out", condition=models.Q(status__isnull=True)),
+        ]
 
     def __str__(self):
         """
@@ -276,7 +353,7 @@ class FriendRequest(models.Model):
             y = Sender Profile
             z = Receiver Profile
         """
-        return "(ID = {}) Friend Request - Sender / Receiver: {} / {}".format(str(self.pk), self.sender.user.username, other.sender.user.username)
+        return "(ID = {}) Friend Request - Sender / Receiver: {} / {}".format(str(self.pk), self.sender.user.username, self.receiver.user.username)
 
 class DiscussionGroup(models.Model):
     """
@@ -303,6 +380,21 @@ class DiscussionGroup(models.Model):
         an invitation.
     invitees : List<Profile>
         List of Profiles that have been invited to the group.
+    participant_count : int
+        Number of participants. Maintained by firstfloor.counters.
+    discussion_count : int
+        Number of discussions of the group.
+        Maintained by firstfloor.counters.
+    comment_count : int
+        Number of comments in the discussions of the group.
+        Maintained by firstfloor.counters.
+    last_activity : datetime
+        Time at which a Profile last joined the group, or a discussion
+        or comment was last posted in it. None if there has been
+        no activity. Maintained by firstfloor.counters.
+    popularity : float
+        Forward-decayed popularity score. Maintained by
+        firstfloor.counters, see firstfloor.ranking.
     """
 
     title = models.CharField(max_length=50)
@@ -313,6 +405,22 @@ class DiscussionGroup(models.Model):
     passphrase = models.CharField(max_length=50, blank=True)
     invitation_required = models.BooleanField(default=False)
     invitees = models.ManyToManyField(Profile, related_name="profile_group_invitations")
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
+    discussion_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_activity = models.DateTimeField(null=True, blank=True, editable=False)
+    popularity = models.FloatField(default=0.0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Listed groups (neither invitation only nor behind a
+            # passphrase) by popularity.
+            models.Index(fields=["-popularity", "-id"], name="group_popular",
+                         condition=models.Q(invitation_required=False, passphrase="")),
+            models.Index(fields=["-last_activity", "-id"], name="group_active", condition=models.Q(invitation_required=False)),
+            # Title prefix searches of the admin site.
+            models.Index(fields=["title"], name="group_title"),
+        ]
 
     def __str__(self):
         """
@@ -329,7 +437,48 @@ class DiscussionGroup(models.Model):
             a = Date of creation
         """
 
-        return "(ID = {}) Discussion Group '{}', created by '{}' at {}".format(str(self.pk), self.title, self.creator.user.username, str(self.creation_date))
+        creator = self.creator.user.username if self.creator is not None else None
+        return "(ID = {}) Discussion Group '{}', created by '{}' at {}".format(str(self.pk), self.title, creator, str(self.creation_date))
+
+    def join(self, profile):
+        """
+        Adds specified Profile to the participants of the group,
+        and updates the participant count.
+
+        Parameters
+        ----------
+        profile : Profile
+            The Profile instance joining the group.
+
+        Returns
+        -------
+        bool
+            True, if the Profile joined. False, if it already was
+            a participant.
+        """
+
+        from firstfloor import counters
+        return counters.join_group(self, profile)
+
+    def leave(self, profile):
+        """
+        Removes specified Profile from the participants of the group,
+        and updates the participant count.
+
+        Parameters
+        ----------
+        profile : Profile
+            The Profile instance leaving the group.
+
+        Returns
+        -------
+        bool
+            True, if the Profile left. False, if it was not
+            a participant.
+        """
+
+        from firstfloor import counters
+        return counters.leave_group(self, profile)
 
 class Discussion(models.Model):
     """
@@ -351,6 +500,12 @@ class Discussion(models.Model):
     related_group : DiscussionGroup
         A group that the discussion might be associated with.
         This can be None.
+    comment_count : int
+        Number of comments of the discussion.
+        Maintained by firstfloor.counters.
+    last_activity : datetime
+        Time at which a comment was last posted in the discussion.
+        None if there are no comments. Maintained by firstfloor.counters.
     """
 
     title = models.CharField(max_length=50, default="Unspecified Discussion Topic")
@@ -358,6 +513,16 @@ class Discussion(models.Model):
     creator = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="profile_created_discussions")
     creation_date = models.DateTimeField(default=datetime.now, blank=True)
     related_group = models.ForeignKey(DiscussionGroup, on_delete=models.SET_NULL, related_name="group_discussions", blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_activity = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Discussions of a group, most recently active first.
+            models.Index(fields=["related_group", "-last_activity", "-id"], name="discussion_active"),
+            # Title prefix searches of the admin site.
+            models.Index(fields=["title"], name="discussion_title"),
+        ]
 
     def __str__(self):
         """
@@ -376,6 +541,91 @@ class Discussion(models.Model):
 
         return "(ID = {}) Discussion subject: '{}', created by '{}' at '{}'".format(str(self.pk), self.title, self.creator.user.username, str(self.creation_date))
 
+    def post_comment(self, commenter, contents):
+        """
+        Posts a comment in the discussion. The comment is counted in
+        the discussion and its group in the same transaction.
+
+        Saves any changes that have been made into the database.
+
+        Parameters
+        ----------
+        commenter : Profile
+            The Profile instance posting the comment.
+        contents : string
+            The comment itself.
+
+        Returns
+        -------
+        Comment
+            The comment that was posted.
+        """
+
+        with transaction.atomic():
+            return Comment.objects.create(commenter=commenter, contents=contents, related_discussion=self)
+
+    def thread(self, order="oldest", cursor=None, limit=20):
+        """
+        Getter for a page of the comments of the discussion.
+        Commenters and their Users are fetched in the same query,
+        and each page is a seek into an index of the comments of
+        the discussion, so pages cost the same however long the
+        thread is.
+
+        Parameters
+        ----------
+        order : string
+            Order of the comments, one of THREAD_ORDERINGS:
+            'oldest' first, 'newest' first or by 'approval',
+            highest rated first.
+        cursor : string
+            Cursor of the previous page. If None, the first page
+            is fetched.
+        limit : int
+            Maximum number of comments on the page.
+
+        Returns
+        -------
+        (list<Comment>, string)
+            Comments on the page (with their commenters), and
+            the cursor of the next page. The cursor is None if there
+            are no more comments.
+
+        Raises
+        ------
+        ValueError
+            If the order is unknown, or the cursor is malformed.
+        """
+
+        if order not in THREAD_ORDERINGS:
+            raise ValueError("Unknown order '{}'.".format(order))
+        comments = (Comment.objects
+                    .filter(related_discussion=self)
+                    .select_related("commenter__user")
+                    .only("creation_date", "edit_date", "contents", "approval",
+                          "commenter__private", "commenter__user__username"))
+        return keyset_page(comments, THREAD_ORDERINGS[order], cursor, limit)
+
+# Orderings of the comments of a discussion, each matching an index.
+THREAD_ORDERINGS = {
+    "oldest": ("creation_date", "id"),
+    "newest": ("-creation_date", "-id"),
+    "approval": ("-approval", "-id"),
+}
+
+class CommentQuerySet(models.QuerySet):
+    """
+    Comments that are deleted in bulk are uncounted from their
+    discussions and groups, and removed from search, in bulk.
+    """
+
+    def delete(self):
+        from firstfloor import counters, search
+        with transaction.atomic():
+            counters.comments_deleted(self)
+            search.remove_all_from_index(self)
+            return super().delete()
+
 class Comment(models.Model):
     """
     Instance of feedback left behind by a User Profile on a
@@ -406,6 +656,15 @@ class Comment(models.Model):
     related_discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE, blank=True, null=True, related_name="discussion_comments")
     approval = models.IntegerField(default=0)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Pages of a thread, in either order of creation or by approval.
+            models.Index(fields=["related_discussion", "creation_date", "id"], name="comment_thread"),
+            models.Index(fields=["related_discussion", "-approval", "-id"], name="comment_thread_approval"),
+        ]
+
     def __str__(self):
         """
         Getter for string representation of the comment instance.
@@ -420,7 +679,20 @@ class Comment(models.Model):
             z = Creation Date
         """
 
-        return "(ID = {}) Comment by '{}' at '{}'".format(str(self.pk), self.commenter.user.username, str(self.creation_date))
+        commenter = self.commenter.user.username if self.commenter is not None else None
+        return "(ID = {}) Comment by '{}' at '{}'".format(str(self.pk), commenter, str(self.creation_date))
+
+    def delete(self, *args, **kwargs):
+        """
+        Deletes the comment, uncounting it from its discussion and
+        group, and removing it from search.
+        """
+
+        from firstfloor import counters, search
+        with transaction.atomic():
+            counters.comments_deleted(Comment.objects.filter(pk=self.pk))
+            search.remove_from_index(self)
+            return super().delete(*args, **kwargs)
 
     def edit_comment(self, new_comment):
         """
@@ -437,12 +709,18 @@ class Comment(models.Model):
 
         self.contents = new_comment
         self.edit_date = datetime.now()
-        self.save()
+        self.save(update_fields=["contents", "edit_date"])
 
-    def add_approval(self, approval_value):
+    def add_approval(self, approval_value, voter=None):
         """
         Adds a vote of approval/disapproval to the comment.
 
+        The rating is adjusted in the database with a single UPDATE
+        that only touches the approval column, so concurrent votes
+        are never lost. If a voter is given, the vote is recorded
+        for them: voting the same way twice has no effect, and
+        changing one's mind moves the rating by two.
+
         Saves any changes that have been made into the database.
 
         Parameters
@@ -450,6 +728,9 @@ class Comment(models.Model):
         approval_value : bool
             If True, approve of the comment (increment by 1).
             If False, disapprove of the comment (decrement by 1).
+        voter : Profile
+            The Profile instance casting the vote. If None, the vote
+            is anonymous and is not recorded.
 
         Returns
         -------
@@ -458,14 +739,292 @@ class Comment(models.Model):
             applying user approval.
         """
 
-        if approval_value is True:
-            self.approval = self.approval + 1
-        else:
-            self.approval = self.approval - 1
-
-        self.save()
+        voter_id = voter.pk if voter is not None else None
+        Comment.apply_votes([(self.pk, voter_id, approval_value)])
+        self.refresh_from_db(fields=["approval"])
         return self.approval
 
+    @classmethod
+    def apply_votes(cls, votes):
+        """
+        Applies a batch of votes to their comments.
+
+        Existing votes of the voters are looked up and locked with one
+        query, new and changed votes are written in bulk, and the ratings
+        of all affected comments are adjusted with a single UPDATE.
+        If the same voter votes on the same comment more than once
+        within the batch, the last vote counts.
+
+        Saves any changes that have been made into the database.
+
+        Parameters
+        ----------
+        votes : iterable of (int, int, bool)
+            Votes as (comment ID, voter Profile ID, approval value)
+            -tuples. Voter Profile ID can be None for anonymous votes.
+
+        Returns
+        -------
+        dict
+            Change in approval rating, keyed by comment ID.
+            Comments whose rating did not change are omitted.
+        """
+
+        deltas = {}
+        ballots = {}
+        for comment_id, voter_id, approval_value in votes:
+            if voter_id is None:
+                deltas[comment_id] = deltas.get(comment_id, 0) + (1 if approval_value else -1)
+            else:
+                ballots[(comment_id, voter_id)] = bool(approval_value)
+
+        with transaction.atomic():
+            if ballots:
+                # The existing votes are locked, so that a batch that
+                # changes the same vote concurrently waits, and sees
+                # the vote as changed instead of applying it again.
+                existing_votes = CommentVote.objects.select_for_update().filter(
+                    comment_id__in={comment_id for comment_id, _ in ballots},
+                    voter_id__in={voter_id for _, voter_id in ballots})
+                existing_votes = {(vote.comment_id, vote.voter_id): vote for vote in existing_votes}
+
+                new_votes = []
+                changed_votes = []
+                for (comment_id, voter_id), approval_value in ballots.items():
+                    step = 1 if approval_value else -1
+                    vote = existing_votes.get((comment_id, voter_id))
+                    if vote is None:
+                        new_votes.append(CommentVote(comment_id=comment_id, voter_id=voter_id, approval=approval_value))
+                        deltas[comment_id] = deltas.get(comment_id, 0) + step
+                    elif vote.approval != approval_value:
+                        # The voter changed their mind: the previous
+                        # vote is cancelled and the new one is applied.
+                        vote.approval = approval_value
+                        changed_votes.append(vote)
+                        deltas[comment_id] = deltas.get(comment_id, 0) + 2 * step
+
+                if new_votes:
+                    try:
+                        with transaction.atomic():
+                            CommentVote.objects.bulk_create(new_votes)
+                    except IntegrityError:
+                        # Another batch recorded the first vote of a
+                        # voter after the lookup. Votes are inserted
+                        # one at a time, and those that conflict are
+                        # applied onto the recorded ones instead.
+                        for vote in new_votes:
+                            step = 1 if vote.approval else -1
+                            try:
+                                with transaction.atomic():
+                                    CommentVote.objects.bulk_create([vote])
+                            except IntegrityError:
+                                deltas[vote.comment_id] -= step
+                                recorded = CommentVote.objects.select_for_update().get(
+                                    comment_id=vote.comment_id, voter_id=vote.voter_id)
+                                if recorded.approval != vote.approval:
+                                    recorded.approval = vote.approval
+                                    changed_votes.append(recorded)
+                                    deltas[vote.comment_id] += 2 * step
+                if changed_votes:
+                    CommentVote.objects.bulk_update(changed_votes, ["approval"])
+
+            deltas = {comment_id: delta for comment_id, delta in deltas.items() if delta != 0}
+            if deltas:
+                adjustment = Case(
+                    *[When(pk=comment_id, then=Value(delta)) for comment_id, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=models.IntegerField())
+                cls.objects.filter(pk__in=deltas.keys()).update(approval=F("approval") + adjustment)
+
+        return deltas
+
+class CommentVote(models.Model):
+    """
+    Record of a vote that a Profile has cast on a comment.
+    A Profile can have at most one vote per comment.
+
+    ...
+
+    Attributes
+    ----------
+    comment : Comment
+        The comment that was voted on.
+    voter : Profile
+        The Profile instance that cast the vote.
+    approval : bool
+        True, if the voter approves of the comment.
+        False, if the voter disapproves of the comment.
+    """
+
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name="comment_votes")
+    voter = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="profile_comment_votes")
+    approval = models.BooleanField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["comment", "voter"], name="unique_comment_vote")
+        ]
+
+    def __str__(self):
+        """
+        Getter for string representation of the comment vote.
+
+        Returns
+        -------
+        string
+            String representation of the comment vote:
+            '(ID = x) Vote on comment y by z', where
+            x = Vote ID
+            y = Comment ID
+            z = Voter Profile ID
+        """
+
+        return "(ID = {}) Vote on comment {} by profile {}".format(str(self.pk), str(self.comment_id), str(self.voter_id))
+
+# Events lasting longer than this are marked long-running. Range queries
+# only look back this far for events that started before the range.
+EVENT_MAX_SPAN = timedelta(days=7)
+
+class EventQuerySet(models.QuerySet):
+    """
+    Calendar queries of events. Ranges are half-open: an event overlaps
+    [start, end) if it starts before end and ends after start.
+    Cancelled events are left out by every query but overlapping,
+    and the indexes only cover events that have not been cancelled.
+    """
+
+    def active(self):
+        """
+        Getter for the events that have not been cancelled.
+
+        Returns
+        -------
+        QuerySet
+            Events that have not been cancelled.
+        """
+
+        return self.filter(cancelled=False)
+
+    def public(self):
+        """
+        Getter for the events that anyone can participate in.
+
+        Returns
+        -------
+        QuerySet
+            Events that are not private.
+        """
+
+        return self.filter(private=False)
+
+    def overlapping(self, start, end):
+        """
+        Getter for the events that overlap a range of time.
+
+        Events that start before the range are only looked for within
+        EVENT_MAX_SPAN, and among the few long-running events. The two
+        are combined with UNION ALL, so that both are index range scans
+        (an OR would scan the whole index). The combined queryset can
+        only be ordered, sliced and iterated; filter before calling this.
+        Events whose dates were changed in bulk are missed until their
+        long_running flags are repaired (manage.py reconcile_counters).
+
+        Parameters
+        ----------
+        start : datetime
+            Beginning of the range.
+        end : datetime
+            End of the range.
+
+        Returns
+        -------
+        QuerySet
+            Events overlapping the range.
+        """
+
+        lookback = start - EVENT_MAX_SPAN
+        recent = self.filter(start_date__gte=lookback, start_date__lt=end, end_date__gt=start)
+        long_running = self.filter(long_running=True, start_date__lt=lookback, end_date__gt=start)
+        return recent.union(long_running, all=True)
+
+    def between(self, start, end):
+        """
+        Getter for the events that have not been cancelled, and that
+        overlap a range of time, in order of their start dates.
+
+        Parameters
+        ----------
+        start : datetime
+            Beginning of the range.
+        end : datetime
+            End of the range.
+
+        Returns
+        -------
+        QuerySet
+            Events overlapping the range, earliest first.
+        """
+
+        return self.active().overlapping(start, end).order_by("start_date", "id")
+
+    def upcoming(self, now=None):
+        """
+        Getter for the events that have not been cancelled, and that
+        have not started yet, in order of their start dates.
+
+        Parameters
+        ----------
+        now : datetime
+            Current time. Defaults to the current time.
+
+        Returns
+        -------
+        QuerySet
+            Upcoming events, earliest first.
+        """
+
+        return self.active().filter(start_date__gte=now or timezone.now()).order_by("start_date", "id")
+
+    def this_week(self, now=None):
+        """
+        Getter for the events that have not been cancelled, and that
+        take place during the current week (from Monday to Sunday).
+
+        Parameters
+        ----------
+        now : datetime
+            Current time. Defaults to the current time.
+
+        Returns
+        -------
+        QuerySet
+            Events of the week, earliest first.
+        """
+
+        today = timezone.localtime(now or timezone.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        monday = today - timedelta(days=today.weekday())
+        return self.between(monday, monday + timedelta(days=7))
+
+    def of_profile(self, profile):
+        """
+        Getter for the events that a Profile hosts, participates in,
+        or has been invited to.
+
+        Parameters
+        ----------
+        profile : Profile
+            The Profile instance.
+
+        Returns
+        -------
+        QuerySet
+            Events of the Profile.
+        """
+
+        participating = Event.participants.through.objects.filter(profile=profile).values("event_id")
+        invited = Event.invitees.through.objects.filter(profile=profile).values("event_id")
+        return self.filter(models.Q(host=profile) | models.Q(pk__in=participating) | models.Q(pk__in=invited))
+
 class Event(models.Model):
     """
     Simple representation of an event, scheduled to take place in
@@ -499,6 +1058,18 @@ class Event(models.Model):
         Determines the availability of the event. If set to True,
         only friends of the host can participate. If set to False,
         anyone can participate.
+    participant_count : int
+        Number of participants. Maintained by firstfloor.counters.
+    last_activity : datetime
+        Time at which a Profile last joined the event. None if nobody
+        has joined. Maintained by firstfloor.counters.
+    popularity : float
+        Forward-decayed popularity score. Maintained by
+        firstfloor.counters, see firstfloor.ranking.
+    long_running : bool
+        Whether the event lasts longer than EVENT_MAX_SPAN.
+        Maintained by firstfloor.signals upon save; bulk changes
+        (update, bulk_create) are repaired by firstfloor.counters.reconcile.
     """
 
     title = models.CharField(max_length=50)
@@ -511,6 +1082,27 @@ class Event(models.Model):
     end_date = models.DateTimeField(default=datetime.now)
     cancelled = models.BooleanField(default=False)
     private = models.BooleanField(default=False)
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
+    last_activity = models.DateTimeField(null=True, blank=True, editable=False)
+    popularity = models.FloatField(default=0.0, editable=False)
+    long_running = models.BooleanField(default=False, editable=False)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listed events (public and not cancelled) by popularity. A
+            # partial index cannot refer to the current time, so ended
+            # events are filtered out on the end date in the index.
+            models.Index(fields=["-popularity", "-id", "end_date"], name="event_popular",
+                         condition=models.Q(private=False, cancelled=False)),
+            # Range queries: events by start date, and the few long-running
+            # events by end date.
+            models.Index(fields=["start_date", "end_date"], name="event_calendar", condition=models.Q(cancelled=False)),
+            models.Index(fields=["long_running", "end_date"], name="event_long_running", condition=models.Q(cancelled=False, long_running=True)),
+            # Title prefix searches of the admin site.
+            models.Index(fields=["title"], name="event_title"),
+        ]
 
     def __str__(self):
         """
@@ -528,6 +1120,106 @@ class Event(models.Model):
 
         return "(ID = {}) Event '{}' in '{}', hosted by '{}'".format(str(self.pk), self.title, self.location, self.host.user.username)
 
+    def join(self, profile):
+        """
+        Adds specified Profile to the participants of the event,
+        and updates the participant count.
+
+        Parameters
+        ----------
+        profile : Profile
+            The Profile instance joining the event.
+
+        Returns
+        -------
+        bool
+            True, if the Profile joined. False, if it already was
+            a participant.
+        """
+
+        from firstfloor import counters
+        return counters.join_event(self, profile)
+
+    def leave(self, profile):
+        """
+        Removes specified Profile from the participants of the event,
+        and updates the participant count.
+
+        Parameters
+        ----------
+        profile : Profile
+            The Profile instance leaving the event.
+
+        Returns
+        -------
+        bool
+            True, if the Profile left. False, if it was not
+            a participant.
+        """
+
+        from firstfloor import counters
+        return counters.leave_event(self, profile)
+
+class AccountDeletion(models.Model):
+    """
+    Job of deleting an account: a Profile, its User and everything
+    that depends on them. Jobs are carried out in the background, a
+    chunk of rows at a time (see firstfloor.deletion).
+
+    ...
+
+    Attributes
+    ----------
+    profile : Profile
+        The Profile instance being deleted. None, once it has been.
+    username : string
+        Username of the account, kept for the record.
+    requested_date : datetime
+        The time at which the deletion was requested.
+    completed_date : datetime
+        The time at which the account was deleted. None, until then.
+    stage : string
+        Stage of the deletion that was last worked on.
+    deleted_rows : int
+        Number of rows deleted (or detached) so far.
+    attempts : int
+        Number of times the job has been worked on.
+    error : string
+        Error of the latest failed attempt, if any.
+    """
+
+    profile = models.ForeignKey(Profile, on_delete=models.SET_NULL, related_name="deletion_jobs", blank=True, null=True)
+    username = models.CharField(max_length=150)
+    requested_date = models.DateTimeField(default=timezone.now)
+    completed_date = models.DateTimeField(blank=True, null=True)
+    stage = models.CharField(max_length=50, blank=True)
+    deleted_rows = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Pending jobs, oldest first.
+            models.Index(fields=["requested_date", "id"], name="accountdeletion_pending", condition=models.Q(completed_date__isnull=True)),
+        ]
+
+    def __str__(self):
+        """
+        Getter for string representation of the deletion job.
+
+        Returns
+        -------
+        string
+            String representation of the deletion job:
+            '(ID = x) Deletion of y: z', where
+            x = Job ID
+            y = Username
+            z = Stage, or 'completed'
+        """
+
+        return "(ID = {}) Deletion of {}: {}".format(str(self.pk), self.username,
+                                                    "completed" if self.completed_date else self.stage or "pending")
+
 # TODO: "thirdfloor Models"
 # - Forum
 # - ForumPost
@@ -0,0 +1,162 @@
+"""
+Keyset pagination.
+
+Pages are fetched by filtering on the ordering values of the last
+row of the previous page, instead of skipping rows with an offset.
+With an index that matches the ordering, fetching any page costs the
+same regardless of how deep into the results it is.
+
+Cursors are opaque, URL-safe strings that hold the ordering values
+of the last row of a page.
+"""
+
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder for cursors. Unlike DjangoJSONEncoder, times keep their
+    microseconds, as rows that differ by less than a millisecond would
+    otherwise be skipped or repeated.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """
+    Encodes ordering values into a cursor.
+
+    Parameters
+    ----------
+    values : list
+        Ordering values of the last row of a page.
+
+    Returns
+    -------
+    string
+        URL-safe cursor.
+    """
+
+    data = json.dumps(values, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor into ordering values.
+
+    Parameters
+    ----------
+    cursor : string
+        Cursor created with encode_cursor.
+
+    Returns
+    -------
+    list
+        Ordering values stored in the cursor.
+
+    Raises
+    ------
+    ValueError
+        If the cursor is malformed.
+    """
+
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding).decode("utf-8"))
+    except (TypeError, ValueError) as error:
+        raise ValueError("Malformed cursor.") from error
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor.")
+    return values
+
+
+def keyset_page(queryset, ordering, cursor=None, limit=20):
+    """
+    Fetches a page of rows from a queryset.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Rows to paginate. Can be a queryset of model instances
+        or of dictionaries (via values()).
+    ordering : tuple of string
+        Names of the fields to order by, prefixed with '-' for
+        descending order. The last field must be unique, such as 'id'.
+        Only fields of the model itself (or annotations) are supported.
+    cursor : string
+        Cursor of the previous page. If None, the first page is fetched.
+    limit : int
+        Maximum number of rows on the page.
+
+    Returns
+    -------
+    (list, string)
+        Rows on the page, and the cursor of the next page.
+        The cursor is None if there are no more rows.
+
+    Raises
+    ------
+    ValueError
+        If the cursor is malformed or does not match the ordering.
+    """
+
+    fields = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError("Cursor does not match the ordering.")
+        values = [_to_python(queryset.model, name, value) for (name, _), value in zip(fields, values)]
+        queryset = queryset.filter(_after(fields, values))
+
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([_value_of(rows[-1], name) for name, _ in fields])
+    return rows, next_cursor
+
+
+def _after(fields, values):
+    # (a, b, c) > (x, y, z) is expanded into
+    # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+    # with the comparison flipped for descending fields. The redundant
+    # bound a >= x lets the database seek into the index at the cursor,
+    # instead of scanning past the rows of the previous pages.
+    condition = Q()
+    equal = {}
+    for (name, descending), value in zip(fields, values):
+        lookup = "{}__{}".format(name, "lt" if descending else "gt")
+        condition |= Q(**equal, **{lookup: value})
+        equal[name] = value
+    (name, descending), value = fields[0], values[0]
+    return Q(**{"{}__{}".format(name, "lte" if descending else "gte"): value}) & condition
+
+
+def _to_python(model, name, value):
+    try:
+        field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return value
+    try:
+        return field.to_python(value)
+    except ValidationError as error:
+        raise ValueError("Malformed cursor.") from error
+
+
+def _value_of(row, name):
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
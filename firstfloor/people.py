@@ -0,0 +1,131 @@
+"""
+Type-ahead search for people.
+
+Names of Profiles are kept as normalized keys in the ProfileNameKey
+table (see firstfloor.signals for maintenance). Finding people by the
+beginning of their name is a range scan over the index of the keys:
+every key starting with prefix p lies in the range [p, p + U+10FFFF).
+The Profiles and Users of the matches are fetched in the same query.
+"""
+
+import unicodedata
+
+from django.urls import reverse
+
+from firstfloor.models import ProfileNameKey
+
+# Sorts after every character, closing the range of keys of a prefix.
+MAX_CHARACTER = "\U0010ffff"
+
+# Maximum length of keys and prefixes.
+MAX_KEY_LENGTH = 300
+
+
+def normalize_name(name):
+    """
+    Normalizes a name for prefix matching: accents are removed,
+    case is folded and whitespace is collapsed.
+
+    Parameters
+    ----------
+    name : string
+        Name to normalize.
+
+    Returns
+    -------
+    string
+        Normalized name.
+    """
+
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(character for character in decomposed if not unicodedata.combining(character))
+    return " ".join(stripped.casefold().split())[:MAX_KEY_LENGTH]
+
+
+def name_keys_for(profile):
+    """
+    Getter for the name keys of a Profile. Private Profiles can only
+    be found by their username.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance.
+
+    Returns
+    -------
+    set of string
+        Normalized names of the Profile.
+    """
+
+    user = profile.user
+    names = [user.username]
+    if not profile.private:
+        names.extend([user.first_name, user.last_name, "{} {}".format(user.first_name, user.last_name)])
+    return {key for key in (normalize_name(name) for name in names) if key}
+
+
+def update_name_keys(profile):
+    """
+    Replaces the name keys of a Profile.
+
+    Parameters
+    ----------
+    profile : Profile
+        The Profile instance.
+    """
+
+    ProfileNameKey.objects.filter(profile=profile).delete()
+    ProfileNameKey.objects.bulk_create([ProfileNameKey(profile=profile, key=key) for key in name_keys_for(profile)])
+
+
+def find_people(prefix, limit=10):
+    """
+    Finds Profiles whose username, first name, last name or full name
+    starts with the given prefix, in alphabetical order of the matching
+    name. Only the username of private Profiles is disclosed.
+
+    Parameters
+    ----------
+    prefix : string
+        Beginning of a name.
+    limit : int
+        Maximum number of Profiles to return.
+
+    Returns
+    -------
+    list of dict
+        Matching Profiles, with their 'username', 'name', 'location'
+        and 'url'. Name and location are None for private Profiles.
+    """
+
+    prefix = normalize_name(prefix)
+    if not prefix:
+        return []
+
+    # A Profile can have several matching keys; some extra rows are
+    # fetched so that duplicates do not cut the results short.
+    keys = (ProfileNameKey.objects
+            .filter(key__gte=prefix, key__lt=prefix + MAX_CHARACTER)
+            .order_by("key", "profile_id")
+            .select_related("profile__user")
+            .only("key", "profile__private", "profile__location",
+                  "profile__user__username", "profile__user__first_name", "profile__user__last_name"))
+
+    people = []
+    seen = set()
+    for name_key in keys[:limit * 4]:
+        profile = name_key.profile
+        if profile.pk in seen:
+            continue
+        seen.add(profile.pk)
+        user = profile.user
+        people.append({
+            "username": user.username,
+            "name": None if profile.private else user.get_full_name() or None,
+            "location": None if profile.private else profile.location or None,
+            "url": reverse("firstfloor:profile", args=[user.username]),
+        })
+        if len(people) >= limit:
+            break
+    return people
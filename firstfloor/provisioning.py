@@ -0,0 +1,373 @@
+"""
+Bulk provisioning of accounts.
+
+Existing communities are brought in from CSV or JSON Lines files with
+one account per line (manage.py import_accounts). Creating accounts one
+by one (as firstfloor.views.new_account does) hashes every password in
+turn and writes every row separately. Instead, accounts are imported in
+batches:
+1. Accounts whose username is taken already are skipped, before any
+   hashing, so an interrupted import can simply be run again.
+2. Passwords are hashed in a pool of processes. Passwords that have been
+   hashed already (such as those exported from another Django site) are
+   taken as is.
+3. Users, Profiles, their name keys and their search documents are
+   inserted with bulk inserts, in one transaction per batch.
+
+Friendships refer to accounts by username, possibly to accounts later
+in the file, so they are imported in a second pass once every account
+exists. Existing friendships are left as is, so the second pass can be
+run again too.
+
+Fields of an account (only username is required):
+- username, email, first_name, last_name
+- password: Password in plain text. Hashed during the import.
+- password_hash: Password hashed already, in the format of Django.
+  Accounts without either have an unusable password.
+- description, location, birthdate (YYYY-MM-DD), private
+- date_joined: ISO 8601 timestamp. Defaults to the time of the import.
+- friends: Usernames of friends. In CSV files, separated by semicolons.
+Numbers are taken as text. Accounts with values of other types, or
+values longer than their columns allow, are invalid and reported
+rather than imported.
+"""
+
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from firstfloor.friendgraph import get_friend_graph
+from firstfloor.models import Profile, ProfileNameKey, FriendRequest
+from firstfloor.people import name_keys_for
+from firstfloor.search import document_for, get_search_backend
+
+Friendship = Profile.friend_list.through
+
+# Number of accounts inserted per transaction.
+BATCH_SIZE = 1000
+
+# Number of passwords sent to a hashing process at a time.
+HASH_CHUNK_SIZE = 16
+
+FORMATS = ("csv", "jsonl")
+
+_TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+
+
+def read_accounts(path, format=None):
+    """
+    Reads accounts from a file, one line at a time.
+
+    Parameters
+    ----------
+    path : string
+        Path of the file, encoded in UTF-8.
+    format : string
+        'csv' (with a header row) or 'jsonl'. Deduced from the file
+        extension if None.
+
+    Returns
+    -------
+    generator of (int, dict)
+        Line number and fields of each account.
+    """
+
+    format = format or ("jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    if format not in FORMATS:
+        raise ValueError("Unknown format {!r}.".format(format))
+
+    with open(path, encoding="utf-8", newline="") as file:
+        if format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(file, 1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError:
+                        yield line_number, None
+
+
+def import_accounts(records, batch_size=BATCH_SIZE, processes=None, progress=None, error=None):
+    """
+    Creates Users and Profiles for accounts, in batches. Accounts with
+    taken usernames are skipped. Friendships are not imported; see
+    import_friendships.
+
+    Parameters
+    ----------
+    records : iterable of (int, dict)
+        Line numbers and fields of the accounts, as from read_accounts.
+    batch_size : int
+        Number of accounts inserted per transaction.
+    processes : int
+        Number of processes hashing passwords. If None, one per CPU.
+        If 0, passwords are hashed in this process.
+    progress : callable
+        Called with the statistics after every batch.
+    error : callable
+        Called with the line number and a message for every invalid
+        account.
+
+    Returns
+    -------
+    dict
+        Number of accounts 'read', 'created', 'skipped' and 'invalid'.
+    """
+
+    stats = {"read": 0, "created": 0, "skipped": 0, "invalid": 0}
+    with _password_hasher(processes) as hash_passwords:
+        for batch in _batches(records, batch_size):
+            accounts = []
+            for line_number, record in batch:
+                stats["read"] += 1
+                try:
+                    accounts.append(_account(record))
+                except ValueError as invalid:
+                    stats["invalid"] += 1
+                    if error is not None:
+                        error(line_number, str(invalid))
+
+            new = _new_accounts(accounts)
+            stats["skipped"] += len(accounts) - len(new)
+            accounts = new
+            if accounts:
+                _hash(accounts, hash_passwords)
+                _create([profile for profile, _ in accounts])
+                stats["created"] += len(accounts)
+            if progress is not None:
+                progress(dict(stats))
+    return stats
+
+
+def import_friendships(records, batch_size=BATCH_SIZE, progress=None):
+    """
+    Adds the friendships of accounts, along with accepted friend
+    requests. Friends that do not exist, and friendships that exist
+    already, are skipped.
+
+    Parameters
+    ----------
+    records : iterable of (int, dict)
+        Line numbers and fields of the accounts, as from read_accounts.
+    batch_size : int
+        Number of accounts handled per transaction.
+    progress : callable
+        Called with the statistics after every batch.
+
+    Returns
+    -------
+    dict
+        Number of accounts 'read', friendships 'created', and listed
+        friends 'skipped' (missing, repeated, or friends already).
+    """
+
+    stats = {"read": 0, "created": 0, "skipped": 0}
+    now = timezone.now()
+    for batch in _batches(records, batch_size):
+        stats["read"] += len(batch)
+        pairs = set()
+        for _, record in batch:
+            if not isinstance(record, dict):
+                continue
+            username = User.normalize_username(str(record.get("username") or "").strip())
+            for friend in _friends(record.get("friends")):
+                if friend != username:
+                    pairs.add((username, friend))
+        if not pairs:
+            continue
+
+        usernames = {username for pair in pairs for username in pair}
+        profile_ids = dict(Profile.objects.filter(user__username__in=usernames).values_list("user__username", "pk"))
+        linked = {(min(first, second), max(first, second))
+                  for first, second in ((profile_ids.get(first), profile_ids.get(second)) for first, second in pairs)
+                  if first is not None and second is not None}
+        # Friends of the Profiles are fetched whole: filtering both
+        # columns with IN would probe every combination of the two.
+        existing = set(Friendship.objects.filter(from_profile_id__in={first for first, _ in linked})
+                       .values_list("from_profile_id", "to_profile_id"))
+        new = sorted(pair for pair in linked if pair not in existing)
+
+        with transaction.atomic():
+            Friendship.objects.bulk_create(
+                [Friendship(from_profile_id=first, to_profile_id=second) for first, second in new]
+                + [Friendship(from_profile_id=second, to_profile_id=first) for first, second in new],
+                ignore_conflicts=True)
+            FriendRequest.objects.bulk_create(
+                [FriendRequest(sender_id=first, receiver_id=second, status=True, request_date=now)
+                 for first, second in new],
+                ignore_conflicts=True)
+        get_friend_graph().invalidate(*{profile_id for pair in new for profile_id in pair})
+
+        stats["created"] += len(new)
+        stats["skipped"] += len(pairs) - len(new)
+        if progress is not None:
+            progress(dict(stats))
+    return stats
+
+
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _account(record):
+    # Validates the fields of an account, and builds its User and
+    # Profile. The password is returned as is, to be hashed in bulk.
+    if not isinstance(record, dict):
+        raise ValueError("Not an account.")
+    username = User.normalize_username(_text(record, "username", "").strip())
+    if not username:
+        raise ValueError("Username is missing.")
+    try:
+        User._meta.get_field("username").run_validators(username)
+    except ValidationError as invalid:
+        raise ValueError("Invalid username {!r}: {}".format(username, " ".join(invalid.messages)))
+
+    password_hash = _text(record, "password_hash", username) or None
+    if password_hash and not password_hash.startswith(UNUSABLE_PASSWORD_PREFIX):
+        try:
+            identify_hasher(password_hash)
+        except ValueError:
+            raise ValueError("Unknown password hash of {!r}.".format(username))
+
+    birthdate = _text(record, "birthdate", username) or None
+    if birthdate is not None:
+        try:
+            birthdate = parse_date(birthdate)
+        except ValueError:
+            birthdate = None
+        if birthdate is None:
+            raise ValueError("Invalid birthdate of {!r}.".format(username))
+
+    date_joined = _text(record, "date_joined", username) or None
+    if date_joined is not None:
+        try:
+            date_joined = parse_datetime(date_joined)
+        except ValueError:
+            date_joined = None
+        if date_joined is None:
+            raise ValueError("Invalid date_joined of {!r}.".format(username))
+        if timezone.is_naive(date_joined):
+            date_joined = timezone.make_aware(date_joined)
+
+    user = User(username=username,
+                email=User.objects.normalize_email(_text(record, "email", username)),
+                first_name=_text(record, "first_name", username),
+                last_name=_text(record, "last_name", username),
+                password=password_hash,
+                date_joined=date_joined or timezone.now())
+    profile = Profile(user=user,
+                      description=_text(record, "description", username),
+                      location=_text(record, "location", username),
+                      birthdate=birthdate,
+                      private=_boolean(record.get("private")))
+    # Values too long for their columns would fail the whole batch
+    # on databases that enforce lengths.
+    _check_lengths(user, ["email", "first_name", "last_name", "password"], username)
+    _check_lengths(profile, ["description", "location"], username)
+    return profile, _text(record, "password", username) or None
+
+
+def _text(record, name, username):
+    # Text fields of JSON Lines files may hold numbers, which are taken
+    # as text, or other values, which make the account invalid.
+    value = record.get(name)
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise ValueError("Invalid {} of {!r}.".format(name, username or None))
+    return value
+
+
+def _check_lengths(instance, names, username):
+    for name in names:
+        max_length = instance._meta.get_field(name).max_length
+        value = getattr(instance, name)
+        if value is not None and max_length is not None and len(value) > max_length:
+            raise ValueError("{} of {!r} is longer than {} characters.".format(name, username, max_length))
+
+
+def _new_accounts(accounts):
+    # Drops accounts whose username is taken, or repeated in the batch.
+    taken = set(User.objects.filter(username__in=[profile.user.username for profile, _ in accounts])
+                .values_list("username", flat=True))
+    new = []
+    for profile, password in accounts:
+        if profile.user.username not in taken:
+            taken.add(profile.user.username)
+            new.append((profile, password))
+    return new
+
+
+def _hash(accounts, hash_passwords):
+    # Fills in the password of the Users without a hashed password.
+    unhashed = [(profile.user, password) for profile, password in accounts if profile.user.password is None]
+    hashed = hash_passwords([password for _, password in unhashed])
+    for (user, _), password in zip(unhashed, hashed):
+        user.password = password
+
+
+def _create(accounts):
+    users = [profile.user for profile in accounts]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        # Bulk inserts do not return IDs on every backend.
+        user_ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list("username", "pk"))
+        for profile in accounts:
+            profile.user.pk = user_ids[profile.user.username]
+            # Assigned again to set user_id, keeping the User cached.
+            profile.user = profile.user
+        Profile.objects.bulk_create(accounts)
+        profile_ids = dict(Profile.objects.filter(user_id__in=user_ids.values()).values_list("user_id", "pk"))
+        for profile in accounts:
+            profile.pk = profile_ids[profile.user_id]
+
+        ProfileNameKey.objects.bulk_create(
+            [ProfileNameKey(profile_id=profile.pk, key=key) for profile in accounts for key in name_keys_for(profile)])
+        get_search_backend().index([document_for(profile) for profile in accounts])
+
+
+@contextmanager
+def _password_hasher(processes):
+    # Yields a function hashing a list of passwords. None stands for
+    # an unusable password, which takes no time to make.
+    if processes == 0:
+        yield lambda passwords: [make_password(password) for password in passwords]
+        return
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield lambda passwords: list(executor.map(make_password, passwords, chunksize=HASH_CHUNK_SIZE))
+
+
+def _friends(friends):
+    if not friends:
+        return []
+    if isinstance(friends, str):
+        friends = friends.split(";")
+    elif not isinstance(friends, list):
+        return []
+    return [User.normalize_username(str(friend).strip()) for friend in friends if str(friend).strip()]
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in _TRUE_VALUES
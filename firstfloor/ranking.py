@@ -0,0 +1,292 @@
+"""
+Time-decayed popularity of discussion groups and events.
+
+Popularity is ranked with forward decay: every activity adds its weight
+to the score of its group or event, scaled by exp(λ (t - L)), where t
+is the time of the activity and L a fixed landmark. Scores never have
+to be decayed in the database, since older activity simply counts
+less than newer activity, and can be maintained with a single
+F-expression per activity (see firstfloor.counters). The decayed
+score at time T is score * exp(-λ (T - L)). λ is set by
+POPULARITY_HALF_LIFE: activity loses half of its weight per half-life.
+
+Activities and their weights:
+- Creation of the group or event: CREATION_WEIGHT.
+- A Profile joining: JOIN_WEIGHT.
+- A discussion in the group: DISCUSSION_WEIGHT.
+- A comment in a discussion of the group: COMMENT_WEIGHT.
+
+Scores grow by a factor of two per half-life past the landmark, and
+floats overflow after about 1000 half-lives (some 19 years with
+a half-life of a week). recompute_popularity rebuilds the scores from
+the database, which is also how a new landmark is taken into use.
+
+The top groups and events are kept in a cache as lists of dictionaries
+(see Leaderboards), refreshed by manage.py refresh_leaderboards,
+so that serving them costs one cache lookup. The cache is shared by
+every process, so that the refreshes reach the web workers.
+"""
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from firstfloor.models import DiscussionGroup, Discussion, Comment, Event
+
+CREATION_WEIGHT = 1.0
+JOIN_WEIGHT = 1.0
+DISCUSSION_WEIGHT = 2.0
+COMMENT_WEIGHT = 0.5
+
+# Default landmark of the forward decay.
+LANDMARK = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def decay_rate():
+    """
+    Getter for the decay rate λ, per second.
+
+    Returns
+    -------
+    float
+        ln 2 divided by POPULARITY_HALF_LIFE.
+    """
+
+    return math.log(2) / getattr(settings, "POPULARITY_HALF_LIFE", 7 * 24 * 3600)
+
+
+def weight_at(weight, when):
+    """
+    Getter for the forward-decayed weight of an activity.
+
+    Parameters
+    ----------
+    weight : float
+        Weight of the activity.
+    when : datetime
+        Time of the activity.
+
+    Returns
+    -------
+    float
+        Amount to add to the score of the group or event.
+    """
+
+    return weight * math.exp(decay_rate() * _seconds_since_landmark(when))
+
+
+def decayed(score, now=None):
+    """
+    Getter for the popularity that a score stands for at a given time.
+
+    Parameters
+    ----------
+    score : float
+        Forward-decayed score, as stored.
+    now : datetime
+        Time to decay the score to. Defaults to the current time.
+
+    Returns
+    -------
+    float
+        Sum of the weights of the activities, decayed to the time.
+    """
+
+    return score * math.exp(-decay_rate() * _seconds_since_landmark(now or timezone.now()))
+
+
+def recompute_popularity():
+    """
+    Rebuilds the scores of every group and event from the database.
+    Times at which Profiles joined are not recorded, so joins are
+    counted at the last activity of the group or event.
+    Profiles leaving do not lower the scores; their joins decay away.
+
+    Returns
+    -------
+    int
+        Number of groups and events scored.
+    """
+
+    groups = {}
+    for pk, creation_date, participant_count, last_activity in DiscussionGroup.objects.values_list(
+            "pk", "creation_date", "participant_count", "last_activity").iterator():
+        groups[pk] = (weight_at(CREATION_WEIGHT, creation_date)
+                      + weight_at(JOIN_WEIGHT, last_activity or creation_date) * participant_count)
+    discussions = Discussion.objects.filter(related_group__isnull=False).values_list("related_group", "creation_date")
+    for group_id, creation_date in discussions.iterator():
+        groups[group_id] += weight_at(DISCUSSION_WEIGHT, creation_date)
+    comments = Comment.objects.filter(related_discussion__related_group__isnull=False).values_list(
+        "related_discussion__related_group", "creation_date")
+    for group_id, creation_date in comments.iterator():
+        groups[group_id] += weight_at(COMMENT_WEIGHT, creation_date)
+
+    # Events do not record when they were created either; events
+    # that have yet to start are counted as created now.
+    now = timezone.now()
+    events = []
+    for pk, start_date, participant_count, last_activity in Event.objects.values_list(
+            "pk", "start_date", "participant_count", "last_activity").iterator():
+        created = min(start_date, now)
+        events.append(Event(pk=pk, popularity=weight_at(CREATION_WEIGHT, created)
+                            + weight_at(JOIN_WEIGHT, last_activity or created) * participant_count))
+
+    DiscussionGroup.objects.bulk_update([DiscussionGroup(pk=pk, popularity=score) for pk, score in groups.items()],
+                                        ["popularity"], batch_size=500)
+    Event.objects.bulk_update(events, ["popularity"], batch_size=500)
+    return len(groups) + len(events)
+
+
+class Leaderboards:
+    """
+    Top groups and events by popularity, kept in a cache.
+
+    ...
+
+    Attributes
+    ----------
+    cache : BaseCache
+        The cache that the leaderboards are kept in.
+    size : int
+        Number of entries per leaderboard.
+    timeout : int
+        Number of seconds that leaderboards are cached for. Should be
+        longer than the interval at which they are refreshed.
+    """
+
+    key = "leaderboard:{}"
+
+    def __init__(self, cache, size=20, timeout=600):
+        self.cache = cache
+        self.size = size
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Creates leaderboards as configured in the settings:
+        LEADERBOARD_CACHE names the cache to use, LEADERBOARD_SIZE sets
+        the number of entries and LEADERBOARD_TIMEOUT the cache timeout
+        in seconds. The cache has to be shared by every process, as
+        the leaderboards are refreshed by another process.
+
+        Returns
+        -------
+        Leaderboards
+            The configured leaderboards.
+        """
+
+        cache = caches[getattr(settings, "LEADERBOARD_CACHE", "default")]
+        if isinstance(cache, LocMemCache):
+            raise ImproperlyConfigured("LEADERBOARD_CACHE must be shared by every process, not a local-memory cache.")
+        return cls(cache,
+                   getattr(settings, "LEADERBOARD_SIZE", 20),
+                   getattr(settings, "LEADERBOARD_TIMEOUT", 600))
+
+    def groups(self):
+        """
+        Getter for the most popular groups that are neither invitation
+        only nor behind a passphrase. Computed on the spot if the cache does not have them.
+
+        Returns
+        -------
+        list of dict
+            Groups with their 'id', 'title', 'description',
+            'participant_count', 'discussion_count', 'comment_count',
+            'last_activity' and 'popularity' (decayed to the time of
+            computing), most popular first.
+        """
+
+        return self._get("groups", self._top_groups)
+
+    def events(self):
+        """
+        Getter for the most popular public events that have neither
+        ended nor been cancelled. Computed on the spot if the cache does
+        not have them. Events that end are left out upon the next refresh.
+
+        Returns
+        -------
+        list of dict
+            Events with their 'id', 'title', 'location', 'start_date',
+            'end_date', 'participant_count' and 'popularity' (decayed to
+            the time of computing), most popular first.
+        """
+
+        return self._get("events", self._top_events)
+
+    def refresh(self):
+        """
+        Recomputes both leaderboards and stores them in the cache.
+
+        Returns
+        -------
+        dict
+            Number of entries, keyed by leaderboard.
+        """
+
+        leaderboards = {"groups": self._top_groups(), "events": self._top_events()}
+        self.cache.set_many({self.key.format(name): entries for name, entries in leaderboards.items()}, self.timeout)
+        return {name: len(entries) for name, entries in leaderboards.items()}
+
+    def _get(self, name, compute):
+        entries = self.cache.get(self.key.format(name))
+        if entries is None:
+            entries = compute()
+            self.cache.set(self.key.format(name), entries, self.timeout)
+        return entries
+
+    def _top_groups(self):
+        groups = (DiscussionGroup.objects
+                  .filter(invitation_required=False, passphrase="")
+                  .order_by("-popularity", "-id")
+                  .values("id", "title", "description", "participant_count", "discussion_count",
+                          "comment_count", "last_activity", "popularity"))
+        return _decay_entries(groups[:self.size])
+
+    def _top_events(self):
+        events = (Event.objects
+                  .filter(private=False, cancelled=False, end_date__gt=timezone.now())
+                  .order_by("-popularity", "-id")
+                  .values("id", "title", "location", "start_date", "end_date", "participant_count", "popularity"))
+        return _decay_entries(events[:self.size])
+
+
+_leaderboards = None
+
+
+def get_leaderboards():
+    """
+    Getter for the leaderboards of the process.
+    The leaderboards are created from the settings on first use.
+
+    Returns
+    -------
+    Leaderboards
+        The leaderboards of the process.
+    """
+
+    global _leaderboards
+    if _leaderboards is None:
+        _leaderboards = Leaderboards.from_settings()
+    return _leaderboards
+
+
+def _decay_entries(rows):
+    now = timezone.now()
+    entries = list(rows)
+    for entry in entries:
+        entry["popularity"] = decayed(entry["popularity"], now)
+    return entries
+
+
+def _seconds_since_landmark(when):
+    landmark = getattr(settings, "POPULARITY_LANDMARK", LANDMARK)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return (when - landmark).total_seconds()
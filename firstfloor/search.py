@@ -0,0 +1,699 @@
+"""
+Full-text search over Profiles, discussion groups, discussions,
+events and comments.
+
+Searchable objects are kept in an inverted index that is maintained
+incrementally whenever the objects are saved or deleted (see
+firstfloor.signals). The index itself is provided by a backend:
+- SQLiteSearchBackend: FTS5 virtual table, ranked with bm25.
+- PostgresSearchBackend: tsvector column with a GIN index,
+  ranked with ts_rank.
+
+By default, the backend is chosen based on the database vendor.
+The SEARCH_BACKEND setting can name another backend class.
+
+Results are ordered by score (lower is better), and paginated with
+cursors that hold the score and row ID of the last result, and the
+candidate windows of the kinds searched. To keep the cost of a query
+bounded regardless of how common its words are, only the newest
+CANDIDATE_LIMIT matches of each kind are ranked and counted into
+facets, so that common words in one kind (comments) cannot push the
+matches of the others out of the results.
+
+Discussions and comments of groups that require an invitation or a
+passphrase are left out of the index, as they are only readable by
+the participants of their groups.
+"""
+
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from firstfloor.models import Profile, DiscussionGroup, Discussion, Comment, Event
+from firstfloor.pagination import encode_cursor, decode_cursor
+
+# Codes of the kinds of searchable objects. Row IDs of the index are
+# derived from these, so they must never change.
+KINDS = {
+    "profile": 1,
+    "group": 2,
+    "discussion": 3,
+    "event": 4,
+    "comment": 5,
+}
+KIND_MODELS = {
+    "profile": Profile,
+    "group": DiscussionGroup,
+    "discussion": Discussion,
+    "event": Event,
+    "comment": Comment,
+}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+
+# Maximum number of words taken into account from a query.
+MAX_TERMS = 8
+
+# Maximum number of matches of each kind (newest first) that are
+# ranked per query.
+CANDIDATE_LIMIT = 5000
+
+Document = namedtuple("Document", ["kind", "object_id", "title", "body"])
+SearchResult = namedtuple("SearchResult", ["kind", "object_id", "title", "snippet", "score"])
+SearchPage = namedtuple("SearchPage", ["results", "next_cursor", "facets"])
+
+
+def row_id(kind, object_id):
+    """
+    Getter for the index row ID of an object.
+
+    Parameters
+    ----------
+    kind : string
+        Kind of the object (see KINDS).
+    object_id : int
+        Primary key of the object.
+
+    Returns
+    -------
+    int
+        Row ID of the object in the index.
+    """
+
+    return object_id * 8 + KINDS[kind]
+
+
+def document_for(instance):
+    """
+    Builds the search document of a model instance.
+
+    Parameters
+    ----------
+    instance : Model
+        Instance of a searchable model.
+
+    Returns
+    -------
+    Document
+        Search document of the instance. None, if the instance
+        should not be searchable (such as private events, and the
+        discussions and comments of restricted groups).
+    """
+
+    if isinstance(instance, Profile):
+        if instance.private:
+            # Only the username of a private Profile is disclosed.
+            return Document("profile", instance.pk, instance.user.username, "")
+        return Document("profile", instance.pk, instance.user.username,
+                        " ".join(part for part in (instance.description, instance.location) if part))
+    if isinstance(instance, DiscussionGroup):
+        return Document("group", instance.pk, instance.title, instance.description)
+    if isinstance(instance, Discussion):
+        if is_restricted(instance.related_group):
+            return None
+        return Document("discussion", instance.pk, instance.title, instance.description or "")
+    if isinstance(instance, Event):
+        if instance.private or instance.cancelled:
+            return None
+        return Document("event", instance.pk, instance.title,
+                        " ".join(part for part in (instance.description, instance.location) if part))
+    if isinstance(instance, Comment):
+        discussion = instance.related_discussion
+        if discussion is not None and is_restricted(discussion.related_group):
+            return None
+        return Document("comment", instance.pk, "", instance.contents)
+    raise TypeError("{} is not searchable.".format(type(instance).__name__))
+
+
+def is_restricted(group):
+    """
+    Getter for whether the discussions of a group are hidden from
+    everyone but its participants.
+
+    Parameters
+    ----------
+    group : DiscussionGroup
+        The group, or None.
+
+    Returns
+    -------
+    bool
+        True, if the group requires an invitation or a passphrase.
+    """
+
+    return group is not None and (group.invitation_required or bool(group.passphrase))
+
+
+def kind_of(instance):
+    """
+    Getter for the kind of a model instance.
+
+    Returns
+    -------
+    string
+        Kind of the instance (see KINDS), or None if the instance
+        is not searchable.
+    """
+
+    for kind, model in KIND_MODELS.items():
+        if isinstance(instance, model):
+            return kind
+    return None
+
+
+def query_terms(query):
+    """
+    Splits a query into normalized words.
+
+    Parameters
+    ----------
+    query : string
+        Query as written by the user.
+
+    Returns
+    -------
+    list of string
+        Lowercase words of the query, at most MAX_TERMS.
+    """
+
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """
+    Base class for search index backends.
+
+    ...
+
+    Attributes
+    ----------
+    connection : DatabaseWrapper
+        The database connection that the index is kept in.
+    table : string
+        Name of the index table.
+    """
+
+    table = "firstfloor_search"
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_schema(self):
+        """
+        Creates the index table.
+        """
+
+        raise NotImplementedError
+
+    def drop_schema(self):
+        """
+        Removes the index table.
+        """
+
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS {}".format(self.table))
+
+    def index(self, documents):
+        """
+        Adds or replaces documents in the index.
+
+        Parameters
+        ----------
+        documents : list<Document>
+            Documents to index.
+        """
+
+        raise NotImplementedError
+
+    def remove(self, keys):
+        """
+        Removes documents from the index.
+
+        Parameters
+        ----------
+        keys : list of (string, int)
+            Documents to remove, as (kind, object ID) -tuples.
+        """
+
+        if not keys:
+            return
+        row_ids = [row_id(kind, object_id) for kind, object_id in keys]
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} WHERE {} IN ({})".format(self.table, self.row_id_column, ", ".join(["%s"] * len(row_ids))),
+                row_ids)
+
+    def clear(self):
+        """
+        Removes all documents from the index.
+        """
+
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {}".format(self.table))
+
+    def search(self, query, kinds=None, cursor=None, limit=20):
+        """
+        Searches the index.
+
+        Parameters
+        ----------
+        query : string
+            Query as written by the user. Every word has to match,
+            either fully or as a prefix.
+        kinds : list of string
+            Kinds of objects to search for. If None, all kinds
+            are searched.
+        cursor : string
+            Cursor of the previous page. If None, the first page
+            is fetched.
+        limit : int
+            Maximum number of results on the page.
+
+        Returns
+        -------
+        (list<SearchResult>, string)
+            Results on the page, best first, and the cursor of the
+            next page. The cursor is None if there are no more results.
+
+        Raises
+        ------
+        ValueError
+            If the cursor is malformed, or belongs to a search of
+            other kinds.
+        """
+
+        terms = query_terms(query)
+        kinds = [kind for kind in (kinds or KINDS) if kind in KINDS]
+        if not terms or not kinds:
+            return [], None
+
+        after = None
+        if cursor:
+            after = decode_cursor(cursor)
+            if len(after) != 3 or not isinstance(after[2], list):
+                raise ValueError("Malformed cursor.")
+            try:
+                floors = {int(code): int(floor) for code, floor in after[2]}
+            except (TypeError, ValueError):
+                raise ValueError("Malformed cursor.")
+            # The floors are keyed by the kinds that the cursor pages
+            # through, and a cursor only goes on with the same kinds.
+            if set(floors) != {KINDS[kind] for kind in kinds}:
+                raise ValueError("Cursor of a search of other kinds.")
+        else:
+            # The candidate windows are fixed on the first page, and
+            # carried over to the following pages in the cursor.
+            floors = self._candidate_floors(terms, kinds)
+
+        rows = self._search(terms, floors, after, limit + 1)
+        results = [SearchResult(KIND_NAMES[code], object_id, title, snippet, score)
+                   for _, code, object_id, title, snippet, score in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor([rows[limit - 1][5], rows[limit - 1][0], sorted(floors.items())])
+        return results, next_cursor
+
+    def facets(self, query):
+        """
+        Counts the matches of a query per kind of object.
+
+        Parameters
+        ----------
+        query : string
+            Query as written by the user.
+
+        Returns
+        -------
+        dict
+            Number of matches among the newest CANDIDATE_LIMIT
+            matches of each kind, keyed by kind. Kinds without matches
+            are omitted.
+        """
+
+        terms = query_terms(query)
+        if not terms:
+            return {}
+        floors = self._candidate_floors(terms, list(KINDS))
+        return {KIND_NAMES[code]: count for code, count in self._facets(terms, floors)}
+
+    def _candidate_floors(self, terms, kinds):
+        # Returns the lowest row ID among the newest CANDIDATE_LIMIT
+        # matches of each kind, or 0 if there are fewer matches than
+        # that, keyed by kind code. Row IDs of a kind grow with object
+        # IDs, so each floor is found by walking the matches of the
+        # kind backwards.
+        match, match_parameters = self._match_condition(terms)
+        subqueries = []
+        parameters = []
+        for kind in kinds:
+            subqueries.append("(SELECT {id} FROM {table} WHERE {match} AND kind = %s ORDER BY {id} DESC LIMIT 1 OFFSET %s)"
+                              .format(id=self.row_id_column, table=self.table, match=match))
+            parameters.extend(match_parameters + [KINDS[kind], CANDIDATE_LIMIT - 1])
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT " + ", ".join(subqueries), parameters)
+            row = cursor.fetchone()
+        return {KINDS[kind]: floor or 0 for kind, floor in zip(kinds, row)}
+
+    def _window_condition(self, floors):
+        # Restricts matches to the candidate windows of their kinds.
+        clauses = []
+        parameters = []
+        for code, floor in sorted(floors.items()):
+            if floor:
+                clauses.append("(kind = %s AND {} >= %s)".format(self.row_id_column))
+                parameters.extend([code, floor])
+            else:
+                clauses.append("kind = %s")
+                parameters.append(code)
+        return "(" + " OR ".join(clauses) + ")", parameters
+
+    def _match_condition(self, terms):
+        # Returns the condition matching the terms, and its parameters.
+        raise NotImplementedError
+
+    def _search(self, terms, floors, after, limit):
+        # Returns rows of (row ID, kind code, object ID, title, snippet, score).
+        raise NotImplementedError
+
+    def _facets(self, terms, floors):
+        # Returns rows of (kind code, count).
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Search index backed by an SQLite FTS5 virtual table.
+    Titles weigh ten times as much as bodies in the bm25 ranking.
+    """
+
+    row_id_column = "rowid"
+
+    def create_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                "kind UNINDEXED, object_id UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')".format(table=self.table))
+            cursor.execute(
+                "INSERT INTO {table}({table}, rank) VALUES ('rank', 'bm25(0.0, 0.0, 10.0, 1.0)')".format(table=self.table))
+
+    def index(self, documents):
+        if not documents:
+            return
+        self.remove([(document.kind, document.object_id) for document in documents])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO {}(rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)".format(self.table),
+                [(row_id(document.kind, document.object_id), KINDS[document.kind], document.object_id, document.title, document.body)
+                 for document in documents])
+
+    def _match(self, terms):
+        return "{{title body}} : ({})".format(" ".join('"{}"*'.format(term) for term in terms))
+
+    def _match_condition(self, terms):
+        return "{} MATCH %s".format(self.table), [self._match(terms)]
+
+    def _conditions(self, terms, floors):
+        match, parameters = self._match_condition(terms)
+        window, window_parameters = self._window_condition(floors)
+        return [match, window], parameters + window_parameters
+
+    def _search(self, terms, floors, after, limit):
+        conditions, parameters = self._conditions(terms, floors)
+        if after is not None:
+            conditions.append("(rank > %s OR (rank = %s AND rowid > %s))")
+            parameters.extend([after[0], after[0], after[1]])
+        parameters.append(limit)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                ("SELECT rowid, kind, object_id, title, snippet({table}, 3, '', '', '...', 16), rank "
+                 "FROM {table} WHERE " + " AND ".join(conditions) + " ORDER BY rank, rowid LIMIT %s").format(table=self.table),
+                parameters)
+            return cursor.fetchall()
+
+    def _facets(self, terms, floors):
+        conditions, parameters = self._conditions(terms, floors)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT kind, COUNT(*) FROM {} WHERE {} GROUP BY kind".format(self.table, " AND ".join(conditions)),
+                parameters)
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Search index backed by a PostgreSQL table with a generated
+    tsvector column and a GIN index. Titles are weighted above bodies.
+    """
+
+    row_id_column = "id"
+
+    def create_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {table} ("
+                "id bigint PRIMARY KEY, kind smallint NOT NULL, object_id integer NOT NULL, "
+                "title text NOT NULL, body text NOT NULL, "
+                "document tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')) STORED)"
+                .format(table=self.table))
+            cursor.execute("CREATE INDEX IF NOT EXISTS {table}_document ON {table} USING GIN (document)".format(table=self.table))
+
+    def index(self, documents):
+        if not documents:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO {}(id, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s) "
+                "ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body".format(self.table),
+                [(row_id(document.kind, document.object_id), KINDS[document.kind], document.object_id, document.title, document.body)
+                 for document in documents])
+
+    def _tsquery(self, terms):
+        return " & ".join("{}:*".format(term) for term in terms)
+
+    def _match_condition(self, terms):
+        return "document @@ to_tsquery('simple', %s)", [self._tsquery(terms)]
+
+    def _search(self, terms, floors, after, limit):
+        window, window_parameters = self._window_condition(floors)
+        conditions = ["document @@ query", window]
+        parameters = [self._tsquery(terms)] + window_parameters
+        if after is not None:
+            conditions.append("(-ts_rank(document, query), id) > (%s, %s)")
+            parameters.extend(after[:2])
+        parameters.append(limit)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                ("SELECT id, kind, object_id, title, "
+                 "ts_headline('simple', body, query, 'StartSel=\"\", StopSel=\"\", MaxWords=16, MinWords=8'), "
+                 "-ts_rank(document, query) AS score "
+                 "FROM {table}, to_tsquery('simple', %s) query WHERE " + " AND ".join(conditions)
+                 + " ORDER BY score, id LIMIT %s").format(table=self.table),
+                parameters)
+            return cursor.fetchall()
+
+    def _facets(self, terms, floors):
+        match, parameters = self._match_condition(terms)
+        window, window_parameters = self._window_condition(floors)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT kind, COUNT(*) FROM {} WHERE {} AND {} GROUP BY kind".format(self.table, match, window),
+                parameters + window_parameters)
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend(using_connection=None):
+    """
+    Getter for the search backend of a database connection.
+
+    Parameters
+    ----------
+    using_connection : DatabaseWrapper
+        The database connection. If None, the default
+        connection is used.
+
+    Returns
+    -------
+    SearchBackend
+        The backend named by the SEARCH_BACKEND setting, or
+        the backend matching the database vendor.
+    """
+
+    using_connection = using_connection or connection
+    backend_path = getattr(settings, "SEARCH_BACKEND", None)
+    if backend_path:
+        return import_string(backend_path)(using_connection)
+    try:
+        return BACKENDS[using_connection.vendor](using_connection)
+    except KeyError:
+        raise NotImplementedError("Search is not supported on {}.".format(using_connection.vendor))
+
+
+def search(query, kinds=None, cursor=None, limit=20):
+    """
+    Searches all searchable objects. Facets are only counted
+    for the first page.
+
+    Parameters
+    ----------
+    query : string
+        Query as written by the user.
+    kinds : list of string
+        Kinds of objects to search for. If None, all kinds
+        are searched.
+    cursor : string
+        Cursor of the previous page.
+    limit : int
+        Maximum number of results on the page.
+
+    Returns
+    -------
+    SearchPage
+        Results on the page, the cursor of the next page and
+        the number of matches per kind.
+
+    Raises
+    ------
+    ValueError
+        If the cursor is malformed, or belongs to a search of
+        other kinds.
+    """
+
+    backend = get_search_backend()
+    results, next_cursor = backend.search(query, kinds, cursor, limit)
+    facets = backend.facets(query) if cursor is None else {}
+    return SearchPage(results, next_cursor, facets)
+
+
+def update_index(instance):
+    """
+    Adds, replaces or removes the search document of an instance.
+
+    Parameters
+    ----------
+    instance : Model
+        Instance of a searchable model.
+    """
+
+    document = document_for(instance)
+    backend = get_search_backend()
+    if document is None:
+        backend.remove([(kind_of(instance), instance.pk)])
+    else:
+        backend.index([document])
+
+
+def remove_from_index(instance):
+    """
+    Removes the search document of an instance.
+
+    Parameters
+    ----------
+    instance : Model
+        Instance of a searchable model.
+    """
+
+    get_search_backend().remove([(kind_of(instance), instance.pk)])
+
+
+def remove_all_from_index(queryset, batch_size=500):
+    """
+    Removes the search documents of every instance of a queryset, such
+    as of rows that are deleted in bulk.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Instances of a searchable model.
+    batch_size : int
+        Number of documents removed at a time.
+    """
+
+    kind = kind_of(queryset.model())
+    pks = list(queryset.order_by().values_list("pk", flat=True))
+    backend = get_search_backend()
+    for index in range(0, len(pks), batch_size):
+        backend.remove([(kind, pk) for pk in pks[index:index + batch_size]])
+
+
+def reindex_discussions(discussion_ids, batch_size=2000):
+    """
+    Adds, replaces or removes the search documents of discussions and
+    their comments, such as when the group of the discussions becomes
+    restricted or public.
+
+    Parameters
+    ----------
+    discussion_ids : list of int
+        IDs of the discussions.
+    batch_size : int
+        Number of documents indexed at a time.
+    """
+
+    backend = get_search_backend()
+    _index_all(backend, Discussion.objects.filter(pk__in=discussion_ids).select_related("related_group"), batch_size)
+    _index_all(backend, (Comment.objects
+                         .filter(related_discussion__in=discussion_ids)
+                         .select_related("related_discussion__related_group")), batch_size)
+
+
+def rebuild_index(batch_size=2000):
+    """
+    Rebuilds the whole search index from the database.
+
+    Parameters
+    ----------
+    batch_size : int
+        Number of documents indexed at a time.
+
+    Returns
+    -------
+    int
+        Number of indexed documents.
+    """
+
+    backend = get_search_backend()
+    backend.clear()
+    querysets = [
+        Profile.objects.select_related("user"),
+        DiscussionGroup.objects.all(),
+        Discussion.objects.select_related("related_group"),
+        Event.objects.filter(private=False, cancelled=False),
+        Comment.objects.select_related("related_discussion__related_group"),
+    ]
+    return sum(_index_all(backend, queryset, batch_size) for queryset in querysets)
+
+
+def _index_all(backend, queryset, batch_size):
+    # Indexes the documents of every instance, and removes those of
+    # instances that are not searchable. Returns the number indexed.
+    count = 0
+    batch = []
+    removed = []
+    for instance in queryset.iterator(chunk_size=batch_size):
+        document = document_for(instance)
+        if document is None:
+            removed.append((kind_of(instance), instance.pk))
+        else:
+            batch.append(document)
+        if len(batch) >= batch_size:
+            backend.index(batch)
+            count += len(batch)
+            batch = []
+        if len(removed) >= batch_size:
+            backend.remove(removed)
+            removed = []
+    backend.index(batch)
+    backend.remove(removed)
+    return count + len(batch)
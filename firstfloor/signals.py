@@ -0,0 +1,256 @@
+"""
+Signal receivers of firstfloor models.
+Connected when the app is ready (see FirstfloorConfig.ready).
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from firstfloor import counters, people, ranking, search
+from firstfloor.friendgraph import get_friend_graph
+from firstfloor.models import Profile, DiscussionGroup, Discussion, Comment, Event, EVENT_MAX_SPAN
+
+SEARCHABLE_MODELS = [Profile, DiscussionGroup, Discussion, Comment, Event]
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=DiscussionGroup)
+@receiver(post_save, sender=Discussion)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Event)
+def index_searchable(sender, instance, raw=False, **kwargs):
+    """
+    Keeps the search document of a saved instance up to date.
+    """
+
+    if raw:
+        return
+    search.update_index(instance)
+
+
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=DiscussionGroup)
+@receiver(post_delete, sender=Discussion)
+@receiver(post_delete, sender=Event)
+def unindex_searchable(sender, instance, **kwargs):
+    """
+    Removes the search document of a deleted instance. Comments are
+    removed in bulk instead (see firstfloor.counters).
+    """
+
+    search.remove_from_index(instance)
+
+
+@receiver(pre_save, sender=DiscussionGroup)
+@receiver(pre_save, sender=Discussion)
+def note_previous_access(sender, instance, raw=False, **kwargs):
+    """
+    Notes whether a saved group was restricted, or which group a saved
+    discussion belonged to, before the save.
+    """
+
+    if raw or instance._state.adding:
+        return
+    if sender is DiscussionGroup:
+        previous = sender.objects.filter(pk=instance.pk).values("invitation_required", "passphrase").first()
+        instance._was_restricted = bool(previous and (previous["invitation_required"] or previous["passphrase"]))
+    else:
+        instance._previous_group_id = sender.objects.filter(pk=instance.pk).values_list("related_group_id", flat=True).first()
+
+
+@receiver(post_save, sender=DiscussionGroup)
+@receiver(post_save, sender=Discussion)
+def reindex_changed_access(sender, instance, created, raw=False, **kwargs):
+    """
+    Adds discussions and comments into the search index, or removes
+    them from it, when their group becomes public or restricted, or
+    when a discussion moves into another group.
+    """
+
+    if raw or created:
+        return
+    if sender is DiscussionGroup:
+        if getattr(instance, "_was_restricted", False) != search.is_restricted(instance):
+            search.reindex_discussions(list(instance.group_discussions.values_list("pk", flat=True)))
+    elif getattr(instance, "_previous_group_id", instance.related_group_id) != instance.related_group_id:
+        search.reindex_discussions([instance.pk])
+
+
+@receiver(post_save, sender=Profile)
+def update_profile_name_keys(sender, instance, raw=False, **kwargs):
+    """
+    Keeps the name keys of a saved Profile up to date.
+    """
+
+    if raw:
+        return
+    people.update_name_keys(instance)
+
+
+@receiver(post_save, sender=User)
+def index_profile_of_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Keeps the search document and name keys of a Profile up to date
+    when the names of its User change.
+    """
+
+    if raw or (update_fields is not None and not {"username", "first_name", "last_name"} & set(update_fields)):
+        return
+    profile = Profile.objects.filter(user=instance).first()
+    if profile is not None:
+        profile.user = instance
+        search.update_index(profile)
+        people.update_name_keys(profile)
+
+
+@receiver(pre_save, sender=DiscussionGroup)
+@receiver(pre_save, sender=Event)
+def score_created(sender, instance, raw=False, **kwargs):
+    """
+    Gives new groups and events the popularity of their creation.
+    """
+
+    if instance._state.adding and not raw and not instance.popularity:
+        created = instance.creation_date if sender is DiscussionGroup else timezone.now()
+        instance.popularity = ranking.weight_at(ranking.CREATION_WEIGHT, created)
+
+
+@receiver(pre_save, sender=Event)
+def mark_long_running(sender, instance, raw=False, **kwargs):
+    """
+    Marks events that last longer than EVENT_MAX_SPAN as long-running,
+    so that range queries find them. Not called by update or
+    bulk_create; manage.py reconcile_counters repairs the flags after
+    those.
+    """
+
+    if not raw:
+        instance.long_running = instance.end_date - instance.start_date > EVENT_MAX_SPAN
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, raw=False, **kwargs):
+    """
+    Counts a new comment in its discussion and group.
+    """
+
+    if created and not raw:
+        counters.comment_created(instance)
+
+
+@receiver(pre_save, sender=Comment)
+def note_previous_discussion(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Notes which discussion a saved comment belonged to before the save.
+    """
+
+    if raw or instance._state.adding or (update_fields is not None and "related_discussion" not in update_fields):
+        return
+    instance._previous_discussion_id = sender.objects.filter(pk=instance.pk).values_list(
+        "related_discussion_id", flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def count_moved_comment(sender, instance, created, raw=False, **kwargs):
+    """
+    Moves the count of a comment that was moved into another
+    discussion.
+    """
+
+    if raw or created or not hasattr(instance, "_previous_discussion_id"):
+        return
+    previous_discussion_id = instance.__dict__.pop("_previous_discussion_id")
+    if previous_discussion_id != instance.related_discussion_id:
+        counters.comment_moved(instance, previous_discussion_id)
+
+
+@receiver(post_save, sender=Discussion)
+def count_created_discussion(sender, instance, created, raw=False, **kwargs):
+    """
+    Counts a new discussion in its group.
+    """
+
+    if created and not raw:
+        counters.discussion_created(instance)
+
+
+@receiver(post_save, sender=Discussion)
+def count_moved_discussion(sender, instance, created, raw=False, **kwargs):
+    """
+    Moves the counts of a discussion and its comments that were moved
+    into another group.
+    """
+
+    if raw or created:
+        return
+    previous_group_id = getattr(instance, "_previous_group_id", instance.related_group_id)
+    if previous_group_id != instance.related_group_id:
+        counters.discussion_moved(instance, previous_group_id)
+
+
+@receiver(pre_delete, sender=Discussion)
+def uncount_deleted_discussion(sender, instance, **kwargs):
+    """
+    Uncounts a deleted discussion, and the comments deleted along with
+    it, from its group, and removes the comments from search.
+    """
+
+    counters.discussion_deleted(instance)
+    search.remove_all_from_index(Comment.objects.filter(related_discussion=instance.pk))
+
+
+@receiver(pre_delete, sender=Profile)
+def uncount_deleted_comments_of_profile(sender, instance, **kwargs):
+    """
+    Uncounts the comments deleted along with a Profile, and removes
+    them from search. Comments in the discussions of the Profile are
+    left to the deletion of the discussions.
+    """
+
+    comments = Comment.objects.filter(commenter=instance.pk).exclude(related_discussion__creator=instance.pk)
+    counters.comments_deleted(comments)
+    search.remove_all_from_index(comments)
+
+
+@receiver(m2m_changed, sender=DiscussionGroup.participants.through)
+@receiver(m2m_changed, sender=Event.participants.through)
+def recount_changed_participants(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Recounts the participants of groups and events whose participants
+    were changed through the relation, rather than with join and leave.
+    """
+
+    counted = DiscussionGroup if sender is DiscussionGroup.participants.through else Event
+    if action == "pre_clear" and reverse:
+        # The cleared groups or events are only known beforehand.
+        instance._cleared_participations = list(sender.objects.filter(profile=instance).values_list(
+            "discussiongroup_id" if counted is DiscussionGroup else "event_id", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            pks = [instance.pk]
+        elif action == "post_clear":
+            pks = getattr(instance, "_cleared_participations", [])
+        else:
+            pks = pk_set
+        counters.recount_participants(counted, pks)
+
+
+@receiver(m2m_changed, sender=Profile.friend_list.through)
+def invalidate_changed_friends(sender, instance, action, pk_set, **kwargs):
+    """
+    Invalidates the cached friends of Profiles whose friend lists were
+    changed through the relation (as in the admin), rather than with
+    the friendship transitions.
+    """
+
+    if action == "pre_clear":
+        # The cleared friends are only known beforehand.
+        instance._cleared_friends = list(sender.objects.filter(from_profile=instance).values_list("to_profile_id", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        profile_ids = [instance.pk, *(getattr(instance, "_cleared_friends", []) if action == "post_clear" else pk_set)]
+        friend_graph = get_friend_graph()
+        friend_graph.invalidate(*profile_ids)
+        transaction.on_commit(lambda: friend_graph.invalidate(*profile_ids))
@@ -0,0 +1,68 @@
+/**
+ * @file
+ * Type-ahead search for the People page. Queries are sent once
+ * the user has stopped typing for a moment, and responses to
+ * outdated queries are ignored.
+ */
+
+var PEOPLE_SEARCH_DELAY = 200;
+var peopleSearchTimer = null;
+var peopleSearchQuery = "";
+
+/**
+ * Schedules a search for the current contents of the search box,
+ * cancelling any search that is still waiting to be sent.
+ */
+function schedulePeopleSearch() {
+    clearTimeout(peopleSearchTimer);
+    peopleSearchTimer = setTimeout(searchPeople, PEOPLE_SEARCH_DELAY);
+}
+
+/**
+ * Sends the contents of the search box to the autocomplete endpoint.
+ */
+function searchPeople() {
+    var input = document.getElementById("people_search");
+    var query = input.value.trim();
+    peopleSearchQuery = query;
+    if (query === "") {
+        showPeople([]);
+        return;
+    }
+
+    var url = input.getAttribute("data-url") + "?q=" + encodeURIComponent(query);
+    fetch(url, {credentials: "same-origin"})
+        .then(function(response) { return response.json(); })
+        .then(function(data) {
+            if (query === peopleSearchQuery) {
+                showPeople(data.results);
+            }
+        });
+}
+
+/**
+ * Replaces the listed people with the given search results.
+ * @param people List of people, as returned by the endpoint
+ */
+function showPeople(people) {
+    var list = document.getElementById("people_results");
+    while (list.firstChild) {
+        list.removeChild(list.firstChild);
+    }
+
+    people.forEach(function(person) {
+        var item = document.createElement("li");
+        var link = document.createElement("a");
+        link.setAttribute("href", person.url);
+        link.appendChild(document.createTextNode(person.username));
+        item.appendChild(link);
+
+        var details = [person.name, person.location].filter(function(detail) { return detail; });
+        if (details.length > 0) {
+            item.appendChild(document.createTextNode(" (" + details.join(", ") + ")"));
+        }
+        list.appendChild(item);
+    });
+}
+
+document.getElementById("people_search").addEventListener("input", schedulePeopleSearch);
@@ -1,10 +1,51 @@
-from django.test import TestCase, Client
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.contrib.auth.models import User
 from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import override_settings
+from django.conf import settings
 from django.utils import timezone
+from django.urls import get_resolver, URLResolver
+from datetime import timedelta
+import gzip
+import contextvars
+import importlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from groundfloor.instrumentation import registry, RepeatedQueriesError
+from groundfloor.pagecache import page_cache_key
+from groundfloor.assets import VENDOR
+from groundfloor.db.sqlite3.base import DatabaseWrapper as TunedSQLiteWrapper
+from groundfloor.db.routers import PIN_COOKIE, ReplicaPinningMiddleware, ReplicaRouter, _current, new_task, read_from_primary
 
-from .models import Profile, FriendRequest, Comment, Discussion, DiscussionGroup, Event
+from .admin import CommentAdmin
+from . import factories
+from .ics import calendar_token
+from .pagination import encode_cursor
+from .friendgraph import FriendGraph, get_friend_graph
+from . import search
+from .people import find_people
+from .ranking import Leaderboards, get_leaderboards
+from .votebuffer import VoteBuffer, LocalVoteStore, CacheVoteStore
+from .models import Profile, FriendRequest, Comment, CommentVote, Discussion, DiscussionGroup, Event
 
 class ModelInstantiationTests(TestCase):
     """
@@ -77,23 +118,1783 @@ class ModelFunctionalTests(TestCase):
     Unit Tests
     ----------
     test_friendrequests
+    test_friendrequest_pages
+    test_friend_graph
+    test_comment_approval
+    test_comment_approval_batch
+    test_comment_approval_batch_conflict
+    test_vote_buffer
+    test_vote_buffer_background_flush
+    test_vote_buffer_shared_cache
+    test_discussion_thread
+    test_counters
+    test_counter_moves_and_bulk_deletion
+    test_counter_reconciliation
+    test_popularity
+    test_leaderboards
+    test_event_calendar
+    test_search
+    test_search_candidate_windows
+    test_search_restricted_groups
+    test_people_search
+    test_import_accounts
+    test_account_deletion
     """
 
+    def setUp(self):
+        self.profiles = []
+        for name in ("alice", "bob", "carol"):
+            user = User.objects.create_user(name, "{}@example.com".format(name), "password")
+            self.profiles.append(Profile.objects.create(user=user, location="Tampere"))
+        self.discussion = Discussion.objects.create(creator=self.profiles[0])
+        self.comment = Comment.objects.create(commenter=self.profiles[0], contents="Hello", related_discussion=self.discussion)
+
     def test_friendrequests(self):
         """
-        TODO
+        Friend requests can be sent, accepted, rejected and
+        withdrawn via friendship removal.
         """
 
-        pass
+        alice, bob, carol = self.profiles
+
+        # Savepoint, lock of both Profiles, request lookup, insertion
+        # and savepoint release.
+        with CaptureQueriesContext(connection) as context:
+            friend_request = alice.send_friend_request(bob)
+        self.assertEqual(len(context.captured_queries), 5)
+        if not connection.features.has_select_for_update:
+            # The writer lock is taken before anything is read.
+            self.assertTrue(context.captured_queries[1]["sql"].startswith("UPDATE"))
+        self.assertIsNone(friend_request.status)
+        self.assertIsNone(alice.send_friend_request(alice))
+
+        # Savepoint, request lookup, status update, friend list
+        # insertion and savepoint release.
+        with self.assertNumQueries(5):
+            bob.accept_friend_request(alice)
+        self.assertTrue(FriendRequest.objects.get(pk=friend_request.pk).status)
+        self.assertIn(bob, alice.friend_list.all())
+        self.assertIn(alice, bob.friend_list.all())
+
+        # A mutual request accepts the pending one instead.
+        carol.send_friend_request(alice)
+        alice.send_friend_request(carol)
+        self.assertEqual(FriendRequest.objects.filter(sender=alice, receiver=carol).count(), 0)
+        self.assertTrue(FriendRequest.objects.get(sender=carol, receiver=alice).status)
+        self.assertEqual(alice.friend_list.count(), 2)
+
+        with self.assertNumQueries(4):
+            alice.remove_friend(bob)
+        self.assertFalse(FriendRequest.objects.get(pk=friend_request.pk).status)
+        self.assertNotIn(bob, alice.friend_list.all())
+        self.assertNotIn(alice, bob.friend_list.all())
+
+        bob.send_friend_request(carol)
+        with self.assertNumQueries(1):
+            carol.reject_friend_request(bob)
+        self.assertFalse(FriendRequest.objects.get(sender=bob, receiver=carol).status)
+        self.assertEqual(carol.friend_list.count(), 1)
+
+        # A declined request can be sent again after the cooldown.
+        bob.send_friend_request(carol)
+        self.assertFalse(FriendRequest.objects.get(sender=bob, receiver=carol).status)
+        FriendRequest.objects.filter(sender=bob, receiver=carol).update(request_date=timezone.now() - timedelta(days=8))
+        self.assertIsNone(bob.send_friend_request(carol).status)
+
+    def test_friendrequest_pages(self):
+        """
+        Pending friend requests are paginated newest first,
+        and each page is fetched with one query.
+        """
+
+        alice = self.profiles[0]
+        senders = []
+        for index in range(5):
+            user = User.objects.create_user("sender{}".format(index), "", "password")
+            senders.append(Profile.objects.create(user=user, location="Tampere"))
+            senders[-1].send_friend_request(alice)
+        alice.reject_friend_request(senders[0])
+
+        with self.assertNumQueries(1):
+            first_page, cursor = alice.incoming_friend_requests(limit=3)
+            usernames = [friend_request.sender.user.username for friend_request in first_page]
+        self.assertEqual(usernames, ["sender4", "sender3", "sender2"])
+
+        second_page, cursor = alice.incoming_friend_requests(cursor=cursor, limit=3)
+        self.assertEqual([friend_request.sender for friend_request in second_page], [senders[1]])
+        self.assertIsNone(cursor)
+
+        outgoing, cursor = senders[1].outgoing_friend_requests()
+        self.assertEqual([friend_request.receiver for friend_request in outgoing], [alice])
+        with self.assertRaises(ValueError):
+            alice.incoming_friend_requests(cursor="not-a-cursor")
+
+    def test_friend_graph(self):
+        """
+        Mutual friends, suggestions and degrees of separation are
+        served from the cache, which is invalidated on friend list
+        changes.
+        """
+
+        from django.core.cache import cache
+
+        cache.clear()
+        alice, bob, carol = self.profiles
+        dave = Profile.objects.create(user=User.objects.create_user("dave", "", "password"), location="Tampere")
+        erin = Profile.objects.create(user=User.objects.create_user("erin", "", "password"), location="Tampere")
+        alice.add_friend(bob)
+        alice.add_friend(carol)
+        bob.add_friend(dave)
+        carol.add_friend(dave)
+        dave.add_friend(erin)
+
+        friend_graph = FriendGraph(cache)
+        self.assertEqual(friend_graph.mutual_friend_count(alice.pk, dave.pk), 2)
+        self.assertEqual(friend_graph.suggestions(alice.pk), [(dave.pk, 2)])
+        self.assertEqual(friend_graph.degrees_of_separation(alice.pk, erin.pk), 3)
+        self.assertIsNone(friend_graph.degrees_of_separation(alice.pk, erin.pk, max_depth=2))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(friend_graph.friends(alice.pk)), [bob.pk, carol.pk])
+
+        alice.remove_friend(bob)
+        self.assertEqual(list(friend_graph.friends(alice.pk)), [carol.pk])
+        self.assertEqual(friend_graph.mutual_friend_count(alice.pk, dave.pk), 1)
+
+        # Friend lists edited through the relation (as in the admin).
+        shared_graph = get_friend_graph()
+        self.assertEqual(list(shared_graph.friends(erin.pk)), [dave.pk])
+        erin.friend_list.add(alice)
+        self.assertEqual(list(shared_graph.friends(erin.pk)), [alice.pk, dave.pk])
+        self.assertEqual(list(shared_graph.friends(alice.pk)), [carol.pk, erin.pk])
+        erin.friend_list.clear()
+        self.assertEqual(list(shared_graph.friends(erin.pk)), [])
+        self.assertEqual(list(shared_graph.friends(dave.pk)), [bob.pk, carol.pk])
+
+        with override_settings(FRIEND_GRAPH_TIMEOUT=None), self.assertRaises(ImproperlyConfigured):
+            FriendGraph.from_settings()
+
+    def test_comment_approval(self):
+        """
+        Votes are applied in the database, and a Profile can only
+        have one vote on a comment.
+        """
+
+        alice, bob, _ = self.profiles
+        self.assertEqual(self.comment.add_approval(True, voter=bob), 1)
+        self.assertEqual(self.comment.add_approval(True, voter=bob), 1)
+        self.assertEqual(self.comment.add_approval(False, voter=bob), -1)
+        self.assertEqual(self.comment.add_approval(True, voter=alice), 0)
+        self.assertEqual(self.comment.add_approval(True), 1)
+        self.assertEqual(CommentVote.objects.filter(comment=self.comment).count(), 2)
+
+        # A stale instance must not overwrite votes applied elsewhere.
+        stale_comment = Comment.objects.get(pk=self.comment.pk)
+        self.comment.add_approval(True)
+        self.assertEqual(stale_comment.add_approval(True), 3)
+
+    def test_comment_approval_batch(self):
+        """
+        A batch of votes updates the ratings of all comments
+        with a single UPDATE.
+        """
+
+        alice, bob, carol = self.profiles
+        other_comment = Comment.objects.create(commenter=bob, contents="Hi", related_discussion=self.discussion)
+        votes = [
+            (self.comment.pk, bob.pk, True),
+            (self.comment.pk, carol.pk, True),
+            (self.comment.pk, carol.pk, False),
+            (other_comment.pk, alice.pk, False),
+            (other_comment.pk, None, False),
+        ]
+
+        # Savepoint, lookup of existing votes, insertion of new votes
+        # within a savepoint of its own, rating update and savepoint
+        # release.
+        with CaptureQueriesContext(connection) as context:
+            deltas = Comment.apply_votes(votes)
+        self.assertEqual(len(context.captured_queries), 7)
+        if connection.features.has_select_for_update:
+            # The existing votes are locked by the lookup.
+            self.assertIn("FOR UPDATE", context.captured_queries[1]["sql"])
+
+        self.assertEqual(deltas, {other_comment.pk: -2})
+        self.comment.refresh_from_db()
+        other_comment.refresh_from_db()
+        self.assertEqual(self.comment.approval, 0)
+        self.assertEqual(other_comment.approval, -2)
+        self.assertEqual(Comment.apply_votes([(self.comment.pk, bob.pk, True)]), {})
+
+    def test_comment_approval_batch_conflict(self):
+        """
+        First votes that another batch has recorded since the lookup
+        are applied onto the recorded votes instead of failing the batch.
+        """
+
+        alice, bob, carol = self.profiles
+        Comment.apply_votes([(self.comment.pk, bob.pk, True), (self.comment.pk, carol.pk, True)])
+        votes = [
+            (self.comment.pk, alice.pk, True),
+            (self.comment.pk, bob.pk, True),
+            (self.comment.pk, carol.pk, False),
+        ]
+
+        # The lookup misses the votes recorded by the concurrent batch.
+        locked = mock.Mock(wraps=CommentVote.objects.select_for_update())
+        locked.filter.return_value = CommentVote.objects.none()
+        with mock.patch.object(CommentVote.objects, "select_for_update", return_value=locked):
+            deltas = Comment.apply_votes(votes)
+
+        self.assertEqual(deltas, {self.comment.pk: -1})
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.approval, 1)
+        self.assertEqual(dict(CommentVote.objects.filter(comment=self.comment).values_list("voter_id", "approval")),
+                         {alice.pk: True, bob.pk: True, carol.pk: False})
+
+    def test_vote_buffer(self):
+        """
+        Buffered votes are coalesced, show up in live ratings
+        and are written into the database upon flushing.
+        """
+
+        alice, bob, _ = self.profiles
+        vote_buffer = VoteBuffer(store=LocalVoteStore(), window=60)
+        vote_buffer.record(self.comment.pk, alice.pk, True)
+        vote_buffer.record(self.comment.pk, bob.pk, True)
+        vote_buffer.record(self.comment.pk, bob.pk, False)
+        vote_buffer.record(self.comment.pk, None, True)
+        vote_buffer.record(self.comment.pk, None, True)
+
+        self.assertEqual(vote_buffer.metrics()["depth"], 3)
+        self.assertEqual(vote_buffer.live_approval(self.comment), 2)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.approval, 0)
+
+        self.assertEqual(vote_buffer.flush(), {self.comment.pk: 2})
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.approval, 2)
+        self.assertEqual(vote_buffer.live_approval(self.comment), 2)
+        self.assertEqual(vote_buffer.metrics()["depth"], 0)
+        self.assertEqual(vote_buffer.metrics()["flushed_votes"], 4)
+
+        # Votes are counted against the stored votes of their voters.
+        vote_buffer.record(self.comment.pk, alice.pk, True)
+        vote_buffer.record(self.comment.pk, bob.pk, True)
+        self.assertEqual(vote_buffer.live_approval(self.comment), 4)
+        self.assertEqual(vote_buffer.flush(), {self.comment.pk: 2})
+
+        with override_settings(VOTE_BUFFER_CACHE=None), self.assertRaises(CommandError):
+            call_command("flush_votes", stdout=StringIO())
+
+    def test_vote_buffer_background_flush(self):
+        """
+        Buffers flush themselves once the window has passed,
+        without waiting for further votes.
+        """
+
+        flushed = threading.Event()
+        vote_buffer = VoteBuffer(store=LocalVoteStore(), window=0.01, background=True)
+        with mock.patch.object(Comment, "apply_votes", side_effect=lambda votes: flushed.set() or {}) as apply_votes:
+            vote_buffer.record(self.comment.pk, None, True)
+            self.assertTrue(flushed.wait(5))
+        apply_votes.assert_called_once_with([(self.comment.pk, None, True)])
+        self.assertEqual(vote_buffer.metrics()["depth"], 0)
+
+    def test_vote_buffer_shared_cache(self):
+        """
+        Buffers sharing a cache see each other's pending votes.
+        """
+
+        from django.core.cache import cache
+
+        cache.clear()
+        alice, bob, _ = self.profiles
+        first_buffer = VoteBuffer(store=CacheVoteStore(cache), window=60)
+        second_buffer = VoteBuffer(store=CacheVoteStore(cache), window=60)
+        first_buffer.record(self.comment.pk, alice.pk, True)
+        second_buffer.record(self.comment.pk, bob.pk, True)
+
+        first_buffer.record(self.comment.pk, alice.pk, True)
+        second_buffer.record(self.comment.pk, None, False)
+        other_comment = Comment.objects.create(commenter=bob, contents="Hi", related_discussion=self.discussion)
+        second_buffer.record(other_comment.pk, alice.pk, False)
+
+        self.assertEqual(first_buffer.pending_delta(self.comment.pk), 1)
+        self.assertEqual(first_buffer.live_approvals([self.comment, other_comment]),
+                         {self.comment.pk: 1, other_comment.pk: -1})
+        self.assertEqual(first_buffer.metrics()["depth"], 5)
+        self.assertEqual(second_buffer.flush(), {self.comment.pk: 1, other_comment.pk: -1})
+        self.assertEqual(first_buffer.pending_delta(self.comment.pk), 0)
+        self.assertEqual(first_buffer.metrics()["depth"], 0)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.approval, 1)
+
+        # Repeated votes remembered from before the flush change nothing.
+        second_buffer.record(self.comment.pk, bob.pk, True)
+        self.assertEqual(first_buffer.pending_delta(self.comment.pk), 0)
+
+    def test_discussion_thread(self):
+        """
+        Threads are paged through in every order with one query per
+        page, and live approvals include pending votes.
+        """
+
+        alice, bob, _ = self.profiles
+        start = timezone.now()
+        for index in range(24):
+            Comment.objects.create(commenter=bob if index % 2 else None, contents="Comment {}".format(index),
+                                   related_discussion=self.discussion, approval=index % 5,
+                                   creation_date=start + timedelta(minutes=index // 2))
+        comments = list(Comment.objects.filter(related_discussion=self.discussion))
+
+        expected = {
+            "oldest": sorted(comments, key=lambda comment: (comment.creation_date, comment.pk)),
+            "newest": sorted(comments, key=lambda comment: (comment.creation_date, comment.pk), reverse=True),
+            "approval": sorted(comments, key=lambda comment: (comment.approval, comment.pk), reverse=True),
+        }
+        for order, ordered in expected.items():
+            pages = []
+            cursor = None
+            while True:
+                # Commenters are fetched in the same query.
+                with self.assertNumQueries(1):
+                    page, cursor = self.discussion.thread(order, cursor, limit=10)
+                    [comment.commenter.user.username for comment in page if comment.commenter]
+                pages.extend(comment.pk for comment in page)
+                if cursor is None:
+                    break
+            self.assertEqual(pages, [comment.pk for comment in ordered])
+
+        with self.assertRaises(ValueError):
+            self.discussion.thread("random")
+
+        vote_buffer = VoteBuffer(store=LocalVoteStore(), window=60)
+        vote_buffer.record(self.comment.pk, alice.pk, True)
+        page, _ = self.discussion.thread("oldest", limit=1)
+        self.assertEqual(vote_buffer.live_approvals(page), {self.comment.pk: 1})
+
+    def test_counters(self):
+        """
+        Counters follow joins, leaves, posts and deletions, as well as
+        changes made through the participant relations.
+        """
+
+        alice, bob, carol = self.profiles
+        group = DiscussionGroup.objects.create(title="Saunas", description="", creator=alice)
+        event = Event.objects.create(title="Sauna night", description="", host=alice, location="Tampere")
+
+        self.assertTrue(group.join(alice))
+        self.assertFalse(group.join(alice))
+        self.assertTrue(group.join(bob))
+        self.assertTrue(event.join(carol))
+        self.assertTrue(group.leave(bob))
+        self.assertFalse(group.leave(bob))
+
+        discussion = Discussion.objects.create(creator=alice, related_group=group)
+        comment = discussion.post_comment(bob, "Hello")
+        discussion.post_comment(carol, "Hi")
+        comment.delete()
+
+        group.refresh_from_db()
+        discussion.refresh_from_db()
+        event.refresh_from_db()
+        self.assertEqual((group.participant_count, group.discussion_count, group.comment_count), (1, 1, 1))
+        self.assertEqual(discussion.comment_count, 1)
+        self.assertIsNotNone(discussion.last_activity)
+        self.assertEqual(event.participant_count, 1)
+
+        group.participants.add(bob, carol)
+        carol.profile_associated_groups.remove(group)
+        alice.profile_associated_groups.clear()
+        event.participants.clear()
+        group.refresh_from_db()
+        event.refresh_from_db()
+        self.assertEqual(group.participant_count, 1)
+        self.assertEqual(event.participant_count, 0)
+
+        discussion.delete()
+        group.refresh_from_db()
+        self.assertEqual((group.discussion_count, group.comment_count), (0, 0))
+
+    def test_counter_moves_and_bulk_deletion(self):
+        """
+        Counters follow comments and discussions into other discussions
+        and groups, and comments deleted along with their discussion or
+        Profile are uncounted and unindexed in bulk.
+        """
+
+        alice, bob, carol = self.profiles
+        saunas = DiscussionGroup.objects.create(title="Saunas", description="", creator=alice)
+        lakes = DiscussionGroup.objects.create(title="Lakes", description="", creator=alice)
+        discussion = Discussion.objects.create(creator=alice, related_group=saunas)
+        other = Discussion.objects.create(creator=bob, related_group=saunas)
+        comments = [discussion.post_comment(bob, "Löyly {}".format(index)) for index in range(20)]
+        other.post_comment(carol, "Löyly")
+
+        comments[0].related_discussion = other
+        comments[0].save()
+        discussion.related_group = lakes
+        discussion.save()
+        saunas.refresh_from_db()
+        lakes.refresh_from_db()
+        self.assertEqual((saunas.discussion_count, saunas.comment_count), (1, 2))
+        self.assertEqual((lakes.discussion_count, lakes.comment_count), (1, 19))
+        self.assertEqual(Discussion.objects.get(pk=other.pk).comment_count, 2)
+
+        Comment.objects.filter(pk__in=[comment.pk for comment in comments[1:3]]).delete()
+        lakes.refresh_from_db()
+        self.assertEqual(lakes.comment_count, 17)
+
+        # Deleting a discussion costs the same regardless of its number
+        # of comments: no statements are repeated per comment.
+        with CaptureQueriesContext(connection) as context:
+            discussion.delete()
+        self.assertEqual(len(context.captured_queries), 9)
+        lakes.refresh_from_db()
+        self.assertEqual((lakes.discussion_count, lakes.comment_count), (0, 0))
+        self.assertEqual(search.search("löyly").facets, {"comment": 2})
+
+        bob.delete()
+        saunas.refresh_from_db()
+        self.assertEqual((saunas.discussion_count, saunas.comment_count), (0, 0))
+        self.assertEqual(search.search("löyly").facets, {})
+
+    def test_counter_reconciliation(self):
+        """
+        Counters that have drifted are repaired, and only those.
+        """
+
+        alice, bob, _ = self.profiles
+        group = DiscussionGroup.objects.create(title="Saunas", description="", creator=alice)
+        group.join(alice)
+        discussion = Discussion.objects.create(creator=alice, related_group=group)
+        Comment.objects.bulk_create([Comment(commenter=bob, contents="Hello", related_discussion=discussion)] * 3)
+        DiscussionGroup.objects.filter(pk=group.pk).update(participant_count=5)
+
+        out = StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("1 discussiongroup rows, 1 discussion rows", out.getvalue())
+        group.refresh_from_db()
+        discussion.refresh_from_db()
+        self.assertEqual((group.participant_count, group.comment_count), (1, 3))
+        self.assertEqual(discussion.comment_count, 3)
+        self.assertEqual(discussion.last_activity, Comment.objects.latest("creation_date").creation_date)
+
+        from firstfloor.counters import reconcile
+        self.assertEqual(reconcile(), {"discussiongroup": 0, "discussion": 0, "event": 0})
+
+    def test_popularity(self):
+        """
+        Activity raises popularity, newer activity more than older,
+        and popularity halves every half-life.
+        """
+
+        from firstfloor import ranking
+
+        alice, bob, _ = self.profiles
+        now = timezone.now()
+        half_life = timedelta(seconds=settings.POPULARITY_HALF_LIFE)
+        self.assertAlmostEqual(ranking.decayed(ranking.weight_at(4.0, now - half_life), now), 2.0)
+
+        old = DiscussionGroup.objects.create(title="Old", description="", creation_date=now - 3 * half_life)
+        new = DiscussionGroup.objects.create(title="New", description="", creation_date=now)
+        self.assertLess(old.popularity, new.popularity)
+
+        old.join(alice)
+        old.join(bob)
+        Discussion.objects.create(creator=alice, related_group=old).post_comment(bob, "Hello")
+        old.refresh_from_db()
+        expected = (ranking.CREATION_WEIGHT / 8 + 2 * ranking.JOIN_WEIGHT
+                    + ranking.DISCUSSION_WEIGHT + ranking.COMMENT_WEIGHT)
+        self.assertAlmostEqual(ranking.decayed(old.popularity), expected, places=2)
+
+        # Rebuilt scores count the joins at the last activity.
+        ranking.recompute_popularity()
+        old.refresh_from_db()
+        self.assertAlmostEqual(ranking.decayed(old.popularity), expected, places=2)
+
+    def test_leaderboards(self):
+        """
+        Leaderboards list public groups and upcoming events by
+        popularity, and are served from the cache once refreshed. The cache has to be
+        shared by every process.
+        """
+
+        from django.core.cache import caches
+
+        alice, bob, carol = self.profiles
+        quiet = DiscussionGroup.objects.create(title="Quiet", description="")
+        busy = DiscussionGroup.objects.create(title="Busy", description="")
+        DiscussionGroup.objects.create(title="Secret", description="", invitation_required=True).join(alice)
+        DiscussionGroup.objects.create(title="Hidden", description="", passphrase="löyly").join(alice)
+        for profile in self.profiles:
+            busy.join(profile)
+        start = timezone.now() + timedelta(days=1)
+        event = Event.objects.create(title="Sauna night", description="", host=alice, location="Tampere",
+                                     start_date=start, end_date=start + timedelta(hours=3))
+        Event.objects.create(title="Cancelled", description="", host=alice, location="Tampere", cancelled=True,
+                             start_date=start, end_date=start + timedelta(hours=3))
+        event.join(bob)
+        # Ended events are left out, however popular.
+        ended = Event.objects.create(title="Last week", description="", host=alice, location="Tampere",
+                                     start_date=start - timedelta(days=8), end_date=start - timedelta(days=7))
+        Event.objects.filter(pk=ended.pk).update(popularity=1e6)
+
+        caches["default"].clear()
+        leaderboards = Leaderboards(caches["default"], size=10)
+        self.assertEqual(leaderboards.refresh(), {"groups": 2, "events": 1})
+        with self.assertNumQueries(0):
+            groups = leaderboards.groups()
+            events = leaderboards.events()
+        self.assertEqual([group["title"] for group in groups], ["Busy", "Quiet"])
+        self.assertEqual(groups[0]["participant_count"], 3)
+        self.assertEqual([event["title"] for event in events], ["Sauna night"])
+
+        out = StringIO()
+        call_command("refresh_leaderboards", "--recompute", stdout=out)
+        self.assertIn("Refreshed 2 groups and 1 events", out.getvalue())
+        self.assertEqual([group["title"] for group in get_leaderboards().groups()], ["Busy", "Quiet"])
+
+        with override_settings(LEADERBOARD_CACHE="default"), self.assertRaises(ImproperlyConfigured):
+            Leaderboards.from_settings()
+
+    def test_event_calendar(self):
+        """
+        Range queries find every event overlapping the range,
+        long-running ones included, and none that do not. Flags left
+        stale by bulk changes are repaired by reconciliation.
+        """
+
+        alice, bob, carol = self.profiles
+        now = timezone.now()
+
+        def create(title, start, hours, **fields):
+            return Event.objects.create(title=title, description="", host=alice, location="Tampere",
+                                        start_date=now + start, end_date=now + start + timedelta(hours=hours), **fields)
+
+        ongoing = create("Ongoing", timedelta(hours=-2), 4)
+        festival = create("Festival", timedelta(days=-30), 24 * 60)
+        tomorrow = create("Tomorrow", timedelta(days=1), 2)
+        create("Past", timedelta(days=-3), 2)
+        create("Cancelled", timedelta(hours=-1), 2, cancelled=True)
+        self.assertTrue(festival.long_running)
+        self.assertFalse(ongoing.long_running)
+
+        self.assertEqual(list(Event.objects.between(now, now + timedelta(hours=1))), [festival, ongoing])
+        self.assertEqual(list(Event.objects.between(now, now + timedelta(days=2))), [festival, ongoing, tomorrow])
+        self.assertEqual(list(Event.objects.upcoming(now)), [tomorrow])
+        self.assertEqual(Event.objects.overlapping(now, now + timedelta(hours=1)).count(), 3)
+        self.assertIn(ongoing, Event.objects.this_week(now))
+
+        # Bulk changes leave the flag to be repaired by reconciliation.
+        Event.objects.filter(pk=tomorrow.pk).update(start_date=now - timedelta(days=10))
+        self.assertEqual(Event.objects.overlapping(now, now + timedelta(hours=1)).count(), 3)
+        call_command("reconcile_counters", stdout=StringIO())
+        self.assertEqual(Event.objects.overlapping(now, now + timedelta(hours=1)).count(), 4)
+        Event.objects.filter(pk=tomorrow.pk).update(start_date=now + timedelta(days=1))
+        call_command("reconcile_counters", stdout=StringIO())
+        self.assertFalse(Event.objects.get(pk=tomorrow.pk).long_running)
+
+        tomorrow.join(bob)
+        tomorrow.invitees.add(carol)
+        self.assertEqual(list(Event.objects.of_profile(bob)), [tomorrow])
+        self.assertEqual(list(Event.objects.of_profile(carol)), [tomorrow])
+        self.assertEqual(Event.objects.of_profile(alice).count(), 5)
+
+    def test_search(self):
+        """
+        The search index follows saves and deletions, ranks titles
+        above bodies and paginates with cursors.
+        """
+
+        alice, bob, _ = self.profiles
+        group = DiscussionGroup.objects.create(title="Hiking", description="Walks in the woods", creator=alice)
+        discussion = Discussion.objects.create(title="Best hiking trails", creator=bob, related_group=group)
+        Comment.objects.create(commenter=bob, contents="I love hiking in Lapland", related_discussion=discussion)
+        Event.objects.create(title="Secret hike", description="Hiking", host=alice, location="Nuuksio", private=True)
+        Event.objects.create(title="Hike", description="Open hiking trip", host=alice, location="Nuuksio")
+
+        page = search.search("hik")
+        self.assertEqual(page.facets, {"group": 1, "discussion": 1, "comment": 1, "event": 1})
+        self.assertEqual(page.results[-1].kind, "comment")
+
+        page = search.search("hiking lapland")
+        self.assertEqual([(result.kind, result.snippet) for result in page.results], [("comment", "I love hiking in Lapland")])
+
+        alice.description = "Hiking enthusiast"
+        alice.save()
+        results, _ = search.get_search_backend().search("hiking", kinds=["profile"])
+        self.assertEqual([result.title for result in results], ["alice"])
+
+        group.delete()
+        self.assertNotIn("group", search.search("hiking").facets)
+
+        first_page = search.search("hiking", limit=2)
+        second_page = search.search("hiking", cursor=first_page.next_cursor, limit=2)
+        self.assertEqual(len(first_page.results) + len(second_page.results), 4)
+        self.assertIsNone(second_page.next_cursor)
+        self.assertFalse({result.object_id for result in first_page.results if result.kind == "comment"}
+                         & {result.object_id for result in second_page.results if result.kind == "comment"})
+
+    def test_search_candidate_windows(self):
+        """
+        Candidate windows are kept per kind, so common words in comments
+        do not push other kinds out of the results or facets.
+        """
+
+        alice, bob, _ = self.profiles
+        for index in range(5):
+            Comment.objects.create(commenter=bob, contents="alice {}".format(index), related_discussion=self.discussion)
+
+        with mock.patch.object(search, "CANDIDATE_LIMIT", 3):
+            page = search.search("alice", limit=2)
+            self.assertEqual(page.facets, {"profile": 1, "comment": 3})
+            results = list(page.results)
+            while page.next_cursor:
+                page = search.search("alice", cursor=page.next_cursor, limit=2)
+                results.extend(page.results)
+        self.assertEqual(sorted(result.kind for result in results), ["comment"] * 3 + ["profile"])
+
+        with self.assertRaises(ValueError):
+            search.search("alice", cursor=encode_cursor([0, 0, 0]))
+
+        # A cursor only goes on with the kinds that it was made for.
+        page = search.search("alice", kinds=["comment"], limit=2)
+        with self.assertRaises(ValueError):
+            search.search("alice", kinds=["profile"], cursor=page.next_cursor)
+        with self.assertRaises(ValueError):
+            search.search("alice", cursor=page.next_cursor)
+        page = search.search("alice", kinds=["comment"], cursor=page.next_cursor, limit=2)
+        self.assertTrue(page.results)
+        self.assertEqual({result.kind for result in page.results}, {"comment"})
+
+    def test_search_restricted_groups(self):
+        """
+        Discussions and comments of restricted groups are left out of
+        the index, and follow their group when it changes.
+        """
+
+        alice, bob, _ = self.profiles
+        group = DiscussionGroup.objects.create(title="Club", description="", creator=alice, invitation_required=True)
+        discussion = Discussion.objects.create(title="Secret plans", creator=alice, related_group=group)
+        Comment.objects.create(commenter=bob, contents="Secret handshake", related_discussion=discussion)
+        self.assertEqual(search.search("secret").facets, {})
+
+        group.invitation_required = False
+        group.save()
+        self.assertEqual(search.search("secret").facets, {"discussion": 1, "comment": 1})
+
+        group.passphrase = "open sesame"
+        group.save()
+        self.assertEqual(search.search("secret").facets, {})
+
+        discussion.related_group = None
+        discussion.save()
+        self.assertEqual(search.search("secret").facets, {"discussion": 1, "comment": 1})
+        search.rebuild_index()
+        self.assertEqual(search.search("secret").facets, {"discussion": 1, "comment": 1})
+
+    def test_people_search(self):
+        """
+        People are found by the beginning of their username, first,
+        last or full name with one query, and private Profiles only
+        by their username.
+        """
+
+        user = User.objects.create_user("jsibelius", "", "password", first_name="Jean", last_name="Sibélius")
+        Profile.objects.create(user=user, location="Järvenpää")
+        user = User.objects.create_user("aaltonen", "", "password", first_name="Jean", last_name="Aalto")
+        Profile.objects.create(user=user, location="Helsinki", private=True)
+
+        with self.assertNumQueries(1):
+            people = find_people("SIBEL")
+        self.assertEqual(people, [{"username": "jsibelius", "name": "Jean Sibélius", "location": "Järvenpää",
+                                   "url": reverse("firstfloor:profile", args=["jsibelius"])}])
+        self.assertEqual([person["username"] for person in find_people("jean s")], ["jsibelius"])
+        self.assertEqual([person["username"] for person in find_people("jean")], ["jsibelius"])
+        self.assertEqual([person["username"] for person in find_people("a")], ["aaltonen", "alice"])
+        self.assertIsNone(find_people("aalto")[0]["name"])
+
+        user.username = "aalto"
+        user.save()
+        self.assertEqual([person["username"] for person in find_people("aalto")], ["aalto"])
+        self.assertEqual(find_people(" "), [])
+
+    def test_import_accounts(self):
+        """
+        Accounts are imported from CSV and JSON Lines files with hashed
+        passwords, name keys, search documents and friendships, and
+        importing the same file again changes nothing.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            accounts = os.path.join(directory, "accounts.csv")
+            with open(accounts, "w", encoding="utf-8", newline="") as file:
+                file.write("username,password,first_name,last_name,location,private,friends\n"
+                           "ainoa,secret,Aino,Aalto,Tampere,,eero;alice;nobody\n"
+                           "eero,,Eero,Saarinen,Helsinki,yes,ainoa\n"
+                           "alice,password,,,,,\n"
+                           "bad name!,password,,,,,\n")
+            more = os.path.join(directory, "accounts.jsonl")
+            with open(more, "w", encoding="utf-8") as file:
+                file.write(json.dumps({"username": "helmi", "password_hash": User.objects.get(username="bob").password,
+                                       "birthdate": "1990-05-01", "friends": ["ainoa"]}) + "\n")
+                file.write("{not json\n")
+                file.write(json.dumps({"username": "lauri", "password": "sauna"}) + "\n")
+                # Values of the wrong type or length are reported, not crashed on.
+                file.write(json.dumps({"username": "pekka", "password_hash": 123}) + "\n")
+                file.write(json.dumps({"username": "kalle", "birthdate": 19900101}) + "\n")
+                file.write(json.dumps({"username": "olli", "first_name": "O" * 31}) + "\n")
+                file.write(json.dumps({"username": "ville", "location": ["Oulu"]}) + "\n")
+                file.write(json.dumps({"username": "matti", "password": 12345, "friends": 7}) + "\n")
+
+            out, err = StringIO(), StringIO()
+            call_command("import_accounts", accounts, "--processes", "0", "--batch-size", "2", stdout=out, stderr=err)
+            self.assertIn("read 4, created 2, skipped 1, invalid 1", out.getvalue())
+            self.assertIn("Line 5: Invalid username", err.getvalue())
+            self.assertIn("Created 2 friendships", out.getvalue())
+
+            call_command("import_accounts", more, "--processes", "2", stdout=out, stderr=err)
+            self.assertIn("Line 2: Not an account.", err.getvalue())
+            self.assertIn("read 8, created 3, skipped 0, invalid 5", out.getvalue())
+            self.assertIn("Line 4: Unknown password hash of 'pekka'.", err.getvalue())
+            self.assertIn("Line 5: Invalid birthdate of 'kalle'.", err.getvalue())
+            self.assertIn("Line 6: first_name of 'olli' is longer than 30 characters.", err.getvalue())
+            self.assertIn("Line 7: Invalid location of 'ville'.", err.getvalue())
+
+            out = StringIO()
+            call_command("import_accounts", accounts, "--processes", "0", stdout=out, stderr=StringIO())
+            self.assertIn("read 4, created 0, skipped 3, invalid 1", out.getvalue())
+            self.assertIn("Created 0 friendships", out.getvalue())
+
+        ainoa = Profile.objects.select_related("user").get(user__username="ainoa")
+        self.assertTrue(ainoa.user.check_password("secret"))
+        self.assertFalse(Profile.objects.get(user__username="eero").user.has_usable_password())
+        helmi = Profile.objects.select_related("user").get(user__username="helmi")
+        self.assertTrue(helmi.user.check_password("password"))
+        self.assertEqual(str(helmi.birthdate), "1990-05-01")
+        self.assertTrue(User.objects.get(username="lauri").check_password("sauna"))
+        self.assertTrue(User.objects.get(username="matti").check_password("12345"))
+
+        self.assertEqual({friend.user.username for friend in ainoa.friend_list.all()}, {"eero", "alice", "helmi"})
+        self.assertEqual(FriendRequest.objects.filter(status=True).count(), 3)
+        self.assertEqual([person["username"] for person in find_people("aalto")], ["ainoa"])
+        self.assertEqual(find_people("saarinen"), [])
+        results, _ = search.get_search_backend().search("ainoa", kinds=["profile"])
+        self.assertEqual([result.object_id for result in results], [ainoa.pk])
+
+    @override_settings(ACCOUNT_DELETION_CHUNK_SIZE=10, ACCOUNT_DELETION_LOCK_BUDGET=0, ACCOUNT_DELETION_PAUSE=0)
+    def test_account_deletion(self):
+        """
+        Deleting an account removes everything that depends on it in
+        chunks, keeps the counters, ratings, search index and friend
+        graph of others correct, and resumes after a failure.
+        """
+
+        from .deletion import STAGES, request_deletion, run_deletion
+
+        cache.clear()
+        alice, bob, carol = self.profiles
+        alice.add_friend(bob)
+        carol.send_friend_request(alice)
+        group = DiscussionGroup.objects.create(title="Saunas", description="", creator=alice)
+        group.join(alice)
+        group.join(bob)
+        discussion = Discussion.objects.create(title="Löyly", creator=alice, related_group=group)
+        for index in range(25):
+            discussion.post_comment(bob if index % 2 else alice, "Comment {}".format(index))
+        other = Discussion.objects.create(title="Other", creator=bob, related_group=group)
+        kept = other.post_comment(bob, "Sauna talk")
+        other.post_comment(alice, "Sauna gossip")
+        Comment.apply_votes([(kept.pk, alice.pk, True), (kept.pk, carol.pk, True)])
+        event = Event.objects.create(title="Sauna night", description="", host=alice, location="Tampere")
+        event.join(bob)
+        bobs_event = Event.objects.create(title="Lake", description="", host=bob, location="Tampere")
+        bobs_event.join(alice)
+        friend_graph = FriendGraph(cache)
+        self.assertEqual(list(friend_graph.friends(bob.pk)), [alice.pk])
+
+        job = request_deletion(alice)
+        self.assertEqual(request_deletion(alice), job)
+        self.assertFalse(Client().login(username="alice", password="password"))
+        self.assertEqual(find_people("alice"), [])
+
+        def fail(profile_id, limit):
+            raise RuntimeError("Database went away.")
+
+        with mock.patch("firstfloor.deletion.STAGES", STAGES[:7] + [("failing", fail)]):
+            with self.assertRaises(RuntimeError):
+                run_deletion(job)
+        job.refresh_from_db()
+        self.assertEqual((job.stage, job.attempts, job.completed_date), ("comments", 1, None))
+        self.assertFalse(Comment.objects.filter(commenter=alice).exists())
+
+        out = StringIO()
+        call_command("delete_accounts", stdout=out)
+        self.assertIn("Deleted 1 accounts (0 failed)", out.getvalue())
+        job.refresh_from_db()
+        self.assertIsNotNone(job.completed_date)
+        self.assertIsNone(job.profile_id)
+        self.assertEqual(job.attempts, 2)
+        self.assertGreater(job.deleted_rows, 30)
+
+        self.assertFalse(User.objects.filter(username="alice").exists())
+        self.assertFalse(Discussion.objects.filter(pk=discussion.pk).exists())
+        self.assertFalse(Event.objects.filter(pk=event.pk).exists())
+        self.assertEqual(list(Comment.objects.values_list("contents", flat=True)), ["Sauna talk"])
+        self.assertEqual(FriendRequest.objects.count(), 0)
+        group.refresh_from_db()
+        self.assertEqual((group.creator, group.participant_count, group.discussion_count, group.comment_count),
+                         (None, 1, 1, 1))
+        kept.refresh_from_db()
+        self.assertEqual(kept.approval, 1)
+        bobs_event.refresh_from_db()
+        self.assertEqual(bobs_event.participant_count, 0)
+        self.assertEqual(list(friend_graph.friends(bob.pk)), [])
+        self.assertEqual(search.search("comment").facets, {})
+
+        from firstfloor.counters import reconcile
+        self.assertEqual(reconcile(), {"discussiongroup": 0, "discussion": 0, "event": 0})
 
 class ModelViewTests(TestCase):
     """
     TODO
     """
 
+    def test_search_view(self):
+        """
+        The search page lists results and their facets.
+        """
+
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        Discussion.objects.create(title="Saunas of Tampere", creator=alice)
+
+        response = Client().get(reverse("search"), {"search": "sauna"})
+        self.assertContains(response, "Saunas of Tampere")
+        self.assertContains(response, "Discussion (1)")
+        response = Client().get(reverse("search"), {"search": "sauna", "cursor": "???"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_people_autocomplete_view(self):
+        """
+        The autocomplete endpoint returns matching people as JSON.
+        """
+
+        Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        client = Client()
+        client.login(username="alice", password="password")
+        response = client.get(reverse("firstfloor:people_autocomplete"), {"q": "ali"})
+        self.assertEqual([person["username"] for person in response.json()["results"]], ["alice"])
+        response = client.get(reverse("firstfloor:people_autocomplete"), {"q": "ali", "limit": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_friend_requests_view(self):
+        """
+        Pending friend requests are only shown to their owner,
+        if they have a Profile.
+        """
+
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        bob = Profile.objects.create(user=User.objects.create_user("bob", "", "password"), location="Tampere")
+        bob.send_friend_request(alice)
+
+        client = Client()
+        client.login(username="alice", password="password")
+        response = client.get(reverse("firstfloor:friend_requests", args=["alice"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "bob")
+
+        response = client.get(reverse("firstfloor:friend_requests", args=["bob"]))
+        self.assertEqual(response.status_code, 404)
+        response = client.get(reverse("firstfloor:friend_requests", args=["alice"]), {"incoming": "???"})
+        self.assertEqual(response.status_code, 400)
+
+        # Users without a Profile, such as superusers, have no requests.
+        User.objects.create_superuser("admin", "", "password")
+        client.login(username="admin", password="password")
+        response = client.get(reverse("firstfloor:friend_requests", args=["admin"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_discussion_thread_view(self):
+        """
+        Threads are returned as JSON, and discussions of restricted
+        groups only to their participants.
+        """
+
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        bob = Profile.objects.create(user=User.objects.create_user("bob", "", "password"), location="Tampere")
+        group = DiscussionGroup.objects.create(title="Saunas", description="", creator=alice, invitation_required=True)
+        group.participants.add(alice)
+        discussion = Discussion.objects.create(creator=alice, related_group=group)
+        for index in range(3):
+            Comment.objects.create(commenter=bob, contents="Comment {}".format(index), related_discussion=discussion)
+
+        client = Client()
+        client.login(username="alice", password="password")
+        path = reverse("firstfloor:discussion_thread", args=[discussion.pk])
+        response = client.get(path, {"limit": 2})
+        body = response.json()
+        self.assertEqual([comment["contents"] for comment in body["results"]], ["Comment 0", "Comment 1"])
+        self.assertEqual(body["results"][0]["commenter"], "bob")
+        response = client.get(path, {"limit": 2, "cursor": body["next"]})
+        self.assertEqual([comment["contents"] for comment in response.json()["results"]], ["Comment 2"])
+        self.assertIsNone(response.json()["next"])
+
+        self.assertEqual(client.get(path, {"order": "random"}).status_code, 400)
+        self.assertEqual(client.get(path, {"cursor": "???"}).status_code, 400)
+
+        client.login(username="bob", password="password")
+        self.assertEqual(client.get(path).status_code, 404)
+
+    def test_calendar_view(self):
+        """
+        Calendar feeds list the events of a Profile as iCalendar,
+        with folded lines and escaped text, and need a valid token.
+        """
+
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        bob = Profile.objects.create(user=User.objects.create_user("bob", "", "password"), location="Tampere")
+        start = timezone.now() + timedelta(days=1)
+        event = Event.objects.create(title="Sauna, lake; ☃", description="Bring a towel.\n" + "Löyly " * 30,
+                                     host=bob, location="Tampere", start_date=start, end_date=start + timedelta(hours=3))
+        event.join(alice)
+        Event.objects.create(title="Other", description="", host=bob, location="Tampere")
+
+        response = Client().get(reverse("firstfloor:calendar", args=[calendar_token(alice)]))
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        feed = b"".join(response.streaming_content)
+        lines = feed.split(b"\r\n")
+        self.assertTrue(all(len(line) <= 75 for line in lines))
+        unfolded = feed.replace(b"\r\n ", b"").decode("utf-8")
+        self.assertIn("SUMMARY:Sauna\\, lake\\; ☃\r\n", unfolded)
+        self.assertIn("DESCRIPTION:Bring a towel.\\nLöyly", unfolded)
+        self.assertIn("UID:event-{}@".format(event.pk), unfolded)
+        self.assertEqual(unfolded.count("BEGIN:VEVENT"), 1)
+        self.assertTrue(unfolded.endswith("END:VCALENDAR\r\n"))
+
+        response = Client().get(reverse("firstfloor:calendar", args=[calendar_token(alice) + "x"]))
+        self.assertEqual(response.status_code, 404)
+
+        # Tokens are revoked by replacing the secret of the Profile.
+        token = calendar_token(alice)
+        self.assertNotEqual(token, calendar_token(bob))
+        client = Client()
+        client.login(username="alice", password="password")
+        self.assertRedirects(client.post(reverse("firstfloor:reset_calendar")), reverse("firstfloor:profile_overview"),
+                             fetch_redirect_response=False)
+        self.assertEqual(Client().get(reverse("firstfloor:calendar", args=[token])).status_code, 404)
+        alice.refresh_from_db()
+        self.assertEqual(Client().get(reverse("firstfloor:calendar", args=[calendar_token(alice)])).status_code, 200)
+
+    def test_export_view(self):
+        """
+        Exports of personal data stream every section of a Profile as
+        a ZIP archive or NDJSON, with one query per section regardless
+        of the size of the history.
+        """
+
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "alice@example.com", "password"), location="Tampere")
+        bob = Profile.objects.create(user=User.objects.create_user("bob", "", "password"), location="Tampere")
+        alice.friend_list.add(bob)
+        FriendRequest.objects.create(sender=bob, receiver=alice, status=True)
+        group = DiscussionGroup.objects.create(title="Saunas", description="", creator=bob)
+        group.join(alice)
+        discussion = Discussion.objects.create(title="Löyly", creator=alice, related_group=group)
+        Comment.objects.bulk_create([Comment(commenter=alice, contents="Comment {}".format(index), related_discussion=discussion)
+                                     for index in range(50)])
+        Comment.objects.create(commenter=bob, contents="Not alice's", related_discussion=discussion)
+        Event.objects.create(title="Sauna night", description="", host=alice, location="Tampere")
+
+        client = Client()
+        client.login(username="alice", password="password")
+        with mock.patch("firstfloor.export.WRITE_BUFFER_SIZE", 256):
+            response = client.get(reverse("firstfloor:export"))
+            self.assertEqual(response["Content-Type"], "application/zip")
+            with self.assertNumQueries(11):
+                chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 2)
+
+        with zipfile.ZipFile(BytesIO(b"".join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), ["profile.json", "friends.ndjson", "friend_requests.ndjson", "comments.ndjson",
+                                                  "comment_votes.ndjson", "discussions.ndjson", "groups.ndjson", "events.ndjson"])
+            self.assertEqual(json.loads(archive.read("profile.json"))["email"], "alice@example.com")
+            comments = [json.loads(line) for line in archive.read("comments.ndjson").splitlines()]
+            self.assertEqual([comment["contents"] for comment in comments], ["Comment {}".format(index) for index in range(50)])
+            groups = [json.loads(line) for line in archive.read("groups.ndjson").splitlines()]
+            self.assertEqual(groups, [{"id": group.pk, "title": "Saunas", "relation": "participant"}])
+
+        response = client.get(reverse("firstfloor:export"), {"format": "ndjson"})
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(records[0]["type"], "profile")
+        self.assertEqual([record["friend"] for record in records if record["type"] == "friends"], ["bob"])
+        self.assertEqual(sum(record["type"] == "comments" for record in records), 50)
+        self.assertEqual([record["relation"] for record in records if record["type"] == "events"], ["host"])
+        self.assertNotIn("password", json.dumps(records))
+
+        self.assertEqual(client.get(reverse("firstfloor:export"), {"format": "xml"}).status_code, 400)
+
+    def test_delete_account_view(self):
+        """
+        Deleting an account asks for confirmation, then logs the user
+        out and leaves the deletion to the background job.
+        """
+
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        client = Client()
+        client.login(username="alice", password="password")
+        self.assertContains(client.get(reverse("firstfloor:delete_account")), "Delete Account")
+
+        response = client.post(reverse("firstfloor:delete_account"))
+        self.assertRedirects(response, reverse("firstfloor:login_prompt"))
+        self.assertEqual(alice.deletion_jobs.get().username, "alice")
+        self.assertFalse(User.objects.get(username="alice").is_active)
+        self.assertEqual(client.get(reverse("firstfloor:profile_overview")).status_code, 302)
+
     def test_profile_view(self):
         """
         TODO
         """
 
         pass
+
+class AdminChangeListTests(TestCase):
+    """
+    The admin change lists of firstfloor models have to render with
+    a constant number of queries, regardless of the number of rows.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_changelist_query_counts
+    test_changelist_keyset_pages
+    test_changelist_search_unindexed
+    """
+
+    models = ["profile", "friendrequest", "discussiongroup", "discussion", "comment", "commentvote", "event", "accountdeletion"]
+
+    def setUp(self):
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client = Client()
+        self.client.login(username="admin", password="password")
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            sender = Profile.objects.create(user=User.objects.create_user("user{}".format(self.rows), "", "password"), location="Tampere")
+            receiver = Profile.objects.create(user=User.objects.create_user("other{}".format(self.rows), "", "password"), location="Tampere")
+            sender.send_friend_request(receiver)
+            group = DiscussionGroup.objects.create(title="Group", description="Group", creator=sender)
+            discussion = Discussion.objects.create(title="Discussion", creator=sender, related_group=group)
+            comment = Comment.objects.create(commenter=sender, contents="Comment", related_discussion=discussion)
+            comment.add_approval(True, voter=receiver)
+            Event.objects.create(title="Event", description="Event", host=sender, location="Tampere")
+
+    def changelist_query_counts(self):
+        query_counts = {}
+        for model in self.models:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse("admin:firstfloor_{}_changelist".format(model)))
+            self.assertEqual(response.status_code, 200)
+            query_counts[model] = len(context.captured_queries)
+        return query_counts
+
+    def test_changelist_query_counts(self):
+        """
+        Query counts do not grow with the number of rows.
+        """
+
+        self.add_rows(2)
+        few_rows = self.changelist_query_counts()
+        self.add_rows(8)
+        many_rows = self.changelist_query_counts()
+        self.assertEqual(few_rows, many_rows)
+
+    def test_changelist_keyset_pages(self):
+        """
+        Keyset paginated change lists link to the next page, and
+        pages do not overlap.
+        """
+
+        self.add_rows(3)
+        url = reverse("admin:firstfloor_comment_changelist")
+        with mock.patch.object(CommentAdmin, "list_per_page", 2):
+            first_page = self.client.get(url)
+            second_page = self.client.get(url + first_page.context["cl"].next_page_url)
+
+        first_ids = [comment.pk for comment in first_page.context["cl"].result_list]
+        second_ids = [comment.pk for comment in second_page.context["cl"].result_list]
+        self.assertEqual(len(first_ids), 2)
+        self.assertEqual(len(second_ids), 1)
+        self.assertEqual(sorted(first_ids + second_ids, reverse=True), first_ids + second_ids)
+        self.assertIsNone(second_page.context["cl"].next_page_url)
+        self.assertEqual(self.client.get(url, {"after": "x"}).status_code, 302)
+
+        # Searches are answered from the name keys and the search index.
+        response = self.client.get(reverse("admin:firstfloor_profile_changelist"), {"q": "user1"})
+        self.assertEqual([profile.user.username for profile in response.context["cl"].result_list], ["user1"])
+        response = self.client.get(url, {"q": "comm"})
+        self.assertEqual(len(response.context["cl"].result_list), 3)
+
+    def test_changelist_search_unindexed(self):
+        """
+        Rows left out of the search index are found by the prefix of
+        their title, or of the name of their commenter.
+        """
+
+        self.add_rows(1)
+        alice = Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        hidden = DiscussionGroup.objects.create(title="Hidden", description="", passphrase="löyly")
+        discussion = Discussion.objects.create(title="Secret sauna", creator=alice, related_group=hidden)
+        comment = Comment.objects.create(commenter=alice, contents="Secret löyly", related_discussion=discussion)
+        event = Event.objects.create(title="Secret sauna night", description="", host=alice, location="Tampere", private=True)
+        public = Event.objects.create(title="Sauna night", description="Not a secret", host=alice, location="Tampere")
+
+        def found(model, term):
+            response = self.client.get(reverse("admin:firstfloor_{}_changelist".format(model)), {"q": term})
+            return {row.pk for row in response.context["cl"].result_list}
+
+        self.assertEqual(found("discussion", "Secret"), {discussion.pk})
+        self.assertEqual(found("event", "Secret"), {event.pk, public.pk})
+        self.assertEqual(found("comment", "alice"), {comment.pk})
+        self.assertEqual(found("comment", "löyly"), set())
+        self.assertEqual(found("discussiongroup", "Hidd"), {hidden.pk})
+
+class InstrumentationTests(TestCase):
+    """
+    Every request is measured by the instrumentation middleware.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_server_timing
+    test_metrics_export
+    test_metrics_token
+    test_repeated_queries
+    """
+
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing(self):
+        """
+        Responses report query counts and timings in Server-Timing.
+        """
+
+        Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        client = Client()
+        client.login(username="alice", password="password")
+        response = client.get(reverse("firstfloor:profile", args=["alice"]))
+        server_timing = response["Server-Timing"]
+        self.assertRegex(server_timing, r'^db;dur=[0-9.]+;desc="[1-9][0-9]* queries, [0-9]+ repeated", tpl;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+    def test_metrics_export(self):
+        """
+        Measurements are aggregated per view and exported only locally.
+        """
+
+        client = Client()
+        client.get(reverse("about"))
+        client.get(reverse("about"))
+        client.get("/no-such-page/")
+
+        exported = client.get(reverse("metrics")).content.decode()
+        self.assertIn('groundfloor_request_queries_count{view="about"} 2', exported)
+        self.assertIn('groundfloor_request_queries_bucket{view="about",le="0"} 2', exported)
+        self.assertIn('groundfloor_request_duration_seconds_count{view="<unresolved>"} 1', exported)
+        self.assertIn("firstfloor_vote_buffer_depth", exported)
+
+        response = client.get(reverse("metrics"), REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_token(self):
+        """
+        With a token, metrics are exported to clients that send it from
+        any address, and to no one else.
+        """
+
+        client = Client()
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(client.get(reverse("metrics")).status_code, 404)
+            response = client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer other")
+            self.assertEqual(response.status_code, 404)
+            response = client.get(reverse("metrics"), REMOTE_ADDR="192.0.2.1", HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, 200)
+
+    def test_repeated_queries(self):
+        """
+        Requests that repeat the same query are flagged.
+        """
+
+        def repeating_search(*args, **kwargs):
+            User.objects.count()
+            User.objects.count()
+            return search.SearchPage([], None, {})
+
+        repeating_search = mock.patch("groundfloor.views.search_engine.search", side_effect=repeating_search)
+        with repeating_search, override_settings(INSTRUMENTATION_REPEATED_QUERY_THRESHOLD=2):
+            with self.assertLogs("groundfloor.instrumentation", "WARNING"):
+                Client().get(reverse("search"), {"search": "sauna"})
+            with override_settings(INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES=True):
+                with self.assertRaises(RepeatedQueriesError):
+                    Client().get(reverse("search"), {"search": "sauna"})
+        self.assertIn('groundfloor_repeated_query_requests_total{view="search"} 1', registry.export())
+
+class PageCacheTests(TestCase):
+    """
+    Static pages are served from the page cache.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_anonymous_pages
+    test_page_variants
+    test_root_fragments
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages(self):
+        """
+        Anonymous visitors are served cached pages without queries or
+        rendering, and unchanged pages are not sent again.
+        """
+
+        client = Client()
+        first = client.get(reverse("about"))
+        self.assertTrue(first.templates)
+        with CaptureQueriesContext(connection) as context:
+            second = client.get(reverse("about"))
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertFalse(second.templates)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertIn("Cookie", second["Vary"])
+
+        response = client.get(reverse("about"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = client.get(reverse("about"), HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        with override_settings(DEPLOY_VERSION="next"):
+            self.assertTrue(client.get(reverse("about")).templates)
+
+    def test_page_variants(self):
+        """
+        Logged-in users and dark mode get pages of their own.
+        """
+
+        Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        client = Client()
+        self.assertNotContains(client.get(reverse("index")), reverse("firstfloor:profile", args=["alice"]))
+        anonymous_key = page_cache_key(client.get(reverse("index")).wsgi_request)
+
+        self.assertNotContains(client.get(reverse("index")), 'class="dark"')
+
+        # Dark mode is rendered into the page, so no theme is swapped on load.
+        client.cookies["darkmode"] = "true"
+        response = client.get(reverse("index"))
+        self.assertContains(response, '<html data-ng-app="app" class="dark">')
+        self.assertNotEqual(page_cache_key(response.wsgi_request), anonymous_key)
+        client.cookies["darkmode"] = "false"
+        self.assertEqual(page_cache_key(client.get(reverse("index")).wsgi_request), anonymous_key)
+
+        client.login(username="alice", password="password")
+        self.assertContains(client.get(reverse("index")), reverse("firstfloor:profile", args=["alice"]))
+        self.assertContains(client.get(reverse("index")), reverse("firstfloor:profile", args=["alice"]))
+
+    def test_root_fragments(self):
+        """
+        Cached fragments of root.html are kept apart by user.
+        """
+
+        Profile.objects.create(user=User.objects.create_user("alice", "", "password"), location="Tampere")
+        fragment_caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "template_fragments": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "fragments"},
+        }
+        with override_settings(CACHES=fragment_caches):
+            anonymous = Client()
+            alice = Client()
+            alice.login(username="alice", password="password")
+            for _ in range(2):
+                self.assertNotContains(anonymous.get(reverse("search")), "Log Out")
+                self.assertContains(alice.get(reverse("search")), "Log Out", count=1)
+
+class AssetPipelineTests(TestCase):
+    """
+    Static assets are bundled, hashed and compressed by build_assets.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_unbuilt_bundles
+    test_built_bundles
+    """
+
+    def test_unbuilt_bundles(self):
+        """
+        Until the assets are built, pages include the original files.
+        """
+
+        response = Client().get(reverse("search"))
+        self.assertContains(response, "https://code.jquery.com/jquery-3.5.1.min.js")
+        self.assertContains(response, "/static/secondfloor/js/toolbox_functions/app.js")
+        self.assertContains(response, "/static/groundfloor/css/general.css")
+        self.assertContains(response, "/static/groundfloor/css/theme.css")
+
+    def test_built_bundles(self):
+        """
+        Built bundles are included by their hashed names and served
+        precompressed with far-future cache headers.
+        """
+
+        with tempfile.TemporaryDirectory() as build_dir, tempfile.TemporaryDirectory() as static_root:
+            for path in VENDOR:
+                os.makedirs(os.path.dirname(os.path.join(build_dir, path)), exist_ok=True)
+                with open(os.path.join(build_dir, path), "w") as library:
+                    library.write("var library = 1;" * 100)
+
+            static_dirs = [os.path.join(os.path.dirname(os.path.dirname(__file__)), "static"), build_dir]
+            with override_settings(ASSET_BUILD_DIR=build_dir, STATIC_ROOT=static_root, STATICFILES_DIRS=static_dirs):
+                call_command("build_assets", "--offline", stdout=StringIO())
+                response = Client().get(reverse("search"))
+                self.assertNotContains(response, "https://code.jquery.com/")
+                self.assertRegex(response.content.decode(), r'<script src="/static/groundfloor/bundles/head\.[0-9a-f]{12}\.js">')
+
+                url = re.search(r'/static/groundfloor/bundles/site\.[0-9a-f]{12}\.css', response.content.decode()).group(0)
+                asset = Client().get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+                self.assertEqual(asset["Content-Encoding"], "gzip")
+                self.assertIn("immutable", asset["Cache-Control"])
+                self.assertEqual(gzip.decompress(b"".join(asset.streaming_content))[:5], b"body{")
+                asset.close()
+
+                asset = Client().get("/static/groundfloor/bundles/site.css")
+                self.assertNotIn("immutable", asset["Cache-Control"])
+                asset.close()
+
+class DatabaseTuningTests(TestCase):
+    """
+    Production settings and the tuned SQLite backend.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_connection_init
+    test_immediate_transactions
+    test_production_settings
+    """
+
+    def tuned_connection(self, path, **options):
+        settings_dict = dict(connection.settings_dict, NAME=path, OPTIONS=options)
+        return TunedSQLiteWrapper(settings_dict, alias="tuned")
+
+    def test_connection_init(self):
+        """
+        Pragmas and init commands are applied to every new connection.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            tuned = self.tuned_connection(os.path.join(directory, "tuned.sqlite3"), timeout=3,
+                                          pragmas={"journal_mode": "WAL", "synchronous": "NORMAL", "mmap_size": 2 ** 20},
+                                          init_command="CREATE TEMP TABLE initialized (id INTEGER)")
+            for _ in range(2):
+                with tuned.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone()[0], 1)
+                    cursor.execute("PRAGMA mmap_size")
+                    self.assertEqual(cursor.fetchone()[0], 2 ** 20)
+                    cursor.execute("PRAGMA busy_timeout")
+                    self.assertEqual(cursor.fetchone()[0], 3000)
+                    cursor.execute("SELECT COUNT(*) FROM initialized")
+                tuned.close()
+
+    def test_immediate_transactions(self):
+        """
+        Immediate transactions take the writer lock when they begin.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tuned.sqlite3")
+            tuned = self.tuned_connection(path, pragmas={"journal_mode": "WAL"}, transaction_mode="IMMEDIATE")
+            tuned.ensure_connection()
+            other = sqlite3.connect(path, timeout=0, isolation_level=None)
+            try:
+                tuned._start_transaction_under_autocommit()
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute("BEGIN IMMEDIATE")
+                tuned.cursor().execute("COMMIT")
+                other.execute("BEGIN IMMEDIATE")
+                other.execute("COMMIT")
+            finally:
+                other.close()
+                tuned.close()
+
+    def test_production_settings(self):
+        """
+        Production settings turn DEBUG off, take secrets from the
+        environment and switch to PostgreSQL when it is configured,
+        leaving the development settings as they are.
+        """
+
+        def production_settings(**environ):
+            with mock.patch.dict(os.environ, environ):
+                return importlib.reload(importlib.import_module("groundfloor.settings_production"))
+
+        with self.assertRaises(ImproperlyConfigured):
+            production_settings(DJANGO_SECRET_KEY="")
+
+        production = production_settings(DJANGO_SECRET_KEY="secret", DJANGO_ALLOWED_HOSTS="example.com, www.example.com",
+                                         POSTGRES_DB="")
+        self.assertFalse(production.DEBUG)
+        self.assertEqual(production.SECRET_KEY, "secret")
+        self.assertEqual(production.ALLOWED_HOSTS, ["example.com", "www.example.com"])
+        database = production.DATABASES["default"]
+        self.assertEqual(database["ENGINE"], "groundfloor.db.sqlite3")
+        self.assertGreater(database["CONN_MAX_AGE"], 0)
+        self.assertEqual(database["OPTIONS"]["pragmas"]["journal_mode"], "WAL")
+        self.assertEqual(production.TEMPLATES[0]["OPTIONS"]["loaders"][0][0], "django.template.loaders.cached.Loader")
+        self.assertEqual(settings.TEMPLATES[0]["OPTIONS"]["loaders"], settings.TEMPLATE_LOADERS)
+        self.assertIn("dummy", settings.CACHES["template_fragments"]["BACKEND"])
+
+        production = production_settings(DJANGO_SECRET_KEY="secret", POSTGRES_DB="jros", POSTGRES_POOLER="pgbouncer")
+        database = production.DATABASES["default"]
+        self.assertEqual(database["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(database["NAME"], "jros")
+        self.assertTrue(database["DISABLE_SERVER_SIDE_CURSORS"])
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Routing of reads to replicas, and pinning to the primary.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_read_routing
+    test_sticky_primary
+    test_streamed_response
+    test_production_replicas
+    test_sync_replicas
+    """
+
+    replicas = ["replica1", "replica2"]
+
+    def test_read_routing(self):
+        """
+        Reads go to one replica per task, except within transactions,
+        within read_from_primary and after a write. Without replicas,
+        the router has no opinion.
+        """
+
+        router = ReplicaRouter()
+
+        def route():
+            self.assertIn(router.db_for_read(Profile), self.replicas)
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Profile), "default")
+            with read_from_primary():
+                self.assertEqual(router.db_for_read(Profile), "default")
+            self.assertIn(router.db_for_read(Profile), self.replicas)
+            self.assertEqual(router.db_for_write(Profile), "default")
+            self.assertEqual(router.db_for_read(Profile), "default")
+
+            # A new task, such as a round of a command that keeps
+            # running, reads from a replica again, and sticks to it.
+            with new_task():
+                self.assertEqual(len({router.db_for_read(Profile) for _ in range(20)}), 1)
+                self.assertIn(router.db_for_read(Profile), self.replicas)
+            self.assertEqual(router.db_for_read(Profile), "default")
+
+        with override_settings(DATABASE_REPLICAS=self.replicas):
+            contextvars.Context().run(route)
+            self.assertFalse(router.allow_migrate("replica1", "firstfloor"))
+            self.assertIsNone(router.allow_migrate("default", "firstfloor"))
+        self.assertIsNone(router.db_for_read(Profile))
+        self.assertIsNone(router.db_for_write(Profile))
+
+    def test_sticky_primary(self):
+        """
+        A request that writes pins the visitor to the primary with a
+        cookie, and requests carrying the cookie read from the primary.
+        """
+
+        router = ReplicaRouter()
+        factory = RequestFactory()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Profile))
+            if request.method == "POST":
+                router.db_for_write(Profile)
+                reads.append(router.db_for_read(Profile))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        with override_settings(DATABASE_REPLICAS=self.replicas, REPLICA_PIN_SECONDS=10):
+            response = middleware(factory.get("/"))
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+            self.assertIn(reads[-1], self.replicas)
+
+            response = middleware(factory.post("/"))
+            self.assertIn(reads[-2], self.replicas)
+            self.assertEqual(reads[-1], "default")
+            self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 10)
+
+            pinned_request = factory.get("/")
+            pinned_request.COOKIES[PIN_COOKIE] = "1"
+            middleware(pinned_request)
+            self.assertEqual(reads[-1], "default")
+
+            middleware(factory.get("/"))
+            self.assertIn(reads[-1], self.replicas)
+
+        response = middleware(factory.post("/"))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_streamed_response(self):
+        """
+        The body of a streamed response is read within the task of its
+        request, after the view has returned, and leaves no pin behind.
+        """
+
+        router = ReplicaRouter()
+        factory = RequestFactory()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Profile))
+
+            def chunks():
+                for _ in range(3):
+                    reads.append(router.db_for_read(Profile))
+                    yield b"chunk"
+
+            return StreamingHttpResponse(chunks())
+
+        def stream(request):
+            reads.clear()
+            response = ReplicaPinningMiddleware(view)(request)
+            self.assertEqual(b"".join(response.streaming_content), b"chunk" * 3)
+            response.close()
+            # The stream has left no pin behind in the thread.
+            self.assertIsNone(_current.get())
+            return list(reads)
+
+        with override_settings(DATABASE_REPLICAS=self.replicas):
+            streamed = contextvars.Context().run(stream, factory.get("/"))
+            self.assertEqual(len(streamed), 4)
+            self.assertEqual(len(set(streamed)), 1)
+            self.assertIn(streamed[0], self.replicas)
+
+            pinned_request = factory.get("/")
+            pinned_request.COOKIES[PIN_COOKIE] = "1"
+            self.assertEqual(contextvars.Context().run(stream, pinned_request), ["default"] * 4)
+
+    def test_production_replicas(self):
+        """
+        Production settings configure a replica for every SQLite path
+        or PostgreSQL host given, mirroring the primary in tests.
+        """
+
+        def production_settings(**environ):
+            with mock.patch.dict(os.environ, environ):
+                return importlib.reload(importlib.import_module("groundfloor.settings_production"))
+
+        production = production_settings(DJANGO_SECRET_KEY="secret", POSTGRES_DB="", DJANGO_REPLICA_PIN_SECONDS="5",
+                                         DJANGO_SQLITE_REPLICA_PATHS="/tmp/replica1.sqlite3, /tmp/replica2.sqlite3")
+        self.assertEqual(production.DATABASE_REPLICAS, self.replicas)
+        self.assertEqual(production.REPLICA_PIN_SECONDS, 5)
+        replica = production.DATABASES["replica2"]
+        self.assertEqual(replica["ENGINE"], "groundfloor.db.sqlite3")
+        self.assertEqual(replica["NAME"], "/tmp/replica2.sqlite3")
+        self.assertEqual(replica["TEST"]["MIRROR"], "default")
+        self.assertNotIn("TEST", production.DATABASES["default"])
+
+        production = production_settings(DJANGO_SECRET_KEY="secret", POSTGRES_DB="jros", POSTGRES_PORT="5432",
+                                         POSTGRES_REPLICA_HOSTS="replica1.local:5433,replica2.local")
+        self.assertEqual(production.DATABASE_REPLICAS, self.replicas)
+        self.assertEqual((production.DATABASES["replica1"]["HOST"], production.DATABASES["replica1"]["PORT"]),
+                         ("replica1.local", "5433"))
+        self.assertEqual((production.DATABASES["replica2"]["HOST"], production.DATABASES["replica2"]["PORT"]),
+                         ("replica2.local", "5432"))
+        self.assertEqual(production.DATABASES["replica2"]["NAME"], "jros")
+
+        production = production_settings(DJANGO_SECRET_KEY="secret", POSTGRES_DB="", DJANGO_SQLITE_REPLICA_PATHS="")
+        self.assertEqual(production.DATABASE_REPLICAS, [])
+
+    def test_sync_replicas(self):
+        """
+        sync_replicas copies the primary SQLite database into SQLite
+        replicas, which then serve the rows written before.
+        """
+
+        for name in ("alice", "bob", "carol"):
+            Profile.objects.create(user=User.objects.create_user(name, "", "password"), location="Tampere")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "replica1.sqlite3")
+            replica_settings = dict(connection.settings_dict, NAME=path, TEST={})
+            with mock.patch.dict(connections.databases, replica1=replica_settings), \
+                    override_settings(DATABASE_REPLICAS=["replica1"]):
+                try:
+                    call_command("sync_replicas", stdout=StringIO())
+                    self.assertEqual(Profile.objects.using("replica1").count(), 3)
+                    self.assertEqual(Profile.objects.count(), 3)
+                finally:
+                    connections["replica1"].close()
+                    del connections["replica1"]
+
+class QueryBudgetTests(TestCase):
+    """
+    Every view has a budget of queries and a ceiling of wall time,
+    measured against a realistic dataset seeded by the fixture
+    factory. A view exceeding its budget, repeating one query too
+    often or missing a budget entirely fails the test.
+
+    If the environment variable QUERY_BUDGET_REPORT is set, the
+    measurements are written into the file it names as JSON.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_query_budgets
+    """
+
+    # URL name: (URL arguments, GET-parameters, query budget, wall time ceiling in seconds).
+    # Requests are made by a logged-in user, which costs two queries
+    # (session and User) on views that use either.
+    budgets = {
+        "index": ([], {}, 2, 0.5),
+        "forum": ([], {}, 2, 0.5),
+        "about": ([], {}, 2, 0.5),
+        "contact": ([], {}, 2, 0.5),
+        "help": ([], {}, 2, 0.5),
+        "rules": ([], {}, 2, 0.5),
+        "guidelines": ([], {}, 2, 0.5),
+        "report_abuse": ([], {}, 2, 0.5),
+        "privacy_policy": ([], {}, 2, 0.5),
+        "feedback": ([], {}, 2, 0.5),
+        "customer_support": ([], {}, 2, 0.5),
+        "report_bug": ([], {}, 2, 0.5),
+        "search": ([], {"search": "sauna lake"}, 6, 1.0),
+        "metrics": ([], {}, 0, 0.5),
+        "firstfloor:login_prompt": ([], {}, 2, 0.5),
+        "firstfloor:login": ([], {}, 2, 0.5),
+        "firstfloor:new_account_prompt": ([], {}, 2, 0.5),
+        "firstfloor:new_account": ([], {}, 2, 0.5),
+        "firstfloor:logout": ([], {}, 4, 0.5),
+        "firstfloor:delete_account": ([], {}, 2, 0.5),
+        "firstfloor:profile_overview": ([], {}, 3, 0.5),
+        "firstfloor:profile": (["user1"], {}, 3, 0.5),
+        "firstfloor:friend_requests": (["user0"], {}, 5, 0.5),
+        "firstfloor:people": ([], {}, 2, 0.5),
+        "firstfloor:people_autocomplete": ([], {"q": "ai"}, 3, 0.5),
+        "firstfloor:discussion_thread": (lambda dataset: [Discussion.objects.filter(pk__in=dataset.discussion_ids, related_group=None).earliest("pk").pk],
+                                         {"order": "approval"}, 4, 0.5),
+        "firstfloor:calendar": (lambda dataset: [calendar_token(Profile.objects.get(pk=dataset.profile_ids[0]))], {}, 2, 0.5),
+        "firstfloor:reset_calendar": ([], {}, 4, 0.5),
+        # Session, User and Profile, and one query for each of the 11
+        # sections of the export, as long as they fit in one chunk.
+        "firstfloor:export": ([], {}, 14, 0.5),
+        "firstfloor:groups": ([], {}, 3, 0.5),
+        "firstfloor:events": ([], {}, 3, 0.5),
+        "secondfloor:toolbox_general": ([], {}, 2, 0.5),
+        "secondfloor:convert_base": ([], {}, 0, 0.5),
+        "secondfloor:base64_encode": ([], {}, 0, 0.5),
+        "secondfloor:base64_decode": ([], {}, 0, 0.5),
+        "secondfloor:base64_encode_stream": ([], {}, 0, 0.5),
+        "secondfloor:base64_decode_stream": ([], {}, 0, 0.5),
+        "secondfloor:caesar": ([], {}, 0, 0.5),
+    }
+
+    # URL name: (body, content type) of views that only accept POST.
+    posts = {
+        "firstfloor:reset_calendar": ("", "application/x-www-form-urlencoded"),
+        "secondfloor:convert_base": (json.dumps({"inputs": ["255", "1000"], "from_base": 10, "to_base": 16}), "application/json"),
+        "secondfloor:base64_encode": (json.dumps({"inputs": ["sauna", "lake"]}), "application/json"),
+        "secondfloor:base64_decode": (json.dumps({"inputs": ["c2F1bmE=", "bGFrZQ=="]}), "application/json"),
+        "secondfloor:base64_encode_stream": (b"sauna by the lake", "application/octet-stream"),
+        "secondfloor:base64_decode_stream": (b"c2F1bmEgYnkgdGhlIGxha2U=", "application/octet-stream"),
+        "secondfloor:caesar": (json.dumps({"inputs": ["sauna", "lake"], "shift": 3}), "application/json"),
+    }
+
+    # Views that are not measured.
+    exempt = {"static"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = factories.seed()
+        # As kept up to date by manage.py refresh_leaderboards.
+        get_leaderboards().refresh()
+
+    def url_names(self, resolver=None, namespace=""):
+        # Names of every URL pattern, except those of the admin site.
+        names = set()
+        for pattern in (resolver or get_resolver()).url_patterns:
+            if isinstance(pattern, URLResolver):
+                if pattern.namespace != "admin":
+                    names |= self.url_names(pattern, namespace + pattern.namespace + ":" if pattern.namespace else namespace)
+            elif pattern.name:
+                names.add(namespace + pattern.name)
+        return names
+
+    def test_query_budgets(self):
+        """
+        Views stay within their query budgets and wall time ceilings.
+        """
+
+        self.assertEqual(self.url_names() - set(self.budgets) - self.exempt, set(), "Views without a query budget.")
+
+        measurements = []
+        with override_settings(INSTRUMENTATION_REPEATED_QUERY_THRESHOLD=5, INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES=True):
+            for name, (args, params, budget, ceiling) in sorted(self.budgets.items()):
+                client = Client()
+                client.login(username="user0", password=factories.PASSWORD)
+                # Arguments that refer to seeded rows are given as
+                # functions of the dataset.
+                path = reverse(name, args=args(self.dataset) if callable(args) else args)
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    if name in self.posts:
+                        body, content_type = self.posts[name]
+                        response = client.post(path, body, content_type=content_type)
+                    else:
+                        response = client.get(path, params)
+                    # Streamed responses query the database while
+                    # their content is being consumed.
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                    seconds = time.perf_counter() - start
+                measurements.append({
+                    "view": name,
+                    "path": path,
+                    "status": response.status_code,
+                    "queries": len(context.captured_queries),
+                    "budget": budget,
+                    "seconds": round(seconds, 6),
+                    "ceiling": ceiling,
+                })
+
+        report = os.environ.get("QUERY_BUDGET_REPORT")
+        if report:
+            with open(report, "w") as report_file:
+                json.dump({
+                    "dataset": {field: len(ids) for field, ids in self.dataset._asdict().items()},
+                    "views": measurements,
+                }, report_file, indent=2)
+
+        for measurement in measurements:
+            with self.subTest(view=measurement["view"]):
+                self.assertLess(measurement["status"], 400)
+                self.assertLessEqual(measurement["queries"], measurement["budget"], "Query budget exceeded.")
+                self.assertLessEqual(measurement["seconds"], measurement["ceiling"], "Wall time ceiling exceeded.")
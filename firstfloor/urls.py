@@ -9,11 +9,17 @@ urlpatterns = [
     path('new-account/', views.new_account_prompt, name='new_account_prompt'),
     path('creating-account/', views.new_account, name='new_account'),
     path('logout/', views.logout, name='logout'),
+    path('delete-account/', views.delete_account, name='delete_account'),
     path('profile/', views.profile_overview, name='profile_overview'),
     path('profile/<str:profilename>/', views.profile, name='profile'),
     #path('profile/<str:username>/friend-list/', views.profile_friend_list, name='friend_list'),
-    #path('profile/<str:username>/friend-requests/', views.profile_friend_requests, name='friend_requests'),
+    path('profile/<str:username>/friend-requests/', views.profile_friend_requests, name='friend_requests'),
     path('people/', views.people, name='people'),
+    path('people/autocomplete/', views.people_autocomplete, name='people_autocomplete'),
+    path('discussions/<int:discussion_id>/comments/', views.discussion_thread, name='discussion_thread'),
+    path('calendar/<str:token>.ics', views.profile_calendar, name='calendar'),
+    path('calendar/reset/', views.reset_calendar, name='reset_calendar'),
+    path('export/', views.profile_export, name='export'),
     path('groups/', views.groups, name='groups'),
     path('events/', views.events, name='events')
 ]
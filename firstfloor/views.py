@@ -1,12 +1,23 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.http import HttpResponse, Http404, HttpResponseRedirect
+from django.http import HttpResponse, Http404, HttpResponseRedirect, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login as dj_login, logout as dj_logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from datetime import timedelta
 
-from firstfloor.models import Profile
+from firstfloor.deletion import request_deletion
+from firstfloor.export import FORMATS as EXPORT_FORMATS, stream_ndjson, stream_zip
+from firstfloor.ics import calendar_token, profile_of, reset_calendar_token, stream_calendar
+from firstfloor.models import Profile, Discussion, Event
+from firstfloor.people import find_people
+from firstfloor.ranking import get_leaderboards
+from firstfloor.votebuffer import get_vote_buffer
+
+# Calendar feeds include events that ended at most this many days ago.
+CALENDAR_HISTORY_DAYS = 90
 
 def login_prompt(request):
     """
@@ -17,7 +28,7 @@ def login_prompt(request):
     try:
         destination = request.GET["next"]
     except KeyError:
-        destination = "/profile_overview/"
+        destination = reverse("firstfloor:profile_overview")
 
     return render(request, "firstfloor/login.html", context = {"next": destination})
 
@@ -39,7 +50,8 @@ def login(request):
             login_error = "Invalid username/password."
             return render(request, "firstfloor/login.html", context = {"next": destination, "error": login_error})
     else:
-        render(request, "firstfloor/login.html", context = {"next": destination})
+        destination = request.GET.get("next", reverse("firstfloor:profile_overview"))
+        return render(request, "firstfloor/login.html", context = {"next": destination})
 
 def new_account_prompt(request):
     """
@@ -63,9 +75,9 @@ def new_account(request):
         new_email = request.POST["new-email"]
 
         if new_password == new_repeat_password:
-            new_user = User.objects.create_user(new_username, new_email, new_password)
-            new_user.first_name = new_firstname
-            new_user.last_name = new_lastname
+            new_user = User.objects.create_user(new_username, new_email, new_password,
+                                                first_name = new_firstname,
+                                                last_name = new_lastname)
             dj_login(request, new_user)
             new_profile = Profile.objects.create(user=new_user)
             return redirect(reverse("firstfloor:profile_overview"))
@@ -91,6 +103,22 @@ def logout(request):
     messages.add_message(request, messages.SUCCESS, "You have logged out successfully!")
     return redirect(reverse("firstfloor:login_prompt"))
 
+@login_required(login_url = "firstfloor:login_prompt")
+def delete_account(request):
+    """
+    Deletion of the account of the logged-in user. Asks for
+    confirmation, and upon it, logs the user out. The account is
+    disabled at once and deleted in the background.
+    """
+
+    if request.method == "POST":
+        profile = get_object_or_404(Profile.objects.select_related("user"), user = request.user)
+        request_deletion(profile)
+        dj_logout(request)
+        messages.add_message(request, messages.SUCCESS, "Your account will be deleted shortly.")
+        return redirect(reverse("firstfloor:login_prompt"))
+    return render(request, "firstfloor/delete_account.html", context = None)
+
 def logout_landing(request):
     """
     The landing site upon logging out.
@@ -110,7 +138,9 @@ def profile_overview(request):
 
     # TODO
 
-    profile_context = {}
+    profile_context = {
+        "calendar_url": request.build_absolute_uri(reverse("firstfloor:calendar", args = [calendar_token(profile)])),
+    }
     return render(request,
                   "firstfloor/profile_overview.html",
                   context = profile_context)
@@ -121,8 +151,7 @@ def profile(request, profilename):
     Site for viewing a profile.
     """
 
-    target_user = User.objects.get(username = profilename)
-    profile = Profile.objects.get(user = target_user)
+    profile = get_object_or_404(Profile.objects.select_related("user"), user__username = profilename)
 
     # TODO
 
@@ -131,6 +160,34 @@ def profile(request, profilename):
                   "firstfloor/profile.html",
                   context = profile_context)
 
+@login_required(login_url = "firstfloor:login_prompt")
+def profile_friend_requests(request, username):
+    """
+    Site for viewing pending friend requests of a profile,
+    both incoming and outgoing. Only the owner of the profile
+    can view them. Both lists are paginated separately.
+    """
+
+    if request.user.get_username() != username:
+        raise Http404("Friend requests of other profiles are not available.")
+    profile = get_object_or_404(Profile, user = request.user)
+
+    try:
+        incoming, incoming_next = profile.incoming_friend_requests(cursor = request.GET.get("incoming"))
+        outgoing, outgoing_next = profile.outgoing_friend_requests(cursor = request.GET.get("outgoing"))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid page cursor.")
+
+    friend_requests_context = {
+        "incoming": incoming,
+        "incoming_next": incoming_next,
+        "outgoing": outgoing,
+        "outgoing_next": outgoing_next,
+    }
+    return render(request,
+                  "firstfloor/friend_requests.html",
+                  context = friend_requests_context)
+
 @login_required(login_url = "firstfloor:login_prompt")
 def people(request):
     """
@@ -138,10 +195,118 @@ def people(request):
     to find people.
     """
 
-    # TODO
-
     return render(request, "firstfloor/people.html", context = None)
 
+@login_required(login_url = "firstfloor:login_prompt")
+def people_autocomplete(request):
+    """
+    Type-ahead search for people. Returns the people whose name
+    starts with GET-parameter 'q' as JSON.
+    """
+
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit.")
+
+    return JsonResponse({"results": find_people(request.GET.get("q", ""), limit = limit)})
+
+@login_required(login_url = "firstfloor:login_prompt")
+def discussion_thread(request, discussion_id):
+    """
+    Comments of a discussion as JSON, a page at a time.
+    GET-parameter 'order' is 'oldest' (default), 'newest' or
+    'approval', and 'cursor' is the 'next' cursor of the previous page.
+    Discussions of groups that require an invitation or a passphrase
+    can only be read by the participants of the group.
+    """
+
+    discussion = get_object_or_404(Discussion.objects.select_related("related_group"), pk = discussion_id)
+    group = discussion.related_group
+    if group is not None and (group.invitation_required or group.passphrase):
+        if not group.participants.filter(user = request.user).exists():
+            raise Http404("Discussion not found.")
+
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        comments, next_cursor = discussion.thread(order = request.GET.get("order", "oldest"),
+                                                  cursor = request.GET.get("cursor"),
+                                                  limit = limit)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    approvals = get_vote_buffer().live_approvals(comments)
+    results = []
+    for comment in comments:
+        commenter = comment.commenter
+        results.append({
+            "id": comment.pk,
+            "commenter": commenter.user.username if commenter is not None else None,
+            "contents": comment.contents,
+            "creation_date": comment.creation_date,
+            "edit_date": comment.edit_date,
+            "approval": approvals[comment.pk],
+        })
+    return JsonResponse({"results": results, "next": next_cursor})
+
+def profile_calendar(request, token):
+    """
+    iCalendar feed of the events that a Profile hosts, participates in
+    or has been invited to, for calendar applications to subscribe to.
+    The Profile is identified by a signed token rather than a login,
+    which the Profile can revoke (reset_calendar).
+    Cancelled events are included, so that calendars remove them.
+    """
+
+    try:
+        profile = profile_of(token, Profile.objects.select_related("user"))
+    except ValueError:
+        raise Http404("Calendar not found.")
+
+    since = timezone.now() - timedelta(days = CALENDAR_HISTORY_DAYS)
+    events = (Event.objects
+              .of_profile(profile)
+              .filter(end_date__gt = since)
+              .order_by("start_date", "id")
+              .only("title", "description", "location", "start_date", "end_date", "cancelled", "private"))
+    username = profile.user.username
+    feed = stream_calendar(events.iterator(), "Events of {}".format(username), request.get_host())
+
+    response = StreamingHttpResponse(feed, content_type = "text/calendar; charset=utf-8")
+    response["Content-Disposition"] = 'inline; filename="{}.ics"'.format(username)
+    return response
+
+@login_required(login_url = "firstfloor:login_prompt")
+def reset_calendar(request):
+    """
+    Replaces the calendar feed address of the logged-in user, so that
+    the previous address stops working.
+    """
+
+    if request.method == "POST":
+        profile = get_object_or_404(Profile, user = request.user)
+        reset_calendar_token(profile)
+        messages.add_message(request, messages.SUCCESS, "Your calendar has a new address.")
+    return redirect(reverse("firstfloor:profile_overview"))
+
+@login_required(login_url = "firstfloor:login_prompt")
+def profile_export(request):
+    """
+    Download of the personal data of the logged-in user, as a ZIP
+    archive or, with ?format=ndjson, as NDJSON. The export is streamed
+    while it is read from the database.
+    """
+
+    export_format = request.GET.get("format", "zip")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unknown export format.")
+    profile = get_object_or_404(Profile.objects.select_related("user"), user = request.user)
+
+    chunks = stream_zip(profile) if export_format == "zip" else stream_ndjson(profile)
+    response = StreamingHttpResponse(chunks, content_type = EXPORT_FORMATS[export_format])
+    response["Content-Disposition"] = 'attachment; filename="{}-export.{}"'.format(profile.user.username, export_format)
+    return response
+
 def groups(request):
     """
     Group page. Contains a list of popular 'public'
@@ -149,9 +314,12 @@ def groups(request):
     a button for creating a group (requires logging in).
     """
 
-    # TODO
-
-    return render(request, "firstfloor/groups.html", context = None)
+    # Leaderboards are refreshed in the background, so listing them
+    # only costs a cache lookup.
+    groups_context = {
+        "popular_groups": get_leaderboards().groups(),
+    }
+    return render(request, "firstfloor/groups.html", context = groups_context)
 
 def events(request):
     """
@@ -160,6 +328,7 @@ def events(request):
     a button for creating an event (requires logging in).
     """
 
-    # TODO
-
-    return render(request, "firstfloor/events.html", context = None)
+    events_context = {
+        "popular_events": get_leaderboards().events(),
+    }
+    return render(request, "firstfloor/events.html", context = events_context)
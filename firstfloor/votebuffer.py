@@ -0,0 +1,623 @@
+"""
+Buffering of comment votes.
+
+Instead of writing every vote into the database as it arrives,
+votes are collected into a buffer where they are coalesced per
+comment, and flushed into the database in bulk once the buffering
+window has passed. Reads can merge the pending votes into the stored
+rating, so that ratings still appear to be up to date: the pending
+change of a vote is computed against the previous vote of the voter,
+buffered or stored, so voting the same way twice changes nothing.
+
+The buffer can be kept either in the memory of the process, or in
+a shared cache, in which case every process uses the same buffer.
+Buffers kept in process memory are flushed by a timer once their
+window passes, so that a quiet process does not hold on to votes.
+"""
+
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from firstfloor.models import Comment, CommentVote
+
+logger = logging.getLogger(__name__)
+
+
+class LocalVoteStore:
+    """
+    Vote store that keeps pending votes in the memory of the process.
+
+    ...
+
+    Attributes
+    ----------
+    ballots : dict
+        Pending votes of Profiles, keyed by (comment ID, voter ID).
+    anonymous : dict
+        Pending change in rating caused by anonymous votes,
+        keyed by comment ID.
+    deltas : dict
+        Pending change in rating, keyed by comment ID.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ballots = {}
+        self.anonymous = {}
+        self.deltas = {}
+
+    def ballot(self, comment_id, voter_id):
+        """
+        Getter for the pending vote of a Profile on a comment.
+
+        Parameters
+        ----------
+        comment_id : int
+            ID of the comment.
+        voter_id : int
+            ID of the Profile.
+
+        Returns
+        -------
+        bool
+            The pending vote, or None if there is none.
+        """
+
+        return self.ballots.get((comment_id, voter_id))
+
+    def add(self, comment_id, voter_id, approval_value, delta):
+        """
+        Adds a vote into the store.
+
+        Parameters
+        ----------
+        comment_id : int
+            ID of the comment that is voted on.
+        voter_id : int
+            ID of the Profile that voted. None for anonymous votes.
+        approval_value : bool
+            If True, the vote approves of the comment.
+        delta : int
+            Change in rating that the vote causes.
+        """
+
+        with self.lock:
+            if voter_id is None:
+                self.anonymous[comment_id] = self.anonymous.get(comment_id, 0) + (1 if approval_value else -1)
+            else:
+                self.ballots[(comment_id, voter_id)] = bool(approval_value)
+            self.deltas[comment_id] = self.deltas.get(comment_id, 0) + delta
+
+    def pending_delta(self, comment_id):
+        """
+        Getter for the pending change in rating of a comment.
+
+        Returns
+        -------
+        int
+            Change in rating once pending votes have been flushed.
+        """
+
+        return self.deltas.get(comment_id, 0)
+
+    def pending_deltas(self, comment_ids):
+        """
+        Getter for the pending changes in rating of several comments.
+
+        Parameters
+        ----------
+        comment_ids : iterable of int
+            IDs of the comments.
+
+        Returns
+        -------
+        dict
+            Pending change in rating, keyed by comment ID.
+            Comments without pending votes are left out.
+        """
+
+        deltas = self.deltas
+        return {comment_id: deltas[comment_id] for comment_id in comment_ids if comment_id in deltas}
+
+    def depth(self):
+        """
+        Getter for the number of pending entries.
+
+        Returns
+        -------
+        int
+            Number of coalesced votes waiting to be flushed.
+        """
+
+        return len(self.ballots) + len(self.anonymous)
+
+    def drain(self):
+        """
+        Removes all pending votes from the store.
+
+        Returns
+        -------
+        list of (int, int, bool)
+            Removed votes as (comment ID, voter ID, approval value)
+            -tuples, as expected by Comment.apply_votes.
+        dict
+            Removed change in rating, keyed by comment ID.
+        """
+
+        with self.lock:
+            votes = _as_votes(self.ballots, self.anonymous)
+            deltas = self.deltas
+            self.ballots = {}
+            self.anonymous = {}
+            self.deltas = {}
+        return votes, deltas
+
+    def restore(self, votes, deltas):
+        """
+        Puts drained votes back into the store. Votes that Profiles
+        have cast since then take precedence.
+
+        Parameters
+        ----------
+        votes : list of (int, int, bool)
+            The votes, as returned by drain.
+        deltas : dict
+            The change in rating, as returned by drain.
+        """
+
+        with self.lock:
+            for comment_id, voter_id, approval_value in votes:
+                if voter_id is None:
+                    self.anonymous[comment_id] = self.anonymous.get(comment_id, 0) + (1 if approval_value else -1)
+                else:
+                    self.ballots.setdefault((comment_id, voter_id), approval_value)
+            for comment_id, delta in deltas.items():
+                self.deltas[comment_id] = self.deltas.get(comment_id, 0) + delta
+
+
+class CacheVoteStore:
+    """
+    Vote store that keeps pending votes in a shared cache.
+
+    Votes are appended to a log, one key per vote, at the position
+    taken from an atomic counter. Pending rating changes are kept per
+    comment, as separate counters of increments and decrements (as
+    memcached does not go below zero), so a vote costs a few cache
+    operations regardless of how many votes are pending, and votes on
+    different comments never wait for each other. Only draining takes
+    a lock, acquired via cache.add.
+
+    The cache backend must implement add and incr atomically
+    (memcached, Redis and the local memory cache do, the database
+    cache does not).
+
+    ...
+
+    Attributes
+    ----------
+    cache : BaseCache
+        The cache that the pending votes are kept in.
+    lock_timeout : float
+        Number of seconds after which a lock is considered abandoned.
+    ballot_timeout : float
+        Number of seconds that the latest vote of a Profile is
+        remembered for.
+    """
+
+    lock_key = "votebuffer:lock"
+    head_key = "votebuffer:head"
+    tail_key = "votebuffer:tail"
+    entry_key = "votebuffer:entry:{}"
+    ballot_key = "votebuffer:ballot:{}:{}"
+    up_key = "votebuffer:up:{}"
+    down_key = "votebuffer:down:{}"
+
+    def __init__(self, cache, lock_timeout=5, ballot_timeout=3600):
+        self.cache = cache
+        self.lock_timeout = lock_timeout
+        self.ballot_timeout = ballot_timeout
+
+    def _acquire(self):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.cache.add(self.lock_key, token, self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Could not acquire the vote buffer lock.")
+            time.sleep(0.005)
+        return token
+
+    def _release(self, token):
+        if self.cache.get(self.lock_key) == token:
+            self.cache.delete(self.lock_key)
+
+    def _incr(self, key, delta):
+        self.cache.add(key, 0, timeout=None)
+        return self.cache.incr(key, delta)
+
+    def _adjust(self, comment_id, delta):
+        if delta > 0:
+            self._incr(self.up_key.format(comment_id), delta)
+        elif delta < 0:
+            self._incr(self.down_key.format(comment_id), -delta)
+
+    def _append(self, comment_id, voter_id, approval_value, delta):
+        self._adjust(comment_id, delta)
+        position = self._incr(self.tail_key, 1)
+        self.cache.set(self.entry_key.format(position), (comment_id, voter_id, bool(approval_value), delta), timeout=None)
+
+    def ballot(self, comment_id, voter_id):
+        """
+        Getter for the latest vote of a Profile on a comment,
+        whether flushed or not.
+        See LocalVoteStore.ballot.
+        """
+
+        return self.cache.get(self.ballot_key.format(comment_id, voter_id))
+
+    def add(self, comment_id, voter_id, approval_value, delta):
+        """
+        Adds a vote into the store.
+        See LocalVoteStore.add.
+        """
+
+        if voter_id is not None:
+            self.cache.set(self.ballot_key.format(comment_id, voter_id), bool(approval_value), self.ballot_timeout)
+        self._append(comment_id, voter_id, approval_value, delta)
+
+    def pending_delta(self, comment_id):
+        """
+        Getter for the pending change in rating of a comment.
+        See LocalVoteStore.pending_delta.
+        """
+
+        return self.pending_deltas([comment_id]).get(comment_id, 0)
+
+    def pending_deltas(self, comment_ids):
+        """
+        Getter for the pending changes in rating of several comments,
+        fetched from the cache at once.
+        See LocalVoteStore.pending_deltas.
+        """
+
+        keys = {}
+        for comment_id in comment_ids:
+            keys[self.up_key.format(comment_id)] = (comment_id, 1)
+            keys[self.down_key.format(comment_id)] = (comment_id, -1)
+        deltas = {}
+        for key, count in self.cache.get_many(list(keys)).items():
+            comment_id, sign = keys[key]
+            deltas[comment_id] = deltas.get(comment_id, 0) + sign * count
+        return {comment_id: delta for comment_id, delta in deltas.items() if delta != 0}
+
+    def depth(self):
+        """
+        Getter for the number of pending entries.
+
+        Returns
+        -------
+        int
+            Number of votes waiting to be flushed.
+        """
+
+        positions = self.cache.get_many([self.head_key, self.tail_key])
+        return positions.get(self.tail_key, 0) - positions.get(self.head_key, 0)
+
+    def drain(self):
+        """
+        Removes all pending votes from the store.
+        See LocalVoteStore.drain.
+        """
+
+        token = self._acquire()
+        try:
+            head = self.cache.get(self.head_key, 0)
+            tail = self.cache.get(self.tail_key, 0)
+            keys = [self.entry_key.format(position) for position in range(head + 1, tail + 1)]
+            entries = self.cache.get_many(keys)
+            if len(entries) < len(keys):
+                # Positions are taken before the votes are written:
+                # those being written are waited for, briefly. Votes
+                # that are still missing have been evicted.
+                time.sleep(0.01)
+                entries.update(self.cache.get_many([key for key in keys if key not in entries]))
+
+            votes = []
+            deltas = {}
+            counts = {}
+            for key in keys:
+                if key in entries:
+                    comment_id, voter_id, approval_value, delta = entries[key]
+                    votes.append((comment_id, voter_id, approval_value))
+                    deltas[comment_id] = deltas.get(comment_id, 0) + delta
+                    if delta:
+                        count_key = (self.up_key if delta > 0 else self.down_key).format(comment_id)
+                        counts[count_key] = counts.get(count_key, 0) + abs(delta)
+            for count_key, count in counts.items():
+                try:
+                    self.cache.decr(count_key, count)
+                except ValueError:
+                    # The counter has been evicted.
+                    pass
+            self.cache.set(self.head_key, tail, timeout=None)
+            self.cache.delete_many(keys)
+        finally:
+            self._release(token)
+        return votes, deltas
+
+    def restore(self, votes, deltas):
+        """
+        Puts drained votes back into the store.
+        See LocalVoteStore.restore.
+        """
+
+        deltas = dict(deltas)
+        for comment_id, voter_id, approval_value in votes:
+            self._append(comment_id, voter_id, approval_value, deltas.pop(comment_id, 0))
+        for comment_id, delta in deltas.items():
+            self._adjust(comment_id, delta)
+
+
+class VoteBuffer:
+    """
+    Collects comment votes and flushes them into the database in bulk.
+
+    ...
+
+    Attributes
+    ----------
+    store : LocalVoteStore or CacheVoteStore
+        The store that pending votes are kept in.
+    window : float
+        Number of seconds that votes are buffered for. If zero,
+        votes are written into the database immediately.
+    flush_count : int
+        Number of flushes that have written votes into the database.
+    flushed_votes : int
+        Number of votes that have been written into the database.
+    last_flush_seconds : float
+        Duration of the most recent flush, in seconds.
+    background : bool
+        Whether pending votes are flushed by a timer once the window
+        has passed, even if no more votes arrive.
+    """
+
+    def __init__(self, store=None, window=5.0, background=False):
+        self.store = store if store is not None else LocalVoteStore()
+        self.window = window
+        self.background = background
+        self.flush_count = 0
+        self.flushed_votes = 0
+        self.last_flush_seconds = 0.0
+        self.last_flush_time = time.monotonic()
+        self.timer = None
+        self.timer_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Creates a vote buffer as configured in the settings:
+        VOTE_BUFFER_WINDOW sets the buffering window in seconds, and
+        VOTE_BUFFER_CACHE names the cache to share the buffer in
+        (if None, the buffer is kept in the memory of the process).
+        The buffer is flushed in the background.
+
+        Returns
+        -------
+        VoteBuffer
+            The configured vote buffer.
+        """
+
+        cache_alias = getattr(settings, "VOTE_BUFFER_CACHE", None)
+        store = CacheVoteStore(caches[cache_alias]) if cache_alias else LocalVoteStore()
+        return cls(store=store, window=getattr(settings, "VOTE_BUFFER_WINDOW", 5.0), background=True)
+
+    def record(self, comment_id, voter_id, approval_value):
+        """
+        Records a vote on a comment. Flushes the buffer if
+        the buffering window has passed, and otherwise schedules
+        a flush in the background, if enabled.
+
+        Parameters
+        ----------
+        comment_id : int
+            ID of the comment that is voted on.
+        voter_id : int
+            ID of the Profile that voted. None for anonymous votes.
+        approval_value : bool
+            If True, approve of the comment.
+            If False, disapprove of the comment.
+        """
+
+        if self.window <= 0:
+            Comment.apply_votes([(comment_id, voter_id, approval_value)])
+            return
+
+        step = 1 if approval_value else -1
+        delta = step
+        if voter_id is not None:
+            previous = self.store.ballot(comment_id, voter_id)
+            if previous is None:
+                previous = (CommentVote.objects
+                            .filter(comment_id=comment_id, voter_id=voter_id)
+                            .values_list("approval", flat=True)
+                            .first())
+            if previous is not None:
+                # Only the most recent vote of a Profile counts.
+                delta -= 1 if previous else -1
+        self.store.add(comment_id, voter_id, approval_value, delta)
+
+        if time.monotonic() - self.last_flush_time >= self.window:
+            self.flush()
+        elif self.background:
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        """
+        Starts a timer that flushes the buffer once the window has
+        passed, unless one has been started already.
+        """
+
+        with self.timer_lock:
+            if self.timer is not None:
+                return
+            self.timer = threading.Timer(self.window, self._flush_in_background)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_in_background(self):
+        with self.timer_lock:
+            self.timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing buffered votes failed.")
+            self.schedule_flush()
+        finally:
+            # The timer thread has a database connection of its own.
+            connection.close()
+
+    def pending_delta(self, comment_id):
+        """
+        Getter for the pending change in rating of a comment.
+
+        Parameters
+        ----------
+        comment_id : int
+            ID of the comment.
+
+        Returns
+        -------
+        int
+            Change in rating that pending votes are expected to cause.
+        """
+
+        return self.store.pending_delta(comment_id)
+
+    def live_approval(self, comment):
+        """
+        Getter for the approval rating of a comment,
+        including votes that have not been flushed yet.
+
+        Parameters
+        ----------
+        comment : Comment
+            The comment instance.
+
+        Returns
+        -------
+        int
+            Approval rating of the comment.
+        """
+
+        return comment.approval + self.pending_delta(comment.pk)
+
+    def live_approvals(self, comments):
+        """
+        Getter for the approval ratings of several comments,
+        including votes that have not been flushed yet. Pending votes
+        are looked up once for all of the comments.
+
+        Parameters
+        ----------
+        comments : list<Comment>
+            The comment instances.
+
+        Returns
+        -------
+        dict
+            Approval rating, keyed by comment ID.
+        """
+
+        deltas = self.store.pending_deltas([comment.pk for comment in comments])
+        return {comment.pk: comment.approval + deltas.get(comment.pk, 0) for comment in comments}
+
+    def flush(self):
+        """
+        Writes all pending votes into the database.
+        If writing fails, the votes are put back into the buffer.
+
+        Returns
+        -------
+        dict
+            Change in approval rating, keyed by comment ID.
+        """
+
+        self.last_flush_time = time.monotonic()
+        votes, pending_deltas = self.store.drain()
+        if not votes:
+            return {}
+
+        start = time.perf_counter()
+        try:
+            deltas = Comment.apply_votes(votes)
+        except Exception:
+            self.store.restore(votes, pending_deltas)
+            raise
+        self.last_flush_seconds = time.perf_counter() - start
+        self.flush_count += 1
+        self.flushed_votes += len(votes)
+        return deltas
+
+    def metrics(self):
+        """
+        Getter for the metrics of the vote buffer.
+
+        Returns
+        -------
+        dict
+            'depth': Number of votes waiting to be flushed.
+            'flush_count': Number of flushes conducted.
+            'flushed_votes': Number of votes flushed.
+            'last_flush_seconds': Duration of the most recent flush.
+        """
+
+        return {
+            "depth": self.store.depth(),
+            "flush_count": self.flush_count,
+            "flushed_votes": self.flushed_votes,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+
+_vote_buffer = None
+
+
+def get_vote_buffer():
+    """
+    Getter for the vote buffer of the process.
+    The buffer is created from the settings on first use.
+
+    Returns
+    -------
+    VoteBuffer
+        The vote buffer of the process.
+    """
+
+    global _vote_buffer
+    if _vote_buffer is None:
+        _vote_buffer = VoteBuffer.from_settings()
+    return _vote_buffer
+
+
+def flush_vote_buffer():
+    """
+    Flushes the vote buffer of the process, if it has been created.
+    Used as a shutdown hook.
+    """
+
+    if _vote_buffer is not None:
+        _vote_buffer.flush()
+
+
+def _as_votes(ballots, anonymous):
+    votes = [(comment_id, voter_id, approval_value) for (comment_id, voter_id), approval_value in ballots.items()]
+    for comment_id, delta in anonymous.items():
+        approval_value = delta > 0
+        votes.extend([(comment_id, None, approval_value)] * abs(delta))
+    return votes
@@ -0,0 +1,362 @@
+"""
+Static asset pipeline.
+
+The build step (manage.py build_assets) turns the static files of the
+site into a few long-lived assets:
+1. Third-party libraries (VENDOR) are downloaded into ASSET_BUILD_DIR,
+   so that the site works without access to CDNs.
+2. The files of each bundle (BUNDLES) are concatenated and minified
+   into ASSET_BUILD_DIR, which is one of the STATICFILES_DIRS.
+3. collectstatic copies every static file into STATIC_ROOT with
+   a content hash in its name, and writes a manifest of the names.
+4. Compressible files in STATIC_ROOT get gzip and brotli variants.
+
+Templates refer to bundles with the asset_bundle tag. Until the assets
+have been built (and always in DEBUG), the tag refers to the original
+files instead, and libraries are loaded from their CDNs.
+
+Outside of DEBUG, the serve view answers requests for static files
+from STATIC_ROOT, preferring the precompressed variants. Files with
+a content hash in their name are cached by browsers for a year,
+without revalidation.
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+import urllib.request
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+# Third-party libraries: static path of the vendored copy, and the URL of the original.
+VENDOR = {
+    "groundfloor/vendor/jquery-3.5.1.min.js": "https://code.jquery.com/jquery-3.5.1.min.js",
+    "groundfloor/vendor/angular-1.6.9.min.js": "https://ajax.googleapis.com/ajax/libs/angularjs/1.6.9/angular.min.js",
+    "groundfloor/vendor/angular-animate-1.6.9.min.js": "https://ajax.googleapis.com/ajax/libs/angularjs/1.6.9/angular-animate.min.js",
+}
+
+# Bundles: static path of the bundle, and the static paths of its files in order.
+BUNDLES = {
+    "groundfloor/bundles/head.js": [
+        "groundfloor/vendor/jquery-3.5.1.min.js",
+        "groundfloor/vendor/angular-1.6.9.min.js",
+        "groundfloor/vendor/angular-animate-1.6.9.min.js",
+        "secondfloor/js/toolbox_functions/app.js",
+        "secondfloor/js/toolbox_functions/services.js",
+        "secondfloor/js/toolbox_functions/controllers.js",
+    ],
+    "groundfloor/bundles/site.js": [
+        "groundfloor/js/cookie_functions.js",
+        "groundfloor/js/dark_mode.js",
+        "groundfloor/js/privacy_notice.js",
+    ],
+    "groundfloor/bundles/site.css": [
+        "groundfloor/css/general.css",
+        "groundfloor/css/theme.css",
+    ],
+}
+
+# Extensions of files that are worth compressing.
+COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json", ".txt", ".map")
+
+# Files smaller than this are not compressed.
+MIN_COMPRESS_SIZE = 256
+
+# Lifetime of files without a content hash, in seconds.
+UNHASHED_MAX_AGE = 3600
+
+# Lifetime of files with a content hash, in seconds.
+HASHED_MAX_AGE = 365 * 24 * 3600
+
+
+class AssetStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage that names files by their content hash.
+    Files missing from the manifest, such as every file before the
+    first build, keep their original names.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def is_hashed(self, name):
+        """
+        Checks whether a name is the content-hashed name of a file.
+
+        Parameters
+        ----------
+        name : string
+            Path of the file, relative to STATIC_ROOT.
+
+        Returns
+        -------
+        bool
+            True, if the name contains a content hash.
+        """
+
+        if not hasattr(self, "_hashed_names"):
+            self._hashed_names = set(self.hashed_files.values())
+        return name in self._hashed_names
+
+
+def is_built(bundle_name):
+    """
+    Checks whether a bundle has been built and collected.
+
+    Parameters
+    ----------
+    bundle_name : string
+        Static path of the bundle.
+
+    Returns
+    -------
+    bool
+        True, if the bundle can be used instead of its files.
+    """
+
+    if settings.DEBUG:
+        return False
+    hashed_files = getattr(staticfiles_storage, "hashed_files", {})
+    return bundle_name in hashed_files
+
+
+def minify_js(source):
+    """
+    Minifies JavaScript. Uses rjsmin if it is installed; otherwise only
+    comments, indentation and blank lines are removed.
+
+    Parameters
+    ----------
+    source : string
+        JavaScript source.
+
+    Returns
+    -------
+    string
+        Minified JavaScript.
+    """
+
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+
+    lines = []
+    in_comment = False
+    for line in source.splitlines():
+        line = line.strip()
+        if in_comment:
+            if "*/" in line:
+                in_comment = False
+                line = line.split("*/", 1)[1].strip()
+            else:
+                continue
+        if line.startswith("/*"):
+            if "*/" not in line:
+                in_comment = True
+                continue
+            line = line.split("*/", 1)[1].strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def minify_css(source):
+    """
+    Minifies CSS. Uses rcssmin if it is installed; otherwise comments
+    and insignificant whitespace are removed.
+
+    Parameters
+    ----------
+    source : string
+        CSS source.
+
+    Returns
+    -------
+    string
+        Minified CSS.
+    """
+
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.DOTALL)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)
+    return source.replace(";}", "}").strip()
+
+
+def vendor(build_dir, download=True):
+    """
+    Makes sure that the third-party libraries are in the build
+    directory, downloading the missing ones.
+
+    Parameters
+    ----------
+    build_dir : string
+        The build directory.
+    download : bool
+        Whether missing libraries may be downloaded.
+
+    Returns
+    -------
+    list of string
+        Static paths of the downloaded libraries.
+
+    Raises
+    ------
+    FileNotFoundError
+        If a library is missing and may not be downloaded.
+    """
+
+    downloaded = []
+    for path, url in VENDOR.items():
+        target = os.path.join(build_dir, path)
+        if os.path.exists(target):
+            continue
+        if not download:
+            raise FileNotFoundError("{} has not been vendored.".format(path))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response, open(target + ".part", "wb") as part:
+            shutil.copyfileobj(response, part)
+        os.replace(target + ".part", target)
+        downloaded.append(path)
+    return downloaded
+
+
+def bundle(build_dir):
+    """
+    Writes every bundle into the build directory.
+
+    Parameters
+    ----------
+    build_dir : string
+        The build directory. It has to be one of STATICFILES_DIRS,
+        so that vendored libraries can be found.
+
+    Returns
+    -------
+    dict
+        Sizes of the bundles in bytes, keyed by static path.
+    """
+
+    sizes = {}
+    for bundle_name, paths in BUNDLES.items():
+        minify = minify_css if bundle_name.endswith(".css") else minify_js
+        parts = []
+        for path in paths:
+            source_path = finders.find(path)
+            if source_path is None:
+                raise FileNotFoundError("{} of bundle {} could not be found.".format(path, bundle_name))
+            with open(source_path, encoding="utf-8") as source_file:
+                source = source_file.read()
+            # Vendored libraries are minified already.
+            parts.append(source.strip() if path in VENDOR else minify(source))
+
+        # Scripts are separated with semicolons, in case one does not end with one.
+        content = (";\n" if bundle_name.endswith(".js") else "\n").join(parts) + "\n"
+        target = os.path.join(build_dir, bundle_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8") as target_file:
+            target_file.write(content)
+        sizes[bundle_name] = len(content.encode("utf-8"))
+    return sizes
+
+
+def compress(root):
+    """
+    Writes gzip and brotli (if installed) variants of the compressible
+    files in a directory. Variants that would not be smaller than the
+    original are not kept.
+
+    Parameters
+    ----------
+    root : string
+        The directory, usually STATIC_ROOT.
+
+    Returns
+    -------
+    int
+        Number of variants written.
+    """
+
+    count = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(directory, filename)
+            with open(path, "rb") as original:
+                data = original.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+
+            variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(data, quality=11)
+            for extension, compressed in variants.items():
+                if len(compressed) < len(data):
+                    with open(path + extension, "wb") as variant:
+                        variant.write(compressed)
+                    count += 1
+    return count
+
+
+def serve(request, path):
+    """
+    Serves a static file from STATIC_ROOT. A precompressed variant is
+    served if the client accepts it. Files with a content hash in their
+    name are cached for a year, other files for UNHASHED_MAX_AGE.
+    """
+
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404("Static file not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("Static file not found.")
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    accepted = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    encoding = None
+    for extension, name in ((".br", "br"), (".gz", "gzip")):
+        if name in accepted and os.path.isfile(full_path + extension):
+            full_path += extension
+            encoding = name
+            break
+
+    response = FileResponse(open(full_path, "rb"), content_type=content_type or "application/octet-stream")
+    if encoding:
+        response["Content-Encoding"] = encoding
+    if getattr(staticfiles_storage, "is_hashed", lambda name: False)(path):
+        response["Cache-Control"] = "public, max-age={}, immutable".format(HASHED_MAX_AGE)
+    else:
+        response["Cache-Control"] = "public, max-age={}".format(UNHASHED_MAX_AGE)
+    response["Last-Modified"] = http_date(os.path.getmtime(full_path))
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
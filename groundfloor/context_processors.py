@@ -0,0 +1,40 @@
+from django.conf import settings
+
+# Name of the cookie that holds the dark mode setting.
+DARKMODE_COOKIE = "darkmode"
+
+
+def is_darkmode(request):
+    """
+    Checks whether the visitor has enabled dark mode.
+
+    Parameters
+    ----------
+    request : HttpRequest
+        The request.
+
+    Returns
+    -------
+    bool
+        True, if dark mode is enabled.
+    """
+
+    return request.COOKIES.get(DARKMODE_COOKIE) == "true"
+
+
+def deployment(request):
+    """
+    Adds the version of the deployment into the context, so that
+    template fragments cached by earlier deployments are not used.
+    """
+
+    return {"deploy_version": getattr(settings, "DEPLOY_VERSION", "")}
+
+
+def darkmode(request):
+    """
+    Adds the dark mode setting of the visitor into the context, so
+    that pages are rendered with the right theme from the start.
+    """
+
+    return {"darkmode": is_darkmode(request)}
@@ -0,0 +1,262 @@
+"""
+Routing of reads to database replicas.
+
+ReplicaRouter sends reads to one of the replicas named in
+DATABASE_REPLICAS, and writes to the primary database ('default').
+The replica is picked at random once per request or task, so that its
+reads see one consistent state of the data, rather than one replica
+and then another that lags further behind. Replicas lag behind the
+primary, so reads go to the primary instead when they have to see
+recent writes:
+
+- Inside a transaction of the primary, so that a transaction reads
+  what it writes and locks the rows it reads (select_for_update).
+- For the rest of a request or task, once it has written anything.
+- Within read_from_primary, for reads whose results outlive the
+  request, such as cache fills.
+- For a while after a visitor's request has written anything.
+  ReplicaPinningMiddleware sets a cookie, valid for
+  REPLICA_PIN_SECONDS, on responses to requests that wrote, and pins
+  the requests that carry it to the primary. Sending a friend request
+  and then viewing the profile shows the request as sent, regardless
+  of replication lag.
+
+Without replicas the router has no opinion, and every query goes to
+'default' as before.
+
+Requests are tasks of their own (ReplicaPinningMiddleware), including
+the body of a streamed response, which is read after the view has
+returned. Code outside of requests, such as a management command, is
+one task from its first query on. Commands that keep running (--loop) start a new
+task for every round with new_task, so that a write in one round does
+not send the reads of every later round to the primary.
+
+Settings:
+DATABASE_REPLICAS: Aliases of the databases that are replicas of
+'default'.
+REPLICA_PIN_SECONDS: Number of seconds that reads of a visitor go to
+the primary after a write. 0 disables the cookie.
+
+Usage:
+    DATABASE_ROUTERS = ['groundfloor.db.routers.ReplicaRouter']
+    MIDDLEWARE = ['groundfloor.db.routers.ReplicaPinningMiddleware', ...]
+
+    while True:
+        with new_task():
+            ...
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Name of the cookie that pins a visitor to the primary.
+PIN_COOKIE = "replica_pin"
+
+# Pin of the request or task being handled in the current thread.
+_current = ContextVar("primary_pin", default=None)
+
+
+class PrimaryPin:
+    """
+    Whether the reads of a request or task go to the primary.
+
+    ...
+
+    Attributes
+    ----------
+    pinned : bool
+        Whether reads go to the primary regardless of writes.
+    wrote : bool
+        Whether anything has been written.
+    replica : string
+        Alias of the replica that reads go to otherwise. None until
+        the first read.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+    def reads_from_primary(self):
+        """
+        Getter for whether reads go to the primary.
+
+        Returns
+        -------
+        bool
+            True, if pinned or written.
+        """
+
+        return self.pinned or self.wrote
+
+    def replica_of(self, replicas):
+        """
+        Getter for the replica that the reads go to, picked at random
+        from the given ones upon the first read.
+
+        Parameters
+        ----------
+        replicas : list of string
+            Aliases of the replicas.
+
+        Returns
+        -------
+        string
+            Alias of the replica.
+        """
+
+        if self.replica not in replicas:
+            self.replica = random.choice(replicas)
+        return self.replica
+
+
+def _get_pin():
+    # Code outside of requests (management commands) gets a pin of its
+    # own when first needed, lasting until it starts a new task.
+    pin = _current.get()
+    if pin is None:
+        pin = PrimaryPin()
+        _current.set(pin)
+    return pin
+
+
+@contextmanager
+def new_task(pinned=False):
+    """
+    Context manager that starts a new task: the reads within it pick a
+    replica of their own, and go to the replica until something within
+    it is written. Afterwards, the previous task goes on.
+
+    Parameters
+    ----------
+    pinned : bool
+        Whether the reads go to the primary regardless of writes.
+
+    Returns
+    -------
+    PrimaryPin
+        The pin of the task, as the target of the with statement.
+    """
+
+    pin = PrimaryPin(pinned=pinned)
+    token = _current.set(pin)
+    try:
+        yield pin
+    finally:
+        _current.reset(token)
+
+
+def get_replicas():
+    """
+    Getter for the aliases of the replicas.
+
+    Returns
+    -------
+    list of string
+        Aliases of the replica databases.
+    """
+
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Context manager that sends the reads within it to the primary.
+    """
+
+    pin = _get_pin()
+    pinned = pin.pinned
+    pin.pinned = True
+    try:
+        yield
+    finally:
+        pin.pinned = pinned
+
+
+class ReplicaRouter:
+    """
+    Database router that reads from replicas and writes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas:
+            return None
+        pin = _get_pin()
+        if pin.reads_from_primary() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return pin.replica_of(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not get_replicas():
+            return None
+        _get_pin().wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        if db in get_replicas():
+            return False
+        return None
+
+
+def _within_pin(pin, chunks):
+    # Reads the chunks of a streamed response with the pin of its
+    # request, one chunk at a time. The context is set around every
+    # chunk only, as the server may interleave the chunks of several
+    # responses in one thread.
+    chunks = iter(chunks)
+    end = object()
+    try:
+        while True:
+            token = _current.set(pin)
+            try:
+                chunk = next(chunks, end)
+            finally:
+                _current.reset(token)
+            if chunk is end:
+                return
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pins the requests of visitors who have recently written anything
+    to the primary, and starts the pin of those who write.
+    Has to come before any middleware that reads from the database.
+
+    Settings:
+    REPLICA_PIN_SECONDS: Number of seconds that a visitor stays pinned
+    after a write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with new_task(pinned=PIN_COOKIE in request.COOKIES) as pin:
+            response = self.get_response(request)
+        if response.streaming:
+            # Streamed content is read after the view has returned, and
+            # belongs to the task of the request all the same.
+            response.streaming_content = _within_pin(pin, response.streaming_content)
+
+        pin_seconds = int(getattr(settings, "REPLICA_PIN_SECONDS", 0))
+        if pin.wrote and pin_seconds > 0:
+            response.set_cookie(PIN_COOKIE, "1", max_age=pin_seconds, httponly=True, samesite="Lax")
+        return response
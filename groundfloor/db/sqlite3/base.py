@@ -0,0 +1,64 @@
+"""
+SQLite backend with per-connection tuning.
+
+The built-in backend opens connections with the defaults of SQLite:
+a rollback journal that blocks readers while a transaction commits,
+a full sync of the disk on every commit, and transactions that only
+take the writer lock at their first write. This backend takes three
+extra OPTIONS, applied to every new connection:
+
+- pragmas: Dict of PRAGMA names and values, run in order, such as
+  {"journal_mode": "WAL", "synchronous": "NORMAL"}.
+- init_command: SQL statement, or list of them, run after the pragmas.
+  The connection-init hook, named after the option of the MySQL
+  backend.
+- transaction_mode: How transactions begin: "DEFERRED" (the default
+  of SQLite), "IMMEDIATE" or "EXCLUSIVE". Immediate transactions take
+  the writer lock up front, so a transaction that reads and then writes
+  waits for the busy timeout instead of failing on a write that raced
+  with another one.
+
+The busy timeout is the "timeout" option of the sqlite3 module, in
+seconds, as with the built-in backend.
+
+Usage:
+    DATABASES = {'default': {'ENGINE': 'groundfloor.db.sqlite3', ...}}
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+EXTRA_OPTIONS = ("pragmas", "init_command", "transaction_mode")
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite database wrapper that applies pragmas and an init command to
+    every new connection, and begins transactions in a configurable
+    mode.
+    """
+
+    def get_connection_params(self):
+        # The sqlite3 module does not know the extra options.
+        kwargs = super().get_connection_params()
+        for name in EXTRA_OPTIONS:
+            kwargs.pop(name, None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        options = self.settings_dict["OPTIONS"]
+        for name, value in options.get("pragmas", {}).items():
+            conn.execute("PRAGMA {} = {}".format(name, value))
+        init_command = options.get("init_command") or []
+        for statement in [init_command] if isinstance(init_command, str) else init_command:
+            conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode", "DEFERRED").upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured("transaction_mode must be one of {}.".format(", ".join(TRANSACTION_MODES)))
+        self.cursor().execute("BEGIN " + mode)
@@ -0,0 +1,396 @@
+"""
+Per-request instrumentation.
+
+InstrumentationMiddleware measures, for every request, the number of
+SQL queries, the time spent in the database, the time spent rendering
+templates and the total time taken by the view. The measurements are
+reported to the client in a Server-Timing header, and aggregated into
+per-view histograms that can be exported in the Prometheus text format
+(see groundfloor.views.metrics).
+
+Queries are recorded with an execution wrapper installed on every
+database connection for the duration of the request. Queries that are
+repeated with the same SQL are counted; a view that repeats one query
+at least INSTRUMENTATION_REPEATED_QUERY_THRESHOLD times is flagged as a
+likely N+1 query pattern.
+
+Template render time is recorded by InstrumentedDjangoTemplates, a
+template backend that times the rendering of top-level templates.
+
+The histograms are kept in the memory of each process.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# View name of requests that did not resolve to a view.
+UNRESOLVED = "<unresolved>"
+
+# Metrics of the request being handled in the current thread or task.
+_current = ContextVar("request_metrics", default=None)
+
+
+class RepeatedQueriesError(Exception):
+    """
+    Raised when a view repeats a query more often than allowed, and
+    INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES is set.
+    """
+
+
+class RequestMetrics:
+    """
+    Measurements of a single request.
+
+    ...
+
+    Attributes
+    ----------
+    query_count : int
+        Number of queries executed.
+    db_time : float
+        Seconds spent executing queries.
+    template_time : float
+        Seconds spent rendering templates.
+    total_time : float
+        Seconds spent handling the request.
+    statements : Counter
+        Number of executions of each SQL statement.
+    """
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Execution wrapper, see Django's connection.execute_wrapper.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+            self.statements[sql] += 1
+
+    def repeated_queries(self, threshold):
+        """
+        Getter for the statements executed at least a given number
+        of times.
+
+        Parameters
+        ----------
+        threshold : int
+            Minimum number of executions.
+
+        Returns
+        -------
+        list of (string, int)
+            Statements and their execution counts, most executed first.
+        """
+
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+    def duplicate_count(self):
+        """
+        Getter for the number of queries that repeated a statement
+        executed earlier in the request.
+
+        Returns
+        -------
+        int
+            Number of repeated executions.
+        """
+
+        return self.query_count - len(self.statements)
+
+    def server_timing(self):
+        """
+        Getter for the measurements as a Server-Timing header value.
+
+        Returns
+        -------
+        string
+            Value of the Server-Timing header.
+        """
+
+        return ", ".join([
+            'db;dur={:.2f};desc="{} queries, {} repeated"'.format(self.db_time * 1000, self.query_count, self.duplicate_count()),
+            "tpl;dur={:.2f}".format(self.template_time * 1000),
+            "total;dur={:.2f}".format(self.total_time * 1000),
+        ])
+
+
+class Histogram:
+    """
+    Cumulative histogram in the style of Prometheus.
+
+    ...
+
+    Attributes
+    ----------
+    buckets : tuple of float
+        Upper bounds of the buckets, in ascending order.
+    counts : list of int
+        Number of observations in each bucket, the last one being +Inf.
+    total : float
+        Sum of the observations.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        """
+        Adds an observation into the histogram.
+
+        Parameters
+        ----------
+        value : float
+            The observed value.
+        """
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def count(self):
+        """
+        Getter for the number of observations.
+
+        Returns
+        -------
+        int
+            Number of observations.
+        """
+
+        return sum(self.counts)
+
+
+class MetricsRegistry:
+    """
+    Per-view aggregates of request measurements.
+
+    ...
+
+    Attributes
+    ----------
+    histograms : dict
+        Histograms keyed by (metric name, view name).
+    repeated_query_views : Counter
+        Number of requests flagged for repeated queries, by view name.
+    """
+
+    # Metric names, with their buckets and descriptions.
+    metrics = {
+        "groundfloor_request_duration_seconds": (DURATION_BUCKETS, "Time taken to handle requests."),
+        "groundfloor_request_db_seconds": (DURATION_BUCKETS, "Time spent executing queries per request."),
+        "groundfloor_request_template_seconds": (DURATION_BUCKETS, "Time spent rendering templates per request."),
+        "groundfloor_request_queries": (QUERY_COUNT_BUCKETS, "Number of queries executed per request."),
+    }
+
+    def __init__(self):
+        self.histograms = {}
+        self.repeated_query_views = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, view_name, request_metrics, flagged=False):
+        """
+        Adds the measurements of a request into the histograms.
+
+        Parameters
+        ----------
+        view_name : string
+            Name of the view that handled the request.
+        request_metrics : RequestMetrics
+            Measurements of the request.
+        flagged : bool
+            Whether the request repeated queries too often.
+        """
+
+        values = {
+            "groundfloor_request_duration_seconds": request_metrics.total_time,
+            "groundfloor_request_db_seconds": request_metrics.db_time,
+            "groundfloor_request_template_seconds": request_metrics.template_time,
+            "groundfloor_request_queries": request_metrics.query_count,
+        }
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view_name)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(self.metrics[name][0])
+                self.histograms[key].observe(value)
+            if flagged:
+                self.repeated_query_views[view_name] += 1
+
+    def reset(self):
+        """
+        Removes every measurement.
+        """
+
+        with self.lock:
+            self.histograms.clear()
+            self.repeated_query_views.clear()
+
+    def export(self):
+        """
+        Getter for the aggregates in the Prometheus text format.
+
+        Returns
+        -------
+        string
+            The aggregates, one sample per line.
+        """
+
+        lines = []
+        with self.lock:
+            for name, (buckets, description) in self.metrics.items():
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} histogram".format(name))
+                for (metric_name, view_name), histogram in sorted(self.histograms.items()):
+                    if metric_name != name:
+                        continue
+                    view_label = _escape_label(view_name)
+                    cumulative = 0
+                    for bound, count in zip(buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{view="{}",le="{}"}} {}'.format(name, view_label, bound, cumulative))
+                    lines.append('{}_sum{{view="{}"}} {}'.format(name, view_label, histogram.total))
+                    lines.append('{}_count{{view="{}"}} {}'.format(name, view_label, cumulative))
+
+            name = "groundfloor_repeated_query_requests_total"
+            lines.append("# HELP {} Requests that repeated a query at least the configured number of times.".format(name))
+            lines.append("# TYPE {} counter".format(name))
+            for view_name, count in sorted(self.repeated_query_views.items()):
+                lines.append('{}{{view="{}"}} {}'.format(name, _escape_label(view_name), count))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class InstrumentationMiddleware:
+    """
+    Measures every request, adds a Server-Timing header into the
+    response and records the measurements into the registry.
+
+    Settings:
+    INSTRUMENTATION_REPEATED_QUERY_THRESHOLD: Number of executions of
+    the same statement at which a request is flagged for an N+1 query
+    pattern. None disables the check.
+    INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES: Whether flagged requests
+    raise a RepeatedQueriesError instead of logging a warning.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(request_metrics))
+                response = self.get_response(request)
+        finally:
+            request_metrics.total_time = time.perf_counter() - start
+            _current.reset(token)
+
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else UNRESOLVED
+        flagged = self.check_repeated_queries(view_name, request_metrics)
+        registry.observe(view_name, request_metrics, flagged)
+
+        response["Server-Timing"] = request_metrics.server_timing()
+        return response
+
+    def check_repeated_queries(self, view_name, request_metrics):
+        """
+        Checks whether a request repeated any query at least
+        INSTRUMENTATION_REPEATED_QUERY_THRESHOLD times.
+
+        Parameters
+        ----------
+        view_name : string
+            Name of the view that handled the request.
+        request_metrics : RequestMetrics
+            Measurements of the request.
+
+        Returns
+        -------
+        bool
+            True, if the request was flagged.
+        """
+
+        threshold = getattr(settings, "INSTRUMENTATION_REPEATED_QUERY_THRESHOLD", None)
+        if threshold is None:
+            return False
+        repeated = request_metrics.repeated_queries(threshold)
+        if not repeated:
+            return False
+
+        sql, count = repeated[0]
+        message = "View {} executed the same query {} times: {}".format(view_name, count, sql)
+        if getattr(settings, "INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES", False):
+            raise RepeatedQueriesError(message)
+        logger.warning(message)
+        return True
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend that records the time spent rendering
+    templates into the measurements of the current request. Templates
+    included by other templates are timed as part of their parent.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+class InstrumentedTemplate:
+    """
+    Wrapper of a backend template that times its rendering.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        request_metrics = _current.get()
+        if request_metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            request_metrics.template_time += time.perf_counter() - start
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,45 @@
+import time
+from urllib.error import URLError
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from groundfloor import assets
+
+
+class Command(BaseCommand):
+    """
+    Builds the static assets of the site: vendors third-party
+    libraries, bundles and minifies scripts and stylesheets, collects
+    every static file under a content-hashed name, and precompresses
+    the results. See groundfloor.assets.
+    """
+
+    help = "Builds, hashes and compresses the static assets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--offline", action="store_true",
+                            help="Fail instead of downloading libraries that have not been vendored.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        build_dir = settings.ASSET_BUILD_DIR
+
+        try:
+            downloaded = assets.vendor(build_dir, download=not options["offline"])
+        except (FileNotFoundError, URLError) as error:
+            raise CommandError("Vendoring failed: {}".format(error))
+        for path in downloaded:
+            self.stdout.write("Vendored {}".format(path))
+
+        try:
+            sizes = assets.bundle(build_dir)
+        except FileNotFoundError as error:
+            raise CommandError(str(error))
+        for bundle_name, size in sizes.items():
+            self.stdout.write("Bundled {} ({} bytes)".format(bundle_name, size))
+
+        call_command("collectstatic", interactive=False, verbosity=0)
+        count = assets.compress(settings.STATIC_ROOT)
+        self.stdout.write("Wrote {} compressed variants. Built assets in {:.1f} s.".format(count, time.perf_counter() - start))
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from groundfloor.db.routers import get_replicas
+
+
+class Command(BaseCommand):
+    """
+    Copies the primary SQLite database into its SQLite replicas, with
+    the online backup API of SQLite. SQLite does not replicate itself,
+    so this stands in for replication when trying out read replicas
+    locally; replicas lag behind until the next run. Replicas of other
+    databases are left to their own replication.
+    """
+
+    help = "Copies the primary SQLite database into the SQLite replicas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            type=float,
+            metavar="SECONDS",
+            help="Keep copying, waiting the given number of seconds in between.")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != "sqlite":
+            raise CommandError("The primary database is not an SQLite database.")
+        replicas = [alias for alias in get_replicas() if connections[alias].vendor == "sqlite"]
+        if not replicas:
+            raise CommandError("No SQLite replicas are configured in DATABASE_REPLICAS.")
+
+        while True:
+            for alias in replicas:
+                start = time.perf_counter()
+                connections[alias].close()
+                primary.ensure_connection()
+                target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+                try:
+                    primary.connection.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write("Copied into {} in {:.3f} s.".format(alias, time.perf_counter() - start))
+            if options["loop"] is None:
+                break
+            time.sleep(options["loop"])
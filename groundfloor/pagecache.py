@@ -0,0 +1,101 @@
+"""
+Page cache for pages that only vary by the state of the visitor.
+
+Pages decorated with cached_page are rendered once per combination of
+path, logged-in user and dark mode, and served from the cache
+afterwards. Visitors without a session cookie are known to be
+anonymous without loading a session, so serving them touches neither
+the template engine nor the session table.
+
+Cached pages carry an ETag and a Last-Modified header, and conditional
+requests for unchanged pages are answered with 304 Not Modified.
+
+Settings:
+PAGE_CACHE: Alias of the cache that pages are kept in.
+PAGE_CACHE_TIMEOUT: Number of seconds that pages are cached for.
+DEPLOY_VERSION: Version of the deployment. Pages cached by other
+versions are never served.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils import timezone
+
+from groundfloor.context_processors import is_darkmode
+
+
+def page_cache_key(request):
+    """
+    Getter for the cache key of the page requested.
+
+    Parameters
+    ----------
+    request : HttpRequest
+        The request.
+
+    Returns
+    -------
+    string
+        The cache key.
+    """
+
+    username = ""
+    if settings.SESSION_COOKIE_NAME in request.COOKIES and request.user.is_authenticated:
+        username = request.user.get_username()
+    variant = "\n".join([request.path, username, "dark" if is_darkmode(request) else "light"])
+    return "pagecache:{}:{}".format(getattr(settings, "DEPLOY_VERSION", ""), hashlib.sha1(variant.encode()).hexdigest())
+
+
+def cached_page(view):
+    """
+    Decorator that caches the pages rendered by a view.
+    GET-parameters are ignored. Only successful GET and HEAD requests
+    are served from the cache.
+
+    Parameters
+    ----------
+    view : function
+        The view to cache.
+
+    Returns
+    -------
+    function
+        The view, wrapped with the page cache.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or settings.DEBUG:
+            return view(request, *args, **kwargs)
+
+        cache = caches[getattr(settings, "PAGE_CACHE", "default")]
+        key = page_cache_key(request)
+        page = cache.get(key)
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            page = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": '"{}"'.format(hashlib.sha1(response.content).hexdigest()),
+                "last_modified": timezone.now().timestamp(),
+            }
+            cache.set(key, page, getattr(settings, "PAGE_CACHE_TIMEOUT", 3600))
+
+        response = get_conditional_response(request, etag=page["etag"], last_modified=int(page["last_modified"]))
+        if response is None:
+            response = HttpResponse(page["content"], content_type=page["content_type"])
+        response["ETag"] = page["etag"]
+        response["Last-Modified"] = http_date(page["last_modified"])
+        response["Cache-Control"] = "private, no-cache" if settings.SESSION_COOKIE_NAME in request.COOKIES else "no-cache"
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+    return wrapper
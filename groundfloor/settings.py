@@ -31,6 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    'groundfloor',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'groundfloor.instrumentation.InstrumentationMiddleware',
+    'groundfloor.db.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,18 +56,26 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'groundfloor.urls'
 
+# Compiled templates are kept in memory outside of development.
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'groundfloor.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'groundfloor.context_processors.deployment',
+                'groundfloor.context_processors.darkmode',
             ],
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
         },
     },
 ]
@@ -83,6 +94,43 @@ DATABASES = {
 }
 
 
+# Read replicas
+# DATABASE_REPLICAS: Aliases of databases that replicate 'default'.
+# Reads are spread over them, see groundfloor.db.routers.
+# REPLICA_PIN_SECONDS: Number of seconds that the reads of a visitor go
+# to 'default' after they have written anything. Should exceed the
+# replication lag.
+
+DATABASE_ROUTERS = ['groundfloor.db.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Fragments cached with {% cache %}. Disabled in development, so
+    # that changes to templates show up right away.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache' if DEBUG else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+    },
+    # Shared by every process, for what background jobs keep up to date
+    # (leaderboards). The table is created with manage.py createcachetable.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'groundfloor_cache',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -120,6 +168,95 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'groundfloor.assets.AssetStorage'
+
+# Vendored libraries and bundles are written here by build_assets.
+ASSET_BUILD_DIR = os.path.join(BASE_DIR, 'build', 'assets')
+
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
+    ASSET_BUILD_DIR,
 )
+
+
+# Comment vote buffering
+# VOTE_BUFFER_WINDOW: Number of seconds that votes are coalesced for
+# before they are written into the database. 0 disables buffering.
+# VOTE_BUFFER_CACHE: Alias of the cache that the buffer is shared in,
+# which has to increment atomically (memcached or Redis). If None, each
+# process keeps its own buffer and flushes it with a timer, and
+# manage.py flush_votes is not needed.
+
+VOTE_BUFFER_WINDOW = 5.0
+VOTE_BUFFER_CACHE = None
+
+
+# Friend graph
+# FRIEND_GRAPH_CACHE: Alias of the cache that friend lists are kept in.
+# FRIEND_GRAPH_TIMEOUT: Number of seconds that friend lists are cached
+# for. If None, they are cached until they change, which requires a
+# cache shared by every process.
+
+FRIEND_GRAPH_CACHE = 'default'
+FRIEND_GRAPH_TIMEOUT = 300
+
+
+# Popularity ranking
+# POPULARITY_HALF_LIFE: Number of seconds in which the weight of an
+# activity (joining, posting) in popularity halves.
+# LEADERBOARD_CACHE: Alias of the cache that leaderboards are kept in.
+# Has to be shared by every process (database, memcached or Redis), so
+# that the refreshes of manage.py refresh_leaderboards reach them.
+# LEADERBOARD_SIZE: Number of groups and events on the leaderboards.
+# LEADERBOARD_TIMEOUT: Number of seconds that leaderboards are cached
+# for, unless refreshed (manage.py refresh_leaderboards) before that.
+
+POPULARITY_HALF_LIFE = 7 * 24 * 3600
+LEADERBOARD_CACHE = 'shared'
+LEADERBOARD_SIZE = 20
+LEADERBOARD_TIMEOUT = 600
+
+
+# Account deletion
+# ACCOUNT_DELETION_LOCK_BUDGET: Number of seconds that a transaction of
+# the deletion worker (manage.py delete_accounts) may take, and hold the
+# writer lock for. Chunks of rows shrink to stay within it.
+# ACCOUNT_DELETION_CHUNK_SIZE: Number of rows deleted per transaction
+# at first.
+# ACCOUNT_DELETION_PAUSE: Number of seconds to wait between transactions,
+# letting other writers in.
+
+ACCOUNT_DELETION_LOCK_BUDGET = 0.05
+ACCOUNT_DELETION_CHUNK_SIZE = 200
+ACCOUNT_DELETION_PAUSE = 0.01
+
+
+# Request instrumentation
+# INSTRUMENTATION_REPEATED_QUERY_THRESHOLD: Number of executions of the
+# same SQL statement within a request at which the request is flagged
+# for an N+1 query pattern. None disables the check.
+# INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES: Whether flagged requests
+# fail with an error instead of logging a warning.
+# METRICS_TOKEN: Bearer token that clients send to read /metrics/
+# (Authorization: Bearer <token>). When set, the client address is not
+# trusted.
+# METRICS_ALLOWED_IPS: Client addresses that may read /metrics/ without
+# a token. The address is that of the peer, which is the reverse proxy
+# if there is one.
+
+INSTRUMENTATION_REPEATED_QUERY_THRESHOLD = 10
+INSTRUMENTATION_RAISE_ON_REPEATED_QUERIES = False
+METRICS_TOKEN = ''
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+
+# Page cache
+# PAGE_CACHE: Alias of the cache that static pages are kept in.
+# PAGE_CACHE_TIMEOUT: Number of seconds that static pages are cached for.
+# DEPLOY_VERSION: Version of the deployment, set by the deployment.
+# Changing it invalidates every cached page.
+
+PAGE_CACHE = 'default'
+PAGE_CACHE_TIMEOUT = 3600
+DEPLOY_VERSION = os.environ.get('DEPLOY_VERSION', 'development')
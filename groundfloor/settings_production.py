@@ -0,0 +1,172 @@
+"""
+Django settings for production deployments of groundfloor project.
+
+Extends groundfloor.settings with DEBUG off, secrets and hosts taken
+from the environment, and a database tuned for concurrent requests.
+Selected with DJANGO_SETTINGS_MODULE=groundfloor.settings_production.
+
+Environment:
+DJANGO_SECRET_KEY: Secret key. Required.
+DJANGO_ALLOWED_HOSTS: Comma-separated host names that are served.
+DJANGO_SQLITE_PATH: Path of the SQLite database.
+DJANGO_CONN_MAX_AGE: Number of seconds that database connections are
+kept open for, across requests. 0 closes them after every request.
+POSTGRES_DB: Name of a PostgreSQL database to use instead of SQLite
+(requires psycopg2), along with POSTGRES_USER, POSTGRES_PASSWORD,
+POSTGRES_HOST and POSTGRES_PORT.
+POSTGRES_POOLER: 'pgbouncer', if connections go through PgBouncer in
+transaction pooling mode.
+POSTGRES_REPLICA_HOSTS: Comma-separated hosts (host or host:port) of
+PostgreSQL replicas to read from.
+DJANGO_SQLITE_REPLICA_PATHS: Comma-separated paths of SQLite replicas
+to read from, when using SQLite. They are refreshed from the primary
+with manage.py sync_replicas.
+DJANGO_REPLICA_PIN_SECONDS: Number of seconds that a visitor reads
+from the primary after writing.
+DJANGO_METRICS_TOKEN: Bearer token that the collector of /metrics/
+sends. Without it, /metrics/ is not served.
+MEMCACHED_LOCATION: Comma-separated memcached servers (host:port) to
+share caches between workers in, instead of the database (requires
+python-memcached).
+"""
+
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from groundfloor.settings import *  # noqa: F401,F403
+from groundfloor.settings import BASE_DIR, CACHES, TEMPLATES, TEMPLATE_LOADERS
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured("DJANGO_SECRET_KEY must be set in production.")
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+# Settings derived from DEBUG in groundfloor.settings, copied so that
+# the development settings are left as they are.
+TEMPLATES = copy.deepcopy(TEMPLATES)
+TEMPLATES[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+CACHES = dict(CACHES, template_fragments={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'template_fragments',
+})
+
+
+# Database
+# CONN_MAX_AGE: Connections are kept open across requests, so that
+# neither the connection nor its pragmas are set up on every request.
+#
+# SQLite (groundfloor.db.sqlite3):
+# journal_mode: WAL lets readers go on while a transaction commits.
+# synchronous: NORMAL syncs the disk at checkpoints instead of on every
+# commit. A power loss may lose the last transactions, but never
+# corrupts the database.
+# mmap_size: Number of bytes of the database read through memory
+# mapping instead of read calls.
+# cache_size: Pages kept in memory per connection (negative: KiB).
+# timeout: Busy timeout. Number of seconds that a connection waits for
+# the writer lock before failing with 'database is locked'.
+# transaction_mode: IMMEDIATE takes the writer lock when a transaction
+# begins, so that transactions which read before they write (friend
+# requests) wait for the lock instead of failing.
+#
+# PostgreSQL:
+# Django keeps one persistent connection per worker thread. To share
+# fewer connections between many workers, put PgBouncer in front of
+# PostgreSQL; in transaction pooling mode, server-side cursors (used
+# by iterator(), as in exports) do not survive between transactions,
+# and are disabled.
+
+CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 600))
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 2 ** 20,
+    'cache_size': -32 * 2 ** 10,
+    'temp_store': 'MEMORY',
+}
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', ''),
+            'PORT': os.environ.get('POSTGRES_PORT', ''),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_POOLER') == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'groundfloor.db.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': 20,
+                'pragmas': SQLITE_PRAGMAS,
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+
+# Read replicas (groundfloor.db.routers)
+# Every replica is configured as the primary, with another host or
+# path. In tests, replicas mirror the test database of the primary.
+
+def _replica(host_or_path):
+    replica = copy.deepcopy(DATABASES['default'])
+    if replica['ENGINE'] == 'django.db.backends.postgresql':
+        host, _, port = host_or_path.partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    else:
+        replica['NAME'] = host_or_path
+    replica['TEST'] = {'MIRROR': 'default'}
+    return replica
+
+
+_replica_sources = os.environ.get('POSTGRES_REPLICA_HOSTS' if os.environ.get('POSTGRES_DB') else 'DJANGO_SQLITE_REPLICA_PATHS', '')
+for _number, _source in enumerate([source.strip() for source in _replica_sources.split(',') if source.strip()], 1):
+    DATABASES['replica{}'.format(_number)] = _replica(_source)
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_SECONDS = int(os.environ.get('DJANGO_REPLICA_PIN_SECONDS', 10))
+
+
+# Shared cache
+# Leaderboards are refreshed by a background job (manage.py
+# refresh_leaderboards), so they are kept in a cache that every worker
+# reads. Without memcached, that is the database cache, whose table is
+# created with manage.py createcachetable. With memcached, friend lists
+# and vote buffers are shared between workers as well; the database
+# cache does not increment atomically, which vote buffers require.
+
+if os.environ.get('MEMCACHED_LOCATION'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': [server.strip() for server in os.environ['MEMCACHED_LOCATION'].split(',') if server.strip()],
+    }
+    FRIEND_GRAPH_CACHE = 'shared'
+    VOTE_BUFFER_CACHE = 'shared'
+LEADERBOARD_CACHE = 'shared'
+
+
+# Metrics
+# Behind a reverse proxy, every request comes from the address of the
+# proxy, and METRICS_ALLOWED_IPS would expose /metrics/ to everyone.
+# The endpoint is only served to collectors that send the token.
+
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = []
@@ -0,0 +1,35 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from groundfloor.assets import BUNDLES, VENDOR, is_built
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset_bundle(bundle_name):
+    """
+    Includes a bundle of scripts or stylesheets. Once the bundle has
+    been built, it is included as one file; until then, its files are
+    included one by one, with libraries loaded from their CDNs.
+
+    Parameters
+    ----------
+    bundle_name : string
+        Static path of the bundle, as in groundfloor.assets.BUNDLES.
+
+    Returns
+    -------
+    string
+        The script or link elements.
+    """
+
+    if is_built(bundle_name):
+        urls = [static(bundle_name)]
+    else:
+        urls = [VENDOR[path] if path in VENDOR else static(path) for path in BUNDLES[bundle_name]]
+
+    if bundle_name.endswith(".css"):
+        return format_html_join("\n", '<link rel="stylesheet" type="text/css" href="{}">', ((url,) for url in urls))
+    return format_html_join("\n", '<script src="{}"></script>', ((url,) for url in urls))
@@ -13,10 +13,11 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
-from . import views
+from . import assets, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -35,5 +36,11 @@ urlpatterns = [
     path('feedback/', views.feedback, name='feedback'),
     path('customer_support/', views.customer_support, name='customer_support'),
     path('report_bug/', views.report_bug, name='report_bug'),
-    path('search/', views.search, name='search')
+    path('search/', views.search, name='search'),
+    path('metrics/', views.metrics, name='metrics')
 ]
+
+if not settings.DEBUG:
+    # Built static files are served with long-lived cache headers.
+    # In development, django.contrib.staticfiles serves the originals.
+    urlpatterns.append(re_path(r'^{}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')), assets.serve, name='static'))
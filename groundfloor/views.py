@@ -1,8 +1,17 @@
+import hmac
+
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, Http404, JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, Http404, JsonResponse, HttpResponseRedirect, HttpResponseBadRequest
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.conf import settings
+
+from firstfloor import search as search_engine
+from firstfloor.votebuffer import get_vote_buffer
+from groundfloor.instrumentation import registry
+from groundfloor.pagecache import cached_page
 
+@cached_page
 def index(request):
     """
     Index page. Acts as the home page of the website.
@@ -10,6 +19,7 @@ def index(request):
 
     return render(request, "groundfloor/common/index.html", context = None)
 
+@cached_page
 def forum(request):
     """
     Forum Entrance page. Contains an introduction to the
@@ -18,6 +28,7 @@ def forum(request):
 
     return render(request, "groundfloor/common/forum.html", context = None)
 
+@cached_page
 def about(request):
     """
     About page. Contains general information about the website.
@@ -25,6 +36,7 @@ def about(request):
 
     return render(request, "groundfloor/common/about.html", context = None)
 
+@cached_page
 def contact(request):
     """
     Contact page. Contains contact information.
@@ -32,6 +44,7 @@ def contact(request):
 
     return render(request, "groundfloor/common/contact.html", context = None)
 
+@cached_page
 def help(request):
     """
     Help page. Contains information on how to get started with
@@ -40,6 +53,7 @@ def help(request):
 
     return render(request, "groundfloor/common/help.html", context = None)
 
+@cached_page
 def rules(request):
     """
     Rules page. Contains a set of rules that have to be followed.
@@ -47,6 +61,7 @@ def rules(request):
 
     return render(request, "groundfloor/common/rules.html", context = None)
 
+@cached_page
 def guidelines(request):
     """
     Guidelines page. Contains a set of guidelines that people
@@ -55,6 +70,7 @@ def guidelines(request):
 
     return render(request, "groundfloor/common/guidelines.html", context = None)
 
+@cached_page
 def report_abuse(request):
     """
     Report Abuse page. Here one can report another for a
@@ -63,6 +79,7 @@ def report_abuse(request):
 
     return render(request, "groundfloor/common/report_abuse.html", context = None)
 
+@cached_page
 def privacy_policy(request):
     """
     Privacy Policy page. Contains the privacy statement (just
@@ -71,6 +88,7 @@ def privacy_policy(request):
 
     return render(request, "groundfloor/common/privacy_policy.html", context = None)
 
+@cached_page
 def feedback(request):
     """
     Feedback page. Here one can send feedback to improve the
@@ -79,6 +97,7 @@ def feedback(request):
 
     return render(request, "groundfloor/common/feedback.html", context = None)
 
+@cached_page
 def customer_support(request):
     """
     Customer Support page. Contains information that aims
@@ -89,6 +108,7 @@ def customer_support(request):
 
     return render(request, "groundfloor/common/customer_support.html", context = None)
 
+@cached_page
 def report_bug(request):
     """
     Report Bug page. Here one can report technical problems
@@ -102,8 +122,55 @@ def search(request):
     General Search page. Contains a search bar that one can
     use to find something.
 
-    If POST-information could be found, shows search results
-    as well.
-    """
-
-    return render(request, "groundfloor/common/search.html", context = None)
+    If a query could be found (GET-parameter 'search'), shows
+    search results as well, optionally limited to one kind of
+    object (GET-parameter 'kind') and paginated with cursors
+    (GET-parameter 'cursor').
+    """
+
+    query = request.GET.get("search", "").strip()
+    kind = request.GET.get("kind")
+    cursor = request.GET.get("cursor")
+
+    search_context = {"query": query, "kind": kind}
+    if query:
+        try:
+            page = search_engine.search(query,
+                                        kinds = [kind] if kind else None,
+                                        cursor = cursor)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid page cursor.")
+        search_context.update({
+            "results": page.results,
+            "next_cursor": page.next_cursor,
+            "facets": sorted(page.facets.items()),
+        })
+
+    return render(request, "groundfloor/common/search.html", context = search_context)
+
+def metrics(request):
+    """
+    Metrics endpoint. Exports request measurements and vote buffer
+    metrics of the process in the Prometheus text format.
+
+    Only available to clients that send the METRICS_TOKEN setting as a
+    bearer token, or connect from the addresses listed in the
+    METRICS_ALLOWED_IPS setting. Behind a reverse proxy, every client
+    connects from the address of the proxy, so production deployments
+    rely on the token instead.
+    """
+
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        allowed = hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), "Bearer " + token)
+    else:
+        allowed = request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", ())
+    if not allowed:
+        raise Http404("Page not found.")
+
+    lines = [registry.export()]
+    for name, value in get_vote_buffer().metrics().items():
+        lines.append("# TYPE firstfloor_vote_buffer_{} gauge\n".format(name))
+        lines.append("firstfloor_vote_buffer_{} {}\n".format(name, value))
+
+    return HttpResponse("".join(lines), content_type = "text/plain; version=0.0.4; charset=utf-8")
@@ -1,3 +1,181 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from . import toolbox
+
+class ToolboxTests(TestCase):
+    """
+    The conversions of the toolbox have to be exact for inputs of
+    any size, and refuse invalid inputs with ValueError.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_convert_base
+    test_base64
+    test_base64_streams
+    test_caesar
+    """
+
+    def test_convert_base(self):
+        """
+        Integers are converted exactly, beyond 2^53 as well.
+        """
+
+        self.assertEqual(toolbox.convert_base("255", 10, 16), "ff")
+        self.assertEqual(toolbox.convert_base("-FF", 16, 2), "-11111111")
+        self.assertEqual(toolbox.convert_base("-0", 10, 10), "0")
+        self.assertEqual(toolbox.convert_base("9007199254740993", 10, 16), "20000000000001")
+
+        # Results are parsed digit by digit, as int() limits the length
+        # of decimal numbers.
+        number = "z" * toolbox.MAX_NUMBER_LENGTH
+        for base in (10, 7, 2):
+            value = 0
+            for digit in toolbox.convert_base(number, 36, base):
+                value = value * base + toolbox.DIGITS.index(digit)
+            self.assertEqual(value, int(number, 36))
+
+        for number, from_base, to_base in [("12", 2, 10), ("1_0", 10, 16), ("", 10, 16), ("10", 1, 10), ("10", 10, 37)]:
+            with self.assertRaises(ValueError):
+                toolbox.convert_base(number, from_base, to_base)
+        with self.assertRaises(ValueError):
+            toolbox.convert_base("1" * (toolbox.MAX_NUMBER_LENGTH + 1), 10, 16)
+
+    def test_base64(self):
+        """
+        Any text can be encoded, and decoded back.
+        """
+
+        self.assertEqual(toolbox.base64_encode("Hello"), "SGVsbG8=")
+        self.assertEqual(toolbox.base64_decode(toolbox.base64_encode("Hyvää päivää ☃")), "Hyvää päivää ☃")
+        for encoding in ["SGVsbG8", "S=GVsbG8", "//79"]:
+            with self.assertRaises(ValueError):
+                toolbox.base64_decode(encoding)
+
+    def test_base64_streams(self):
+        """
+        Streams are converted exactly for every length, whether or not
+        they end in the middle of a chunk.
+        """
+
+        class Unbuffered:
+            # Stream without readinto, that returns short reads.
+            def __init__(self, data):
+                self.stream = io.BytesIO(data)
+
+            def read(self, size):
+                return self.stream.read(min(size, 5))
+
+        for length in [0, 1, 2, 3, 11, 12, 13, 100]:
+            data = os.urandom(length)
+            for stream in [io.BytesIO(data), Unbuffered(data)]:
+                encoding = b"".join(toolbox.base64_encode_stream(stream, 12))
+                self.assertEqual(encoding, base64.b64encode(data))
+            encoding = base64.encodebytes(data)
+            for stream in [io.BytesIO(encoding), Unbuffered(encoding)]:
+                self.assertEqual(b"".join(toolbox.base64_decode_stream(stream, 8)), data)
+
+        for encoding in [b"QQ=", b"QQ==QQ==", b"Q!==", b"QQ===", b"QUJD\nQQ"]:
+            with self.assertRaises(ValueError):
+                b"".join(toolbox.base64_decode_stream(io.BytesIO(encoding), 4))
+        with self.assertRaises(ValueError):
+            next(toolbox.base64_encode_stream(io.BytesIO(), 4))
+
+    def test_caesar(self):
+        """
+        Both lower and upper case letters are shifted.
+        """
+
+        self.assertEqual(toolbox.caesar("Hello, World!", 3), "Khoor, Zruog!")
+        self.assertEqual(toolbox.caesar("xyz XYZ", 29), "abc ABC")
+        self.assertEqual(toolbox.caesar(toolbox.caesar("Äiti abc", 11), -11), "Äiti abc")
+
+class ToolboxViewTests(TestCase):
+    """
+    The toolbox endpoints convert batches of inputs.
+
+    ...
+
+    Unit Tests
+    ----------
+    test_batches
+    test_invalid_batches
+    test_streams
+    """
+
+    def post(self, name, batch):
+        response = Client().post(reverse(name), json.dumps(batch), content_type="application/json")
+        if response.streaming:
+            return response.status_code, json.loads(b"".join(response.streaming_content))
+        return response.status_code, response.json()
+
+    def test_batches(self):
+        """
+        Results are returned in the order of the inputs, with errors
+        reported per input.
+        """
+
+        status, body = self.post("secondfloor:convert_base", {"inputs": ["255", "x", "-10"], "from_base": 10, "to_base": 16})
+        self.assertEqual(status, 200)
+        self.assertEqual(body["results"][0], {"output": "ff"})
+        self.assertIn("error", body["results"][1])
+        self.assertEqual(body["results"][2], {"output": "-a"})
+
+        status, body = self.post("secondfloor:base64_encode", {"inputs": ["Hello", "☃"]})
+        self.assertEqual(body["results"], [{"output": "SGVsbG8="}, {"output": "4piD"}])
+        status, body = self.post("secondfloor:base64_decode", {"inputs": ["4piD"]})
+        self.assertEqual(body["results"], [{"output": "☃"}])
+        status, body = self.post("secondfloor:caesar", {"inputs": ["abc"] * 5000, "shift": 1})
+        self.assertEqual(body["results"], [{"output": "bcd"}] * 5000)
+
+    def test_invalid_batches(self):
+        """
+        Invalid batches are refused as a whole.
+        """
+
+        for batch in [{}, [], {"inputs": "abc"}, {"inputs": [1]}, {"inputs": [], "shift": "1"}]:
+            status, body = self.post("secondfloor:caesar", batch)
+            self.assertEqual(status, 400)
+            self.assertIn("error", body)
+
+        status, _ = self.post("secondfloor:convert_base", {"inputs": ["1"], "to_base": 40})
+        self.assertEqual(status, 400)
+        status, _ = self.post("secondfloor:caesar", {"inputs": [""] * 10001})
+        self.assertEqual(status, 400)
+        self.assertEqual(Client().get(reverse("secondfloor:caesar")).status_code, 405)
+
+    def test_streams(self):
+        """
+        Files are converted from multipart forms and from raw bodies
+        alike, and returned as attachments.
+        """
+
+        data = os.urandom(300000)
+        upload = SimpleUploadedFile("image.png", data)
+        response = Client().post(reverse("secondfloor:base64_encode_stream"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="image.png.b64"', response["Content-Disposition"])
+        encoding = b"".join(response.streaming_content)
+        self.assertEqual(encoding, base64.b64encode(data))
+
+        upload = SimpleUploadedFile("image.png.b64", encoding)
+        response = Client().post(reverse("secondfloor:base64_decode_stream"), {"file": upload})
+        self.assertIn('filename="image.png"', response["Content-Disposition"])
+        self.assertEqual(b"".join(response.streaming_content), data)
+
+        response = Client().post(reverse("secondfloor:base64_decode_stream"), encoding,
+                                 content_type="application/octet-stream")
+        self.assertEqual(b"".join(response.streaming_content), data)
+
+        response = Client().post(reverse("secondfloor:base64_decode_stream"), b"not base64",
+                                 content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
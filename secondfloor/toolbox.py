@@ -0,0 +1,310 @@
+"""
+Conversions of the toolbox.
+
+Server-side counterparts of the toolbox services of the browser
+(secondfloor/js/toolbox_functions/services.js):
+- Base conversion of integers of any size, between bases 2 to 36.
+- Base64 encoding and decoding of UTF-8 text.
+- Caesar cipher with translation tables, for both lower and upper case
+  letters.
+- Streaming Base64 encoding and decoding of files of any size, in
+  constant memory.
+
+Every function raises ValueError on invalid input.
+"""
+
+import base64
+import binascii
+import string
+from functools import lru_cache
+
+DIGITS = string.digits + string.ascii_lowercase
+
+MIN_BASE = 2
+MAX_BASE = 36
+
+# Maximum length of numbers to convert. Parsing is quadratic in the
+# length of the number, so longer numbers are refused.
+MAX_NUMBER_LENGTH = 4000
+
+# Number of bytes encoded, and characters decoded, at a time by the
+# streaming Base64 conversions. Multiples of 3 and 4, so that every
+# chunk but the last converts without padding.
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+DECODE_CHUNK_SIZE = 4 * 64 * 1024
+
+_BASE64_ALPHABET = (string.ascii_letters + string.digits + "+/").encode("ascii")
+_WHITESPACE = b" \t\r\n"
+
+# Largest chunk of digits formatted with machine-sized integers.
+_CHUNK_LIMIT = 1 << 60
+
+# Bases with a builtin format, and their format specifications.
+_BUILTIN_FORMATS = {2: "b", 8: "o", 16: "x"}
+
+# Largest integers (in bits) that str() converts without reaching the
+# limit that Python sets on the length of decimal conversions.
+_MAX_DECIMAL_BITS = 13000
+
+_VALID_DIGITS = {base: frozenset(DIGITS[:base]) for base in range(MIN_BASE, MAX_BASE + 1)}
+
+
+def convert_base(number, from_base=10, to_base=16):
+    """
+    Converts an integer from one base to another. Letters are used as
+    digits from 10 up, in either case. A leading minus sign is kept.
+
+    Parameters
+    ----------
+    number : string
+        The integer, written in from_base.
+    from_base : int
+        Base of the given integer.
+    to_base : int
+        Base of the result.
+
+    Returns
+    -------
+    string
+        The integer written in to_base, with lower case letters.
+    """
+
+    for base in (from_base, to_base):
+        if not isinstance(base, int) or isinstance(base, bool) or not MIN_BASE <= base <= MAX_BASE:
+            raise ValueError("Bases have to be integers from {} to {}.".format(MIN_BASE, MAX_BASE))
+
+    number = number.strip()
+    if len(number) > MAX_NUMBER_LENGTH:
+        raise ValueError("Numbers can have at most {} digits.".format(MAX_NUMBER_LENGTH))
+    negative = number.startswith("-")
+    digits = number[1:] if negative else number
+    if not digits or not set(digits.lower()) <= _VALID_DIGITS[from_base]:
+        raise ValueError("{!r} is not a number of base {}.".format(number, from_base))
+
+    value = int(digits, from_base)
+    return ("-" if negative and value else "") + format_number(value, to_base)
+
+
+def format_number(value, base):
+    """
+    Writes a non-negative integer of any size in a given base.
+
+    Parameters
+    ----------
+    value : int
+        The integer.
+    base : int
+        Base of the result, from 2 to 36.
+
+    Returns
+    -------
+    string
+        The integer written in the base.
+    """
+
+    if base in _BUILTIN_FORMATS:
+        return format(value, _BUILTIN_FORMATS[base])
+    if base == 10 and value.bit_length() <= _MAX_DECIMAL_BITS:
+        return str(value)
+    if value < _CHUNK_LIMIT:
+        return _format_small(value, base)
+
+    # The integer is split into chunks of digits small enough to be
+    # formatted with machine-sized integers.
+    width = 1
+    while base ** (width + 1) < _CHUNK_LIMIT:
+        width += 1
+    chunk = base ** width
+
+    chunks = []
+    while value:
+        value, remainder = divmod(value, chunk)
+        chunks.append(remainder)
+    chunks.reverse()
+
+    parts = [_format_small(chunks[0], base)]
+    parts.extend(_format_small(remainder, base).rjust(width, "0") for remainder in chunks[1:])
+    return "".join(parts)
+
+
+def base64_encode(text):
+    """
+    Encodes text with Base64. The text is encoded into bytes as UTF-8,
+    so any text can be encoded.
+
+    Parameters
+    ----------
+    text : string
+        The text to encode.
+
+    Returns
+    -------
+    string
+        The Base64 encoding of the text.
+    """
+
+    return base64.b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def base64_decode(text):
+    """
+    Decodes Base64-encoded UTF-8 text.
+
+    Parameters
+    ----------
+    text : string
+        The Base64 encoding.
+
+    Returns
+    -------
+    string
+        The decoded text.
+    """
+
+    try:
+        return base64.b64decode(text.strip(), validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError):
+        raise ValueError("{!r} is not Base64-encoded UTF-8 text.".format(text))
+
+
+def base64_encode_stream(stream, chunk_size=ENCODE_CHUNK_SIZE):
+    """
+    Encodes a stream of bytes with Base64, one chunk at a time.
+    Chunks are read into one preallocated buffer, and encoded straight
+    from it, so memory use does not depend on the length of the stream.
+
+    Parameters
+    ----------
+    stream : file-like object
+        Stream of bytes, with readinto or read.
+    chunk_size : int
+        Number of bytes to encode at a time. A multiple of 3.
+
+    Returns
+    -------
+    generator of bytes
+        The Base64 encoding, one chunk at a time.
+    """
+
+    if chunk_size <= 0 or chunk_size % 3:
+        raise ValueError("Chunk size has to be a positive multiple of 3.")
+
+    view = memoryview(bytearray(chunk_size))
+    while True:
+        filled = _fill(stream, view)
+        if filled:
+            yield binascii.b2a_base64(view[:filled], newline=False)
+        if filled < chunk_size:
+            return
+
+
+def base64_decode_stream(stream, chunk_size=DECODE_CHUNK_SIZE):
+    """
+    Decodes a stream of Base64 with whitespace (such as line breaks),
+    one chunk at a time. Memory use does not depend on the length of
+    the stream. Invalid input raises ValueError once it is reached, so
+    the output decoded until then may have been yielded already.
+
+    Parameters
+    ----------
+    stream : file-like object
+        Stream of Base64, with readinto or read.
+    chunk_size : int
+        Number of bytes to read at a time. A multiple of 4.
+
+    Returns
+    -------
+    generator of bytes
+        The decoded bytes, one chunk at a time.
+    """
+
+    if chunk_size <= 0 or chunk_size % 4:
+        raise ValueError("Chunk size has to be a positive multiple of 4.")
+
+    view = memoryview(bytearray(chunk_size))
+    carry = b""
+    padded = False
+    while True:
+        filled = _fill(stream, view)
+        at_end = filled < chunk_size
+        data = carry + view[:filled].tobytes().translate(None, _WHITESPACE)
+
+        # Only whole groups of 4 characters are decoded before the end.
+        usable = len(data) if at_end else len(data) - len(data) % 4
+        portion, carry = data[:usable], data[usable:]
+        if portion:
+            if padded:
+                raise ValueError("Base64 continues after padding.")
+            padded = _check_base64(portion)
+            yield binascii.a2b_base64(portion)
+        if at_end:
+            return
+
+
+def caesar(text, shift=3):
+    """
+    Shifts the letters of a text with the Caesar cipher. Characters
+    other than the letters of the English alphabet are kept as is.
+    Negative shifts reverse the cipher.
+
+    Parameters
+    ----------
+    text : string
+        The text to shift.
+    shift : int
+        Number of positions to shift the letters by.
+
+    Returns
+    -------
+    string
+        The shifted text.
+    """
+
+    if not isinstance(shift, int) or isinstance(shift, bool):
+        raise ValueError("Shift has to be an integer.")
+    return text.translate(_caesar_table(shift % 26))
+
+
+@lru_cache(maxsize=26)
+def _caesar_table(shift):
+    lower = string.ascii_lowercase
+    upper = string.ascii_uppercase
+    return str.maketrans(lower + upper, lower[shift:] + lower[:shift] + upper[shift:] + upper[:shift])
+
+
+def _fill(stream, view):
+    # Reads from a stream until the view is full or the stream ends.
+    readinto = getattr(stream, "readinto", None)
+    filled = 0
+    while filled < len(view):
+        if readinto is not None:
+            count = readinto(view[filled:])
+        else:
+            data = stream.read(len(view) - filled)
+            count = len(data)
+            view[filled:filled + count] = data
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def _check_base64(portion):
+    # Checks a portion of Base64 without whitespace, and returns whether
+    # it ends with padding. Padding is only allowed at the very end.
+    if len(portion) % 4:
+        raise ValueError("Base64 has incorrect padding.")
+    stripped = portion.rstrip(b"=")
+    if len(portion) - len(stripped) > 2 or stripped.translate(None, _BASE64_ALPHABET):
+        raise ValueError("Input is not Base64.")
+    return len(stripped) < len(portion)
+
+
+def _format_small(value, base):
+    if value == 0:
+        return "0"
+    digits = []
+    while value:
+        value, remainder = divmod(value, base)
+        digits.append(DIGITS[remainder])
+    return "".join(reversed(digits))
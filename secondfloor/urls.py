@@ -4,6 +4,12 @@ from . import views
 
 app_name = 'secondfloor'
 urlpatterns = [
-    # path('general/', views.toolbox, name='toolbox_general'),
-    # path('settings/', views.toolbox_settings, name='toolbox_settings')
+    path('general/', views.toolbox_general, name='toolbox_general'),
+    # path('settings/', views.toolbox_settings, name='toolbox_settings'),
+    path('api/base/', views.convert_base, name='convert_base'),
+    path('api/base64/encode/', views.base64_encode, name='base64_encode'),
+    path('api/base64/decode/', views.base64_decode, name='base64_decode'),
+    path('api/base64/encode/stream/', views.base64_encode_stream, name='base64_encode_stream'),
+    path('api/base64/decode/stream/', views.base64_decode_stream, name='base64_decode_stream'),
+    path('api/caesar/', views.caesar, name='caesar')
 ]
@@ -0,0 +1,175 @@
+import io
+import itertools
+import json
+import os
+
+from django.shortcuts import render
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from secondfloor import toolbox
+
+# Maximum number of inputs in a batch.
+MAX_BATCH_SIZE = 10000
+
+# Results are streamed in chunks of about this many characters.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def toolbox_general(request):
+    """
+    General Toolbox page. Contains information about the tools
+    of the toolbox.
+    """
+
+    return render(request, "secondfloor/index.html", context = None)
+
+# The toolbox endpoints only transform their inputs, so they can be
+# scripted without a CSRF token.
+@csrf_exempt
+@require_POST
+def convert_base(request):
+    """
+    Converts a batch of integers from one base to another.
+    Expects a JSON body: {"inputs": [...], "from_base": 10, "to_base": 16}.
+    """
+
+    def conversion(batch):
+        from_base = _integer(batch, "from_base", 10)
+        to_base = _integer(batch, "to_base", 16)
+        # Zero is a number of every base; this validates the bases.
+        toolbox.convert_base("0", from_base, to_base)
+        return lambda number: toolbox.convert_base(number, from_base, to_base)
+
+    return _batch_response(request, conversion)
+
+@csrf_exempt
+@require_POST
+def base64_encode(request):
+    """
+    Encodes a batch of texts with Base64.
+    Expects a JSON body: {"inputs": [...]}.
+    """
+
+    return _batch_response(request, lambda batch: toolbox.base64_encode)
+
+@csrf_exempt
+@require_POST
+def base64_decode(request):
+    """
+    Decodes a batch of Base64-encoded texts.
+    Expects a JSON body: {"inputs": [...]}.
+    """
+
+    return _batch_response(request, lambda batch: toolbox.base64_decode)
+
+@csrf_exempt
+@require_POST
+def base64_encode_stream(request):
+    """
+    Encodes an uploaded file of any size with Base64, and streams the
+    encoding back as an attachment. The file is either the "file" field
+    of a multipart form, or the whole body of the request.
+    """
+
+    name, stream = _upload(request)
+    encoding = toolbox.base64_encode_stream(stream)
+    return _stream_attachment(encoding, "text/plain", name + ".b64")
+
+@csrf_exempt
+@require_POST
+def base64_decode_stream(request):
+    """
+    Decodes an uploaded Base64 file of any size, and streams the decoded
+    bytes back as an attachment. The file is either the "file" field of
+    a multipart form, or the whole body of the request.
+    """
+
+    name, stream = _upload(request)
+    decoding = toolbox.base64_decode_stream(stream)
+    # Invalid files are mostly noticed in the first chunk, while an error
+    # response can still be returned. Later errors abort the stream.
+    try:
+        first = next(decoding, b"")
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status = 400)
+    root, extension = os.path.splitext(name)
+    return _stream_attachment(itertools.chain([first], decoding), "application/octet-stream",
+                              root if extension == ".b64" else name + ".bin")
+
+@csrf_exempt
+@require_POST
+def caesar(request):
+    """
+    Shifts a batch of texts with the Caesar cipher.
+    Expects a JSON body: {"inputs": [...], "shift": 3}.
+    """
+
+    def conversion(batch):
+        shift = _integer(batch, "shift", 3)
+        return lambda text: toolbox.caesar(text, shift)
+
+    return _batch_response(request, conversion)
+
+def _integer(batch, name, default):
+    value = batch.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("'{}' has to be an integer.".format(name))
+    return value
+
+def _upload(request):
+    # Returns the name and the stream of an uploaded file, without
+    # reading it into memory. The raw body is read from the request
+    # itself, as request.body would hold all of it. Forms without
+    # a file give an empty stream.
+    if request.content_type != "multipart/form-data":
+        return "file", request
+    upload = request.FILES.get("file")
+    if upload is None:
+        return "file", io.BytesIO()
+    return os.path.basename(upload.name) or "file", upload
+
+def _stream_attachment(chunks, content_type, filename):
+    response = StreamingHttpResponse(chunks, content_type = content_type)
+    response["Content-Disposition"] = 'attachment; filename="{}"'.format(filename.replace('"', ""))
+    return response
+
+def _batch_response(request, make_conversion):
+    # Reads a batch of inputs from the JSON body of the request, and
+    # streams the results as {"results": [{"output": ...} or {"error": ...}, ...]},
+    # in the order of the inputs. Conversions of single inputs may fail
+    # without failing the whole batch.
+    try:
+        batch = json.loads(request.body)
+        if not isinstance(batch, dict):
+            raise ValueError("Expected a JSON object.")
+        inputs = batch["inputs"]
+        if not isinstance(inputs, list) or not all(isinstance(item, str) for item in inputs):
+            raise ValueError("'inputs' has to be a list of strings.")
+        if len(inputs) > MAX_BATCH_SIZE:
+            raise ValueError("Batches can have at most {} inputs.".format(MAX_BATCH_SIZE))
+        conversion = make_conversion(batch)
+    except (ValueError, KeyError, TypeError) as error:
+        if isinstance(error, KeyError):
+            error = "'inputs' is missing."
+        return JsonResponse({"error": str(error)}, status = 400)
+
+    return StreamingHttpResponse(_stream_results(conversion, inputs), content_type = "application/json")
+
+def _stream_results(conversion, inputs):
+    chunk = ['{"results": [']
+    size = 0
+    for index, item in enumerate(inputs):
+        try:
+            result = {"output": conversion(item)}
+        except ValueError as error:
+            result = {"error": str(error)}
+        encoded = ("," if index else "") + json.dumps(result)
+        chunk.append(encoded)
+        size += len(encoded)
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    chunk.append("]}")
+    yield "".join(chunk)
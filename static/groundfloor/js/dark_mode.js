@@ -1,7 +1,8 @@
 /**
  * @file
- * Provides the functions to switch between light and dark mode,
- * and remembers user choice via cookies.
+ * Provides the function to switch between light and dark mode,
+ * and remembers user choice via cookies. The theme of a page is
+ * chosen on the server, based on the same cookie.
  */
 
 /**
@@ -9,43 +10,6 @@
  * to remember user's choice.
  */
 function toggleDarkMode() {
-    var option = readCookie("darkmode");
-    var optionReverse = "true";
-    var stylesheet = document.getElementById("sitestyle");
-
-    var styleName = "/static/groundfloor/css/dark";
-    if (option === "true") {
-        optionReverse = "false";
-        styleName = "/static/groundfloor/css/light";
-    }
-
-    stylesheet.href = styleName + ".css";
-    createCookie("darkmode", optionReverse);
-    console.log("OPTION (SAVE): " + optionReverse);
+    var enabled = document.documentElement.classList.toggle("dark");
+    createCookie("darkmode", enabled ? "true" : "false");
 }
-
-/**
- * Initialization function for the web page, in terms of either
- * enabling or disabling "dark mode".
- */
-function initialize() {
-    var option = readCookie("darkmode");
-    console.log("OPTION (LOAD): " + option);
-
-    var head = document.head;
-    var link = document.createElement("link");
-    link.type = "text/css";
-    link.rel = "stylesheet";
-    link.id = "sitestyle";
-
-    var styleName = "/static/groundfloor/css/light";
-    if (option === "true") {
-        console.log("OPTION (LOAD - PASS): " + option);
-        styleName = "/static/groundfloor/css/dark";
-    }
-    console.log("STYLE: " + styleName);
-    link.href = styleName + ".css";
-    head.appendChild(link);
-}
-
-initialize();